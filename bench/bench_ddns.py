@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark ddns.py runs against the fake Cloudflare API and local IP sources.
+
+Each record count runs in its own process. Within a case, three runs go
+through the same zone: a first run that writes every record, a run with
+an unchanged IP (should write nothing) and a run after the IP changed.
+Each run is done batched and record by record, reporting wall time, API
+calls, CPU and peak RSS.
+
+    python bench/bench_ddns.py --records 10,100,1000 --api-delay 0.05
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import resource
+import tempfile
+import subprocess
+from collections import Counter
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DDNS_DIR = os.path.join(BENCH_DIR, '..', 'resiliency', 'ddns')
+sys.path.insert(0, os.path.join(DDNS_DIR, 'utils'))
+sys.path.insert(0, DDNS_DIR)
+
+
+def run_case(records, args):
+    """Run the updater scenarios for one record count and return their measurements"""
+    import requests
+    from ddns import CloudflareDDNS
+    from ip_discovery import IpDiscovery, parse_sources
+    from fake_cloudflare import FakeCloudflare
+    import stub_ip_sources
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.CRITICAL)
+    names = [f"host{i}.example.com" for i in range(records)]
+    # Two echo endpoints per public address so the quorum of 2 is met
+    sources = {
+        ip: ','.join(
+            f"http://127.0.0.1:{stub_ip_sources.serve_http(0, ip, '::1', delay).server_port}/"
+            for delay in (args.ip_delay, args.ip_delay * 2)
+        )
+        for ip in ('1.2.3.4', '5.6.7.8')
+    }
+
+    results = {}
+    for mode, batch_size in (('batch', 200), ('per_record', 0)):
+        api = FakeCloudflare(delay=args.api_delay)
+        for name in names:
+            api.add_record(name, '203.0.113.1')
+        server = api.serve()
+
+        with tempfile.TemporaryDirectory() as directory:
+            for run, ip in (('first', '1.2.3.4'), ('unchanged', '1.2.3.4'), ('changed', '5.6.7.8')):
+                ddns = CloudflareDDNS(
+                    'token', 'zone',
+                    max_workers=args.workers,
+                    index_file=os.path.join(directory, 'index.json'),
+                    state_file=os.path.join(directory, 'state.json'),
+                    ip_discovery={4: IpDiscovery(parse_sources(sources[ip], requests.Session()), 4, 2, 5)},
+                    batch_size=batch_size,
+                    base_url=f"http://127.0.0.1:{server.server_port}/client/v4"
+                )
+                api.calls.clear()
+                wall_started, cpu_started = time.perf_counter(), time.process_time()
+                ok = ddns.update_all(names, [])
+                results[f"{mode}_{run}"] = {
+                    'ok': ok,
+                    'wall_s': time.perf_counter() - wall_started,
+                    'cpu_s': time.process_time() - cpu_started,
+                    'api_calls': len(api.calls),
+                    'calls_by_endpoint': dict(Counter(f"{method} {endpoint}" for method, endpoint in api.calls)),
+                }
+                ddns.session.close()
+        server.shutdown()
+
+    return {
+        'records': records,
+        'runs': results,
+        'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DDNS updater benchmark against a fake Cloudflare API")
+    parser.add_argument('--records', default='10,100,1000', help="Comma-separated record counts, one case each")
+    parser.add_argument('--api-delay', type=float, default=0.05, help="Seconds the fake API takes per call")
+    parser.add_argument('--ip-delay', type=float, default=0.02, help="Seconds the fastest IP source takes")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--json', action='store_true', help="Print one JSON object per case")
+    parser.add_argument('--verbose', action='store_true', help="Show updater logs")
+    parser.add_argument('--case', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case is not None:
+        print(json.dumps(run_case(args.case, args)))
+        return
+
+    # One process per case so RSS doesn't leak between them
+    options = [
+        '--api-delay', str(args.api_delay), '--ip-delay', str(args.ip_delay), '--workers', str(args.workers)
+    ] + (['--verbose'] if args.verbose else [])
+    for records in (int(r) for r in args.records.split(',')):
+        output = subprocess.run(
+            [sys.executable, __file__, '--case', str(records), *options],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if args.json:
+            print(json.dumps(result))
+            continue
+        print(f"{records} records (peak RSS {result['rss_mb']:.1f} MB)")
+        for run, measured in result['runs'].items():
+            print(
+                f"  {run:>20}: {measured['wall_s'] * 1000:8.1f} ms wall, {measured['cpu_s'] * 1000:7.1f} ms CPU, "
+                f"{measured['api_calls']:5} API calls{'' if measured['ok'] else '  FAILED'}"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Benchmark the internet monitor against a simulated network on a virtual clock.
+
+Each host count runs in its own process (so peak RSS is per case) and
+simulates --hours of monitoring with --outages evenly spaced modem wedges
+and --upstream-outages ISP-side outages that no power cycle can fix.
+Reports check-cycle latency (virtual) and CPU cost (real), time to detect,
+time until the plug switched off, time until the monitor saw recovery, and
+CPU/RSS for the whole run.
+
+    python bench/bench_monitor.py --hosts 3,30,300 --hours 6 --outages 3
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import resource
+import statistics
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'resiliency', 'wifi-reboot'))
+sys.path.insert(0, BENCH_DIR)
+
+PLUG_IP = '192.0.2.10'
+
+
+def _first_after(times, start):
+    """First timestamp at or after start, or None"""
+    return next((t for t in times if t >= start), None)
+
+
+def _mean(values):
+    values = [v for v in values if v is not None]
+    return statistics.mean(values) if values else None
+
+
+def run_case(hosts, args):
+    """Simulate one host count and return its measurements"""
+    os.environ.update({
+        'PLUG_IP': PLUG_IP,
+        'TEST_HOSTS': ','.join(f"10.{i // 65536}.{i // 256 % 256}.{i % 256}" for i in range(hosts)),
+        'CHECK_INTERVAL_IN_SECONDS': str(args.check_interval),
+        'FAILURE_THRESHOLD': str(args.failure_threshold),
+        'RESTART_DELAY_IN_SECONDS': '10',
+        'RECOVERY_WAIT_IN_SECONDS': str(args.recovery_wait),
+        'DETECTION_MODE': args.detection,
+        'BURST_PROBES': str(args.burst_probes),
+        'PROBE_BACKEND': 'subprocess',
+        'SCHEDULE_MODE': args.schedule,
+        'MAX_CHECK_INTERVAL_IN_SECONDS': str(args.max_check_interval),
+        'FAILING_CHECK_INTERVAL_IN_SECONDS': str(args.failing_check_interval),
+        'RECOVERY_POLL_INTERVAL_IN_SECONDS': str(args.recovery_poll_interval),
+        'RESTART_BACKOFF_BASE_IN_SECONDS': str(args.restart_backoff),
+        'RESTART_BREAKER_THRESHOLD': str(args.breaker_threshold),
+        'RESTART_STATE_FILE': 'none',
+        'KASA_INVENTORY_FILE': 'none',
+    })
+    # Imported after the environment is set up, like the service does
+    import internet_monitor
+    import plug
+    import probers
+    import diagnosis
+    import rolling_stats
+    import kasa
+    import restarts
+    from fakes import FakeNetwork, FakeProber, FakeDiscover
+    from virtual_clock import VirtualClock, new_event_loop
+
+    logging.getLogger().setLevel(logging.DEBUG if args.verbose else logging.CRITICAL)
+    clock = VirtualClock()
+    clock.install(internet_monitor, plug, probers, diagnosis, rolling_stats, restarts)
+    loop = new_event_loop(clock)
+    asyncio.set_event_loop(loop)
+
+    network = FakeNetwork(clock, args.latency_ms, args.jitter_ms, args.loss, args.boot_seconds)
+    discover = FakeDiscover(network)
+    kasa.Discover = discover
+    monitor = internet_monitor.InternetMonitor()
+    monitor.prober = FakeProber(network)
+
+    duration = args.hours * 3600
+    outages = [(i + 0.5) * duration / args.outages for i in range(args.outages)]
+    for at in outages:
+        network.schedule_outage(at)
+    # At the start of each slot, the wedges sit in the middle of theirs
+    for i in range(args.upstream_outages):
+        network.schedule_upstream_outage(i * duration / args.upstream_outages, args.upstream_outage_minutes * 60)
+
+    # Time every check cycle that probed, every restart decision and every recovery the monitor noticed
+    cycles = []
+    triggers = []
+    recoveries = []
+    check_groups = monitor.check_groups
+    restart_group = monitor.restart_group
+    mark_up = monitor._mark_up
+
+    async def timed_check_groups():
+        started, cpu_started, cycle_id = clock.monotonic(), time.process_time(), monitor.cycle_id
+        await check_groups()
+        if monitor.cycle_id != cycle_id:
+            cycles.append((clock.monotonic() - started, time.process_time() - cpu_started))
+
+    async def recorded_restart_group(group):
+        triggers.append(clock.monotonic())
+        await restart_group(group)
+
+    def recorded_mark_up(group):
+        if group.restart_triggered_at is not None:
+            recoveries.append(clock.monotonic())
+        mark_up(group)
+
+    monitor.check_groups = timed_check_groups
+    monitor.restart_group = recorded_restart_group
+    monitor._mark_up = recorded_mark_up
+
+    wall_started, cpu_started = time.perf_counter(), time.process_time()
+    try:
+        loop.run_until_complete(asyncio.wait_for(monitor.monitor(), timeout=duration))
+    except asyncio.TimeoutError:
+        pass
+    wall = time.perf_counter() - wall_started
+    cpu = time.process_time() - cpu_started
+
+    detect, restart, recover, notice = [], [], [], []
+    for start in outages:
+        trigger = _first_after(triggers, start)
+        power_off = _first_after(network.power_offs, trigger) if trigger is not None else None
+        back = _first_after(network.recoveries, power_off) if power_off is not None else None
+        seen = _first_after(recoveries, back) if back is not None else None
+        detect.append(trigger - start if trigger is not None else None)
+        restart.append(power_off - start if power_off is not None else None)
+        recover.append(seen - start if seen is not None else None)
+        notice.append(seen - back if seen is not None else None)
+
+    latencies = sorted(latency for latency, _ in cycles)
+    return {
+        'hosts': hosts,
+        'cycles': len(cycles),
+        'probes': monitor.prober.probes,
+        'cycle_p50_ms': latencies[len(latencies) // 2] * 1000,
+        'cycle_p95_ms': latencies[int(len(latencies) * 0.95)] * 1000,
+        'cycle_cpu_us': statistics.mean(cpu_cost for _, cpu_cost in cycles) * 1e6,
+        'restarts': len(network.power_offs),
+        'missed_outages': sum(1 for value in detect if value is None),
+        'wasted_restarts': sum(1 for at in network.power_offs if network.upstream_down(at)),
+        'detect_s': _mean(detect),
+        'restart_s': _mean(restart),
+        'recover_s': _mean(recover),
+        'notice_s': _mean(notice),
+        'simulated_h': args.hours,
+        'wall_s': wall,
+        'cpu_s': cpu,
+        'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def _format(value, width):
+    if value is None:
+        return '-'.rjust(width)
+    if isinstance(value, float):
+        return f"{value:{width}.2f}"
+    return str(value).rjust(width)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Internet monitor benchmark on a virtual clock")
+    parser.add_argument('--hosts', default='3,30,300', help="Comma-separated host counts, one case each")
+    parser.add_argument('--hours', type=float, default=6, help="Simulated hours per case")
+    parser.add_argument('--outages', type=int, default=3, help="Modem wedges spread over the run")
+    parser.add_argument('--upstream-outages', type=int, default=0, help="ISP-side outages spread over the run")
+    parser.add_argument('--upstream-outage-minutes', type=float, default=120, help="Length of each upstream outage")
+    parser.add_argument('--check-interval', type=int, default=60)
+    parser.add_argument('--failure-threshold', type=int, default=3)
+    parser.add_argument('--recovery-wait', type=int, default=180)
+    parser.add_argument('--detection', default='threshold', choices=['threshold', 'sprt'])
+    parser.add_argument('--burst-probes', type=int, default=1)
+    parser.add_argument('--schedule', default='fixed', choices=['fixed', 'adaptive'])
+    parser.add_argument('--max-check-interval', type=int, default=180)
+    parser.add_argument('--failing-check-interval', type=int, default=10)
+    parser.add_argument('--recovery-poll-interval', type=int, default=5)
+    parser.add_argument('--restart-backoff', type=int, default=300, help="Hold-off after an ineffective restart, 0 disables")
+    parser.add_argument('--breaker-threshold', type=int, default=5, help="Ineffective restarts that pause restarts, 0 disables")
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--jitter-ms', type=float, default=5.0)
+    parser.add_argument('--loss', type=float, default=0.01, help="Background loss ratio per probe")
+    parser.add_argument('--boot-seconds', type=int, default=90, help="Modem boot time after power on")
+    parser.add_argument('--json', action='store_true', help="Print one JSON object per case")
+    parser.add_argument('--verbose', action='store_true', help="Show monitor logs")
+    parser.add_argument('--case', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case is not None:
+        print(json.dumps(run_case(args.case, args)))
+        return
+
+    # One process per case so RSS and module state don't leak between them
+    options = [
+        option for name, value in vars(args).items()
+        if name not in ('hosts', 'json', 'case', 'verbose')
+        for option in (f"--{name.replace('_', '-')}", str(value))
+    ] + (['--verbose'] if args.verbose else [])
+    results = []
+    for hosts in (int(h) for h in args.hosts.split(',')):
+        output = subprocess.run(
+            [sys.executable, __file__, '--case', str(hosts), *options],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    if args.json:
+        for result in results:
+            print(json.dumps(result))
+        return
+    # One column per case
+    for metric in results[0]:
+        print(f"{metric:>16}" + ''.join(_format(result[metric], 12) for result in results))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Benchmark one internet monitor process supervising many sites.
+
+Each site count runs in its own process: that many <site>.env configs are
+loaded through SITES_DIR handling, every site gets its own simulated
+network, modem and plug with --outages evenly spaced modem wedges, and all
+of them run on one virtual-clock event loop with metrics enabled. Reports
+detection across the sites, CPU per simulated site-hour, peak RSS in total
+and per site, and the size and cost of one scrape of the shared endpoint.
+
+    python bench/bench_sites.py --sites 1,10,100 --hours 6 --outages 2
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import statistics
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'resiliency', 'wifi-reboot'))
+sys.path.insert(0, BENCH_DIR)
+
+
+def _first_after(times, start):
+    """First timestamp at or after start, or None"""
+    return next((t for t in times if t >= start), None)
+
+
+def _mean(values):
+    values = [v for v in values if v is not None]
+    return statistics.mean(values) if values else None
+
+
+def _site_addresses(index, hosts):
+    """(test hosts, plug address) of the index-th simulated site"""
+    return [f"10.{index // 256}.{index % 256}.{host + 1}" for host in range(hosts)], f"172.16.{index // 256}.{index % 256}"
+
+
+def run_case(sites, args):
+    """Simulate one site count and return its measurements"""
+    # Shared settings in the main environment, like the service's .env
+    os.environ.update({
+        'CHECK_INTERVAL_IN_SECONDS': str(args.check_interval),
+        'FAILURE_THRESHOLD': str(args.failure_threshold),
+        'RESTART_DELAY_IN_SECONDS': '10',
+        'RECOVERY_WAIT_IN_SECONDS': str(args.recovery_wait),
+        'PROBE_BACKEND': 'subprocess',
+        'RESTART_STATE_FILE': 'none',
+        'KASA_INVENTORY_FILE': 'none',
+        'METRICS_FLUSH_INTERVAL_IN_SECONDS': '1',
+    })
+    # Imported after the environment is set up, like the service does
+    import internet_monitor
+    import plug
+    import probers
+    import diagnosis
+    import rolling_stats
+    import restarts
+    import exporter
+    import kasa
+    from sites import load_sites, run_sites
+    from fakes import FakeNetwork, FakeProber, FakeDiscover, SiteRouter
+    from virtual_clock import VirtualClock, new_event_loop
+
+    logging.getLogger().setLevel(logging.DEBUG if args.verbose else logging.CRITICAL)
+    clock = VirtualClock()
+    clock.install(internet_monitor, plug, probers, diagnosis, rolling_stats, restarts, exporter)
+    loop = new_event_loop(clock)
+    asyncio.set_event_loop(loop)
+
+    duration = args.hours * 3600
+    slot = duration / args.outages
+    router = SiteRouter()
+    networks = {}
+    outages = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for index in range(sites):
+            name = f"site{index:03d}"
+            hosts, plug_ip = _site_addresses(index, args.hosts)
+            with open(os.path.join(directory, f"{name}.env"), 'w') as f:
+                f.write(f"PLUG_IP={plug_ip}\nTEST_HOSTS={','.join(hosts)}\n")
+            network = FakeNetwork(clock, args.latency_ms, args.jitter_ms, args.loss, args.boot_seconds, seed=index + 1)
+            # Every site wedges once per slot, at its own point in the middle half of it
+            outages[name] = [(outage + 0.25 + (index * 0.618) % 1 / 2) * slot for outage in range(args.outages)]
+            for at in outages[name]:
+                network.schedule_outage(at)
+            router.add(network, hosts + [plug_ip])
+            networks[name] = network
+        configs = load_sites(directory)
+
+    kasa.Discover = FakeDiscover(router)
+    monitors = internet_monitor.create_site_monitors(configs, metrics_enabled=True)
+    prober = FakeProber(router)
+
+    # Record every restart decision and every recovery the monitors noticed, per site
+    triggers = {name: [] for name in monitors}
+    recoveries = {name: [] for name in monitors}
+
+    def instrument(name, monitor):
+        restart_group = monitor.restart_group
+        mark_up = monitor._mark_up
+
+        async def recorded_restart_group(group):
+            triggers[name].append(clock.monotonic())
+            await restart_group(group)
+
+        def recorded_mark_up(group):
+            if group.restart_triggered_at is not None:
+                recoveries[name].append(clock.monotonic())
+            mark_up(group)
+
+        monitor.restart_group = recorded_restart_group
+        monitor._mark_up = recorded_mark_up
+
+    async def broken_check_groups():
+        raise RuntimeError("simulated site failure")
+
+    broken = list(monitors)[:args.broken_sites]
+    for name, monitor in monitors.items():
+        monitor.prober = prober
+        instrument(name, monitor)
+        if name in broken:
+            monitor.check_groups = broken_check_groups
+
+    wall_started, cpu_started = time.perf_counter(), time.process_time()
+    try:
+        loop.run_until_complete(asyncio.wait_for(run_sites(monitors), timeout=duration))
+    except asyncio.TimeoutError:
+        pass
+    wall = time.perf_counter() - wall_started
+    cpu = time.process_time() - cpu_started
+
+    # Outages of the healthy sites, a broken one must not hold them up
+    detect, recover = [], []
+    for name, network in networks.items():
+        if name in broken:
+            continue
+        for start in outages[name]:
+            trigger = _first_after(triggers[name], start)
+            power_off = _first_after(network.power_offs, trigger) if trigger is not None else None
+            back = _first_after(network.recoveries, power_off) if power_off is not None else None
+            seen = _first_after(recoveries[name], back) if back is not None else None
+            detect.append(trigger - start if trigger is not None else None)
+            recover.append(seen - start if seen is not None else None)
+
+    metrics_exporter = next(iter(monitors.values())).metrics_exporter
+    scrape_started = time.perf_counter()
+    metrics = metrics_exporter.metrics()
+    scrape = time.perf_counter() - scrape_started
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {
+        'sites': sites,
+        'probes': prober.probes,
+        'restarts': sum(len(network.power_offs) for name, network in networks.items() if name not in broken),
+        'missed_outages': sum(1 for value in detect if value is None),
+        'detect_s': _mean(detect),
+        'recover_s': _mean(recover),
+        'series': sum(1 for line in metrics.decode().splitlines() if line and not line.startswith('#')),
+        'scrape_ms': scrape * 1000,
+        'simulated_h': args.hours,
+        'wall_s': wall,
+        'cpu_s': cpu,
+        'cpu_ms_per_site_h': cpu * 1000 / (sites * args.hours),
+        'rss_mb': rss_mb,
+        'rss_per_site_mb': rss_mb / sites,
+    }
+
+
+def _format(value, width):
+    if value is None:
+        return '-'.rjust(width)
+    if isinstance(value, float):
+        return f"{value:{width}.2f}"
+    return str(value).rjust(width)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-site internet monitor benchmark on a virtual clock")
+    parser.add_argument('--sites', default='1,10,100', help="Comma-separated site counts, one case each")
+    parser.add_argument('--hosts', type=int, default=3, help="Test hosts per site")
+    parser.add_argument('--hours', type=float, default=6, help="Simulated hours per case")
+    parser.add_argument('--outages', type=int, default=2, help="Modem wedges per site spread over the run")
+    parser.add_argument('--broken-sites', type=int, default=0, help="Sites whose checks raise on every cycle")
+    parser.add_argument('--check-interval', type=int, default=60)
+    parser.add_argument('--failure-threshold', type=int, default=3)
+    parser.add_argument('--recovery-wait', type=int, default=180)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--jitter-ms', type=float, default=5.0)
+    parser.add_argument('--loss', type=float, default=0.01, help="Background loss ratio per probe")
+    parser.add_argument('--boot-seconds', type=int, default=90, help="Modem boot time after power on")
+    parser.add_argument('--json', action='store_true', help="Print one JSON object per case")
+    parser.add_argument('--verbose', action='store_true', help="Show monitor logs")
+    parser.add_argument('--case', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case is not None:
+        print(json.dumps(run_case(args.case, args)))
+        return
+
+    # One process per case so RSS and the metrics registry don't leak between them
+    options = [
+        option for name, value in vars(args).items()
+        if name not in ('sites', 'json', 'case', 'verbose')
+        for option in (f"--{name.replace('_', '-')}", str(value))
+    ] + (['--verbose'] if args.verbose else [])
+    results = []
+    for sites in (int(s) for s in args.sites.split(',')):
+        output = subprocess.run(
+            [sys.executable, __file__, '--case', str(sites), *options],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    if args.json:
+        for result in results:
+            print(json.dumps(result))
+        return
+    # One column per case
+    for metric in results[0]:
+        print(f"{metric:>18}" + ''.join(_format(result[metric], 12) for result in results))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Benchmark cold start of the systemd entry points under -X importtime.
+
+Each case starts fresh interpreters (--repeat of them) and reports median
+wall time, median time spent importing modules the bare interpreter
+doesn't, peak RSS and which heavy dependencies got imported:
+
+    ddns_import      import ddns
+    monitor_import   import internet_monitor
+    ddns_unchanged   python ddns.py when the public address hasn't moved
+    ddns_forced      python ddns.py --force, the full reconcile path
+
+The DDNS runs go against the fake Cloudflare API and stub IP sources.
+--check compares the results with startup_budget.json and exits non-zero
+on a regression.
+
+    python bench/bench_startup.py --repeat 10 --check
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DDNS_DIR = os.path.join(BENCH_DIR, '..', 'resiliency', 'ddns')
+MONITOR_DIR = os.path.join(BENCH_DIR, '..', 'resiliency', 'wifi-reboot')
+sys.path.insert(0, os.path.join(DDNS_DIR, 'utils'))
+
+BUDGET_FILE = os.path.join(BENCH_DIR, 'startup_budget.json')
+CASES = ('ddns_import', 'monitor_import', 'ddns_unchanged', 'ddns_forced')
+# Dependencies worth deferring, reported when a case imports them
+HEAVY_MODULES = ('requests', 'urllib3', 'dotenv', 'kasa', 'aiohttp', 'prometheus_client')
+
+
+def _start(argv, cwd, env=None):
+    """
+    One cold interpreter under -X importtime.
+
+    Returns wall seconds, its peak RSS in MB and {module: cumulative us}
+    of its top-level imports.
+    """
+    with tempfile.TemporaryFile('w+') as stderr:
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, '-X', 'importtime', *argv], cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=stderr
+        )
+        # wait4 rather than wait() for this child's own rusage
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - started
+        process.returncode = os.waitstatus_to_exitcode(status)
+        stderr.seek(0)
+        output = stderr.read()
+    if process.returncode != 0:
+        raise RuntimeError(f"{' '.join(argv)} exited with {process.returncode}:\n{output[-2000:]}")
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented two spaces per level and already counted by their parent
+        modules[name.strip()] = int(cumulative) if name[1:2] != ' ' else 0
+    return wall, usage.ru_maxrss / 1024, modules
+
+
+def _ddns_env(directory, records):
+    """Fake Cloudflare and stub IP sources for ddns.py runs, returns (env, api)"""
+    from fake_cloudflare import FakeCloudflare
+    import stub_ip_sources
+
+    api = FakeCloudflare()
+    names = [f"host{i}.example.com" for i in range(records)]
+    for name in names:
+        api.add_record(name, '203.0.113.1')
+    server = api.serve()
+    # HTTP answers first, the fast path must still pick the DNS source and skip the HTTP stack
+    http = stub_ip_sources.serve_http(0, '1.2.3.4', '::1')
+    dns = stub_ip_sources.serve_dns(0, '1.2.3.4', '::1', delay=0.05)
+    env = {
+        **os.environ,
+        'CLOUDFLARE_API_TOKEN': 'token',
+        'CLOUDFLARE_ZONE_ID': 'zone',
+        'CLOUDFLARE_API_URL': f"http://127.0.0.1:{server.server_port}/client/v4",
+        'DDNS_RECORDS': ','.join(names),
+        'DDNS_NON_PROXY_RECORDS': '',
+        'DDNS_IP_SOURCES': f"http://127.0.0.1:{http.server_port}/,dns:127.0.0.1:{dns.getsockname()[1]}/myip.opendns.com",
+        'DDNS_IP_QUORUM': '2',
+        'DDNS_INDEX_FILE': os.path.join(directory, 'index.json'),
+        'DDNS_STATE_FILE': os.path.join(directory, 'state.json'),
+    }
+    return env, api
+
+
+def run_case(case, args):
+    """Start the case --repeat times and return its measurements"""
+    _, _, bare = _start(['-c', 'pass'], BENCH_DIR)
+    api = None
+    with tempfile.TemporaryDirectory() as directory:
+        if case == 'ddns_import':
+            argv, cwd, env = ['-c', 'import ddns'], DDNS_DIR, None
+        elif case == 'monitor_import':
+            argv, cwd, env = ['-c', 'import internet_monitor'], MONITOR_DIR, None
+        else:
+            env, api = _ddns_env(directory, args.records)
+            argv, cwd = ['ddns.py'] + (['--force'] if case == 'ddns_forced' else []), DDNS_DIR
+            # Publish everything once so the measured runs find nothing to change
+            _start(['ddns.py'], cwd, env)
+            api.calls.clear()
+
+        walls, rss, imports, imported = [], [], [], set()
+        for _ in range(args.repeat):
+            wall, peak_rss, modules = _start(argv, cwd, env)
+            walls.append(wall)
+            rss.append(peak_rss)
+            imports.append(sum(us for name, us in modules.items() if name not in bare) / 1000)
+            imported.update(modules)
+
+    return {
+        'case': case,
+        'wall_ms': statistics.median(walls) * 1000,
+        'import_ms': statistics.median(imports),
+        'rss_mb': max(rss),
+        'heavy': [name for name in HEAVY_MODULES if name in imported],
+        'api_calls': None if api is None else len(api.calls) / args.repeat,
+    }
+
+
+def check(results):
+    """Budget violations of the results, one message each"""
+    with open(BUDGET_FILE) as f:
+        budget = json.load(f)
+    violations = []
+    for result in results:
+        limits = budget.get(result['case'], {})
+        for metric in ('wall_ms', 'import_ms', 'rss_mb', 'api_calls'):
+            if metric in limits and result[metric] is not None and result[metric] > limits[metric]:
+                violations.append(f"{result['case']}: {metric} {result[metric]:.1f} over budget {limits[metric]}")
+        for name in set(limits.get('forbid', [])) & set(result['heavy']):
+            violations.append(f"{result['case']}: imports {name}")
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start benchmark of ddns.py and internet_monitor.py")
+    parser.add_argument('--cases', default=','.join(CASES), help="Comma-separated cases to run")
+    parser.add_argument('--repeat', type=int, default=10, help="Cold starts per case")
+    parser.add_argument('--records', type=int, default=10, help="DNS records published by the DDNS cases")
+    parser.add_argument('--check', action='store_true', help=f"Fail when over {os.path.basename(BUDGET_FILE)}")
+    parser.add_argument('--json', action='store_true', help="Print one JSON object per case")
+    parser.add_argument('--case', choices=CASES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case is not None:
+        print(json.dumps(run_case(args.case, args)))
+        return
+
+    # One process per case, like the other benchmarks
+    results = []
+    for case in args.cases.split(','):
+        output = subprocess.run(
+            [sys.executable, __file__, '--case', case, '--repeat', str(args.repeat), '--records', str(args.records)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    for result in results:
+        if args.json:
+            print(json.dumps(result))
+            continue
+        api_calls = '' if result['api_calls'] is None else f", {result['api_calls']:.0f} API calls"
+        print(
+            f"{result['case']:>16}: {result['wall_ms']:7.1f} ms wall, {result['import_ms']:7.1f} ms imports, "
+            f"{result['rss_mb']:5.1f} MB RSS{api_calls}  [{', '.join(result['heavy']) or 'no heavy imports'}]"
+        )
+
+    if args.check:
+        violations = check(results)
+        for violation in violations:
+            print(f"Over budget: {violation}", file=sys.stderr)
+        sys.exit(1 if violations else 0)
+
+
+if __name__ == '__main__':
+    main()
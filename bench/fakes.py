@@ -0,0 +1,167 @@
+"""
+Local stand-ins for the monitor's outside world
+A simulated network answering ICMP probes with injected latency and loss, and Kasa plugs that power the simulated modem, optionally one network per site.
+"""
+
+import random
+import asyncio
+
+from probers import Prober, ProbeResult
+
+
+class FakeNetwork:
+    """
+    Echo responder for every host behind one modem.
+
+    Replies take latency_ms +/- jitter_ms and are dropped with loss_ratio.
+    A wedged outage starts at a scheduled time and only clears once the
+    modem has been power cycled and has finished booting. An upstream
+    outage (the ISP side) lasts a fixed time whatever the plug does.
+    """
+
+    def __init__(self, clock, latency_ms=20.0, jitter_ms=5.0, loss_ratio=0.0, boot_seconds=90, seed=1):
+        self.clock = clock
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.loss_ratio = loss_ratio
+        self.boot_seconds = boot_seconds
+        self.random = random.Random(seed)
+        self.outage_starts = []
+        self.outage_started = None
+        self.upstream_outages = []
+        self.modem_on = True
+        self.back_at = None
+
+        # Event timestamps for the benchmark report
+        self.power_offs = []
+        self.recoveries = []
+
+    def schedule_outage(self, at):
+        """Wedge the modem at a virtual monotonic time"""
+        self.outage_starts.append(at)
+        self.outage_starts.sort()
+
+    def schedule_upstream_outage(self, at, duration):
+        """Cut the line upstream of the modem from at for duration seconds"""
+        self.upstream_outages.append((at, at + duration))
+
+    def upstream_down(self, at=None):
+        """Whether an upstream outage covers the time (default now)"""
+        at = self.clock.monotonic() if at is None else at
+        return any(start <= at < end for start, end in self.upstream_outages)
+
+    def network_for(self, address):
+        """Network an address is behind, this one for every address"""
+        return self
+
+    def up(self):
+        """Whether replies currently make it back"""
+        now = self.clock.monotonic()
+        if self.back_at is not None and now >= self.back_at:
+            self.recoveries.append(self.back_at)
+            self.back_at = None
+            self.outage_started = None
+        if self.outage_starts and now >= self.outage_starts[0] and self.outage_started is None and self.modem_on:
+            self.outage_started = self.outage_starts.pop(0)
+        return self.modem_on and self.outage_started is None and not self.upstream_down(now)
+
+    def power(self, on):
+        """Modem plug switched; booting clears a wedged outage"""
+        now = self.clock.monotonic()
+        if not on:
+            self.power_offs.append(now)
+            if self.outage_started is None:
+                self.outage_started = now
+        elif not self.modem_on:
+            self.back_at = now + self.boot_seconds
+        self.modem_on = on
+
+    async def echo(self, host, timeout):
+        """One probe: (success, RTT in ms) after the simulated delay"""
+        if not self.up() or self.random.random() < self.loss_ratio:
+            await asyncio.sleep(timeout)
+            return False, None
+        rtt_ms = max(0.1, self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms))
+        if rtt_ms / 1000 > timeout:
+            await asyncio.sleep(timeout)
+            return False, None
+        await asyncio.sleep(rtt_ms / 1000)
+        return True, rtt_ms
+
+
+class SiteRouter:
+    """
+    Several FakeNetworks behind one prober and one FakeDiscover.
+
+    Each site's hosts and plug addresses are routed to that site's network,
+    like a monitor reaching many sites over their own links.
+    """
+
+    def __init__(self):
+        self.networks = {}
+
+    def add(self, network, addresses):
+        """Route addresses to network"""
+        for address in addresses:
+            self.networks[address] = network
+
+    def network_for(self, address):
+        """Network of the site that owns the address"""
+        return self.networks[address]
+
+    async def echo(self, host, timeout):
+        return await self.networks[host].echo(host, timeout)
+
+
+class FakeProber(Prober):
+    """Prober answered by a FakeNetwork instead of real ICMP"""
+
+    def __init__(self, network):
+        self.network = network
+        self.probes = 0
+
+    async def probe(self, host, timeout):
+        self.probes += 1
+        success, rtt_ms = await self.network.echo(host, timeout)
+        return ProbeResult(host, success, rtt_ms, None if success else "timeout")
+
+
+class FakeKasaDevice:
+    """Kasa plug whose relay powers the simulated modem"""
+
+    def __init__(self, network, plug_ip, command_seconds=0.3):
+        self.network = network
+        self.alias = f"fake-plug-{plug_ip}"
+        self.model = "HS103(FAKE)"
+        self.command_seconds = command_seconds
+        self.is_on = True
+
+    async def update(self):
+        await asyncio.sleep(self.command_seconds)
+
+    async def turn_off(self):
+        await asyncio.sleep(self.command_seconds)
+        self.is_on = False
+        self.network.power(False)
+
+    async def turn_on(self):
+        await asyncio.sleep(self.command_seconds)
+        self.is_on = True
+        self.network.power(True)
+
+    async def disconnect(self):
+        pass
+
+
+class FakeDiscover:
+    """Replacement for kasa.Discover, discovery costs discovery_seconds of virtual time"""
+
+    def __init__(self, network, discovery_seconds=2.0):
+        self.network = network
+        self.discovery_seconds = discovery_seconds
+        self.discoveries = 0
+
+    async def discover_single(self, host, **kwargs):
+        self.discoveries += 1
+        await asyncio.sleep(self.discovery_seconds)
+        return FakeKasaDevice(self.network.network_for(host), host)
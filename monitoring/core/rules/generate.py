@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Generate the wifi-reboot recording rules
+Writes wifi-reboot.rules.yml next to this script, one rule per expression and window so dashboards read a precomputed series.
+
+    python generate.py          # rewrite the rules file
+    python generate.py --check  # exit 1 if the committed file is out of date
+"""
+
+import os
+import sys
+import argparse
+
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'wifi-reboot.rules.yml')
+
+# Every rule keeps the monitor's site label, absent for a single-site monitor
+# Short windows are cheap and feed current-state panels, long ones are evaluated less often
+FAST_WINDOWS = ['5m', '1h']
+SLOW_WINDOWS = ['1d', '7d']
+SLOW_INTERVAL = '5m'
+
+QUANTILES = [0.5, 0.95, 0.99]
+
+
+def ratio(good, bad, by, window):
+    """good / (good + bad) of two counters' rates"""
+    good_rate = f"sum by ({by}) (rate({good}[{window}]))"
+    bad_rate = f"sum by ({by}) (rate({bad}[{window}]))"
+    return f"{good_rate} / ({good_rate} + {bad_rate})"
+
+
+def window_rules(window):
+    """(record, expr) pairs evaluated over one window"""
+    rules = [
+        (f"job:internet_up:ratio_rate{window}", ratio('internet_up_total', 'internet_down_total', 'job, site', window)),
+        (f"job_host:ping_success:ratio_rate{window}", ratio('ping_success_total', 'ping_failure_total', 'job, site, host', window)),
+    ]
+    if window != '5m':
+        rules += [
+            (f"job:modem_restart:increase{window}", f"sum by (job, site) (increase(modem_restart_total[{window}]))"),
+            (f"job_device:device_restart:increase{window}", f"sum by (job, site, device) (increase(device_restart_total[{window}]))"),
+            (f"job:internet_down:increase{window}", f"sum by (job, site) (increase(internet_down_total[{window}]))"),
+        ]
+    return rules
+
+
+def latency_rules():
+    """Per-host RTT quantiles and mean over 5 minutes"""
+    rules = [
+        (
+            f"job_host:ping_rtt_seconds:p{round(quantile * 100)}_rate5m",
+            f"histogram_quantile({quantile}, sum by (job, site, host, le) (rate(ping_rtt_seconds_bucket[5m])))"
+        )
+        for quantile in QUANTILES
+    ]
+    rules.append((
+        "job_host:ping_rtt_seconds:mean_rate5m",
+        "sum by (job, site, host) (rate(ping_rtt_seconds_sum[5m])) / sum by (job, site, host) (rate(ping_rtt_seconds_count[5m]))"
+    ))
+    return rules
+
+
+def render():
+    """Rules file contents"""
+    groups = [
+        ('wifi-reboot', None, [rule for window in FAST_WINDOWS for rule in window_rules(window)] + latency_rules()),
+        ('wifi-reboot-long', SLOW_INTERVAL, [rule for window in SLOW_WINDOWS for rule in window_rules(window)]),
+    ]
+    lines = [
+        '# Generated by generate.py, edit that and rerun it instead of changing this file',
+        'groups:',
+    ]
+    for name, interval, rules in groups:
+        lines.append(f"  - name: {name}")
+        if interval:
+            lines.append(f"    interval: {interval}")
+        lines.append('    rules:')
+        for record, expr in rules:
+            lines.append(f"      - record: {record}")
+            lines.append(f"        expr: {expr}")
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the wifi-reboot recording rules")
+    parser.add_argument('--check', action='store_true', help="Only check that the rules file is up to date")
+    args = parser.parse_args()
+
+    content = render()
+    if args.check:
+        try:
+            with open(RULES_FILE) as f:
+                current = f.read()
+        except OSError:
+            current = None
+        if current != content:
+            print(f"{RULES_FILE} is out of date, run generate.py")
+            sys.exit(1)
+        print(f"{RULES_FILE} is up to date")
+        return
+
+    with open(RULES_FILE, 'w') as f:
+        f.write(content)
+    print(f"Wrote {content.count('- record:')} recording rules to {RULES_FILE}")
+
+
+if __name__ == '__main__':
+    main()
@@ -9,5 +9,12 @@ fi
 sudo ufw allow ${GRAFANA_PORT:-3000}  # Grafana
 sudo ufw allow ${PROMETHEUS_PORT:-9090}  # Prometheus
 
+# Check the config and rules before deploying them
+docker compose run --rm --no-deps --entrypoint promtool prometheus check config /etc/prometheus/prometheus.yml || exit 1
+docker compose run --rm --no-deps --entrypoint promtool prometheus test rules /etc/prometheus/rules/tests/wifi-reboot.test.yml || exit 1
+
 # Start monitoring services
 docker compose up -d
+
+# Pick up rule changes in a container that was already running
+curl -s -X POST http://localhost:${PROMETHEUS_PORT:-9090}/-/reload || true
@@ -0,0 +1,136 @@
+"""
+Resident mode for the DDNS updater
+Polls cheaply on a timer and republishes right away on netlink address changes, signals or a local socket notification.
+"""
+
+import os
+import time
+import signal
+import socket
+import struct
+import logging
+import threading
+
+# Multicast groups and message types from linux/rtnetlink.h
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+RTM_NEWLINK = 16
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+NLMSG_HEADER = struct.Struct("=LHHLL")
+
+
+class DdnsDaemon:
+    """Keep records published from one long-lived process"""
+
+    def __init__(self, ddns, records, non_proxy_records=None, poll_interval=60, settle_seconds=2,
+                 trigger_socket=None, watch_netlink=True):
+        self.ddns = ddns
+        self.records = records
+        self.non_proxy_records = non_proxy_records
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.trigger_socket = trigger_socket
+        self.watch_netlink = watch_netlink
+
+        # Set from signal handlers and listener threads, so no locks here
+        self.wakeup = threading.Event()
+        self.reasons = set()
+        self.force = False
+        self.stopping = False
+
+    def trigger(self, reason, force=False):
+        """Ask for a full update as soon as the loop wakes up"""
+        self.reasons.add(reason)
+        self.force = self.force or force
+        self.wakeup.set()
+
+    def stop(self, *_):
+        """Leave the loop after the current update"""
+        self.stopping = True
+        self.wakeup.set()
+
+    def _watch_netlink(self):
+        """Background thread: trigger on interface address and link changes"""
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+        except OSError as e:
+            logging.warning(f"Netlink watch unavailable, relying on polling: {e}")
+            return
+        logging.info("Watching netlink for address changes")
+        while True:
+            data = sock.recv(65536)
+            offset = 0
+            while offset + NLMSG_HEADER.size <= len(data):
+                length, message_type, _, _, _ = NLMSG_HEADER.unpack_from(data, offset)
+                if message_type in (RTM_NEWADDR, RTM_DELADDR, RTM_NEWLINK):
+                    self.trigger("netlink")
+                if length < NLMSG_HEADER.size:
+                    break
+                # Messages are padded to 4 bytes
+                offset += (length + 3) & ~3
+
+    def _listen(self):
+        """Background thread: trigger on datagrams sent to the local trigger socket"""
+        try:
+            if os.path.exists(self.trigger_socket):
+                os.remove(self.trigger_socket)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(self.trigger_socket)
+            # Only the service's user and group may ask for an update, e.g. the internet monitor
+            os.chmod(self.trigger_socket, 0o660)
+        except OSError as e:
+            logging.warning(f"Trigger socket {self.trigger_socket} unavailable: {e}")
+            return
+        logging.info(f"Listening for update triggers on {self.trigger_socket}")
+        while True:
+            message = sock.recv(256).decode(errors="replace").strip()
+            self.trigger(f"notify: {message or 'update'}")
+
+    def run(self):
+        """Update on startup, then on every trigger or poll until SIGTERM/SIGINT"""
+        signal.signal(signal.SIGUSR1, lambda *_: self.trigger("SIGUSR1"))
+        signal.signal(signal.SIGHUP, lambda *_: self.trigger("SIGHUP", force=True))
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        if self.watch_netlink:
+            threading.Thread(target=self._watch_netlink, daemon=True).start()
+        if self.trigger_socket:
+            threading.Thread(target=self._listen, daemon=True).start()
+
+        logging.info(f"DDNS daemon started, polling every {self.poll_interval}s")
+        self.trigger("startup")
+        delay = self.poll_interval
+        while True:
+            triggered = self.wakeup.wait(delay)
+            if self.stopping:
+                break
+            if triggered:
+                # Address changes arrive in bursts, let them settle into one update
+                time.sleep(self.settle_seconds)
+            self.wakeup.clear()
+            reasons, self.reasons = self.reasons, set()
+            force, self.force = self.force, False
+
+            if self._update(reasons, force):
+                delay = self.poll_interval
+            else:
+                # Right after an outage the sources may not agree yet, so retry sooner
+                delay = min(self.poll_interval, 10)
+                self.force = self.force or force
+        logging.info("DDNS daemon stopped")
+
+    def _update(self, reasons, force):
+        """One poll or triggered update, False when it should be retried soon"""
+        try:
+            # Cheap poll: only the fastest source is asked whether the published addresses still hold
+            if not reasons and not force and self.ddns.unchanged(self.records, self.non_proxy_records):
+                return True
+            logging.info(f"Updating records ({', '.join(sorted(reasons)) or 'poll saw a new address'})")
+            return self.ddns.update_all(self.records, self.non_proxy_records, force=force)
+        except Exception as e:
+            # Cloudflare or the network being down must not take the daemon with it
+            logging.error(f"Update failed: {e}")
+            return False
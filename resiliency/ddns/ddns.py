@@ -1,84 +1,223 @@
 #!/usr/bin/env python3
 """
 Dynamic DNS updater for Cloudflare
-Updates multiple A records when home IP changes
+Updates multiple A (and optionally AAAA) records when home IP changes
 """
 
 import os
 import sys
+import json
+import time
 import logging
-import requests
+import ipaddress
+import threading
 import argparse
-from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+
+# requests, dotenv and the daemon are imported where first needed, a run that finds nothing to do never loads them
+from ip_discovery import DEFAULT_SOURCES, RECORD_TYPES, IpDiscovery, LazySession, parse_sources
+
+RECORD_TTL = 300
 
 class CloudflareDDNS:
-    def __init__(self, api_token, zone_id):
+    def __init__(self, api_token, zone_id, max_workers=4, timeout=10, retries=3,
+                 index_file=".ddns-index.json", index_max_age=3600,
+                 state_file=".ddns-state.json", reconcile_interval=86400, ip_discovery=None,
+                 batch_size=200, base_url="https://api.cloudflare.com/client/v4"):
         self.api_token = api_token
         self.zone_id = zone_id
-        self.base_url = "https://api.cloudflare.com/client/v4"
+        self.base_url = base_url
         self.headers = {
             "Authorization": f"Bearer {api_token}",
             "Content-Type": "application/json"
         }
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.retries = retries
+        
+        # API session, built on first use so runs without API calls don't import requests
+        self._session = None
+        self.session_lock = threading.Lock()
+        
+        # Zone-wide name -> record index, persisted between runs
+        self.index_file = index_file
+        self.index_max_age = index_max_age
+        self.index = None
+        self.index_refreshed = False
+        self.index_dirty = False
+        self.index_lock = threading.RLock()
+        
+        # Last published IP and record state, so unchanged runs make no writes
+        self.state_file = state_file
+        self.reconcile_interval = reconcile_interval
+        
+        # Changes per batch call (Cloudflare allows 200 on free plans), 0 writes record by record
+        self.batch_size = batch_size
+        self.batch_supported = batch_size > 0
+        
+        # Address family -> IpDiscovery; sources get their own session so the API token never leaves Cloudflare
+        self.ip_discovery = ip_discovery or {
+            4: IpDiscovery(parse_sources(DEFAULT_SOURCES[4], LazySession()), 4, timeout=timeout)
+        }
+    
+    @property
+    def session(self):
+        """One pooled keep-alive session for every API call; POST isn't retried to avoid duplicate records"""
+        with self.session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+                
+                retry = Retry(
+                    total=self.retries,
+                    backoff_factor=0.5,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    allowed_methods=frozenset({"GET", "PUT", "PATCH", "DELETE"})
+                )
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers, max_retries=retry)
+                session = requests.Session()
+                session.headers.update(self.headers)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+            return self._session
         
-    def get_public_ip(self):
-        """Get current public IP address"""
+    def get_public_ip(self, family=4):
+        """Get current public IP address, confirmed by a quorum of sources"""
         try:
-            response = requests.get("https://ipv4.icanhazip.com", timeout=10)
-            return response.text.strip()
+            return self.ip_discovery[family].discover()
         except Exception as e:
-            logging.error(f"Failed to get public IP: {e}")
+            logging.error(f"Failed to get public IPv{family}: {e}")
             return None
     
-    def get_record_id(self, record_name):
-        """Get DNS record ID for given name"""
-        try:
-            response = requests.get(
+    def get_public_ips(self):
+        """Record type -> current public address for every configured family"""
+        ips = {}
+        for family in sorted(self.ip_discovery):
+            ip = self.get_public_ip(family)
+            if ip:
+                ips[RECORD_TYPES[family]] = ip
+        return ips
+    
+    def fetch_index(self):
+        """Fetch every DNS record in the zone, one page at a time"""
+        index = {}
+        page = 1
+        while True:
+            response = self.session.get(
                 f"{self.base_url}/zones/{self.zone_id}/dns_records",
-                headers=self.headers,
-                params={"name": record_name, "type": "A"}
+                params={"page": page, "per_page": 1000},
+                timeout=self.timeout
             )
             data = response.json()
+            if not data["success"]:
+                raise RuntimeError(f"Failed to list DNS records: {data}")
+            for record in data["result"]:
+                index.setdefault(record["name"], {})[record["type"]] = _index_entry(record)
+            info = data.get("result_info") or {}
+            if page >= info.get("total_pages", 1):
+                break
+            page += 1
+        logging.info(f"Indexed {sum(len(types) for types in index.values())} DNS records")
+        return index
+    
+    def load_index(self, refresh=False):
+        """Load the record index from the cache file, fetching it from the API when stale or missing"""
+        with self.index_lock:
+            if not refresh and self.index is not None:
+                return self.index
+            if not refresh and os.path.exists(self.index_file):
+                try:
+                    with open(self.index_file) as f:
+                        cache = json.load(f)
+                    if cache["zone_id"] == self.zone_id and time.time() - cache["fetched_at"] < self.index_max_age:
+                        self.index = cache["records"]
+                        return self.index
+                except (OSError, ValueError, KeyError) as e:
+                    logging.warning(f"Ignoring unreadable record index {self.index_file}: {e}")
             
-            if data["success"] and data["result"]:
-                return data["result"][0]["id"]
-            return None
+            self.index = self.fetch_index()
+            self.index_refreshed = True
+            self._save_index()
+            return self.index
+    
+    def save_index(self):
+        """Write the record index if records were written since it was last saved"""
+        with self.index_lock:
+            if self.index_dirty:
+                self._save_index()
+    
+    def _save_index(self):
+        """Write the record index to the cache file"""
+        self.index_dirty = False
+        try:
+            with open(self.index_file + ".tmp", "w") as f:
+                json.dump({"zone_id": self.zone_id, "fetched_at": time.time(), "records": self.index}, f)
+            os.replace(self.index_file + ".tmp", self.index_file)
+        except OSError as e:
+            logging.warning(f"Failed to save record index {self.index_file}: {e}")
+    
+    def _refresh_index(self):
+        """Refetch a stale index, at most once per run"""
+        with self.index_lock:
+            if self.index_refreshed:
+                return False
+            logging.info("Record index is stale, refreshing")
+            self.load_index(refresh=True)
+            return True
+    
+    def _index_record(self, record):
+        """Add or update one API record in the index, saved by save_index() once the run's writes are done"""
+        with self.index_lock:
+            self.index.setdefault(record["name"], {})[record["type"]] = _index_entry(record)
+            self.index_dirty = True
+    
+    def get_record_id(self, record_name, record_type="A"):
+        """Get DNS record ID for given name"""
+        try:
+            entry = self.load_index().get(record_name, {}).get(record_type)
+            if entry is None and self._refresh_index():
+                entry = self.index.get(record_name, {}).get(record_type)
+            return entry["id"] if entry else None
         except Exception as e:
             logging.error(f"Failed to get record ID for {record_name}: {e}")
             return None
     
-    def create_record(self, record_name, custom_ip=None, proxied=True):
-        """Create new A record"""
+    def create_record(self, record_name, custom_ip=None, proxied=True, record_type="A"):
+        """Create new A or AAAA record, the type follows custom_ip when given"""
         if custom_ip:
             current_ip = custom_ip
+            record_type = RECORD_TYPES[ipaddress.ip_address(custom_ip).version]
             logging.info(f"Using custom IP: {current_ip}")
         else:
-            current_ip = self.get_public_ip()
+            current_ip = self.get_public_ip(6 if record_type == "AAAA" else 4)
             if not current_ip:
                 return False
             
         # Check if record already exists
-        if self.get_record_id(record_name):
-            logging.info(f"Record {record_name} already exists")
+        if self.get_record_id(record_name, record_type):
+            logging.info(f"Record {record_name} ({record_type}) already exists")
             return True
             
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/zones/{self.zone_id}/dns_records",
-                headers=self.headers,
+                timeout=self.timeout,
                 json={
-                    "type": "A",
+                    "type": record_type,
                     "name": record_name,
                     "content": current_ip,
-                    "ttl": 300,
+                    "ttl": RECORD_TTL,
                     "proxied": proxied
                 }
             )
             data = response.json()
             
             if data["success"]:
+                self._index_record(data["result"])
                 proxy_status = "proxied" if proxied else "DNS only"
-                logging.info(f"Created {record_name} → {current_ip} ({proxy_status})")
+                logging.info(f"Created {record_name} {record_type} → {current_ip} ({proxy_status})")
                 return True
             else:
                 logging.error(f"Failed to create {record_name}: {data}")
@@ -87,30 +226,28 @@ class CloudflareDDNS:
             logging.error(f"Failed to create {record_name}: {e}")
             return False
     
-    def update_record(self, record_name, ip, proxied=True):
-        """Update A record with new IP"""
-        record_id = self.get_record_id(record_name)
+    def update_record(self, record_name, ip, proxied=True, record_type="A"):
+        """Update A or AAAA record with new IP"""
+        record_id = self.get_record_id(record_name, record_type)
         if not record_id:
-            logging.error(f"Record not found: {record_name}")
+            logging.error(f"Record not found: {record_name} ({record_type})")
             return False
             
         try:
-            response = requests.put(
-                f"{self.base_url}/zones/{self.zone_id}/dns_records/{record_id}",
-                headers=self.headers,
-                json={
-                    "type": "A",
-                    "name": record_name,
-                    "content": ip,
-                    "ttl": 300,
-                    "proxied": proxied
-                }
-            )
+            response = self._put_record(record_id, record_name, ip, proxied, record_type)
+            if response.status_code == 404 and self._refresh_index():
+                # The cached ID was deleted or recreated behind our back
+                record_id = self.get_record_id(record_name, record_type)
+                if not record_id:
+                    logging.error(f"Record not found: {record_name} ({record_type})")
+                    return False
+                response = self._put_record(record_id, record_name, ip, proxied, record_type)
             data = response.json()
             
             if data["success"]:
+                self._index_record(data["result"])
                 proxy_status = "proxied" if proxied else "DNS only"
-                logging.info(f"Updated {record_name} → {ip} ({proxy_status})")
+                logging.info(f"Updated {record_name} {record_type} → {ip} ({proxy_status})")
                 return True
             else:
                 logging.error(f"Failed to update {record_name}: {data}")
@@ -119,59 +256,332 @@ class CloudflareDDNS:
             logging.error(f"Failed to update {record_name}: {e}")
             return False
     
+    def _put_record(self, record_id, record_name, ip, proxied, record_type):
+        """PUT the desired record content"""
+        return self.session.put(
+            f"{self.base_url}/zones/{self.zone_id}/dns_records/{record_id}",
+            timeout=self.timeout,
+            json={
+                "type": record_type,
+                "name": record_name,
+                "content": ip,
+                "ttl": RECORD_TTL,
+                "proxied": proxied
+            }
+        )
+    
+    def _run_parallel(self, jobs):
+        """Run (label, fn, args) jobs on a bounded thread pool and log a timing summary"""
+        def timed(job):
+            label, fn, args = job
+            started = time.monotonic()
+            ok = fn(*args)
+            return label, ok, time.monotonic() - started
+        
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(timed, jobs))
+        wall_time = time.monotonic() - started
+        
+        logging.info(f"Run summary: {len(results)} records in {wall_time:.2f}s")
+        for label, ok, seconds in results:
+            logging.info(f"  {label}: {'ok' if ok else 'FAILED'} in {seconds:.2f}s")
+        return results
+    
+    def _send_batch(self, changes):
+        """Apply changes in one all-or-nothing batch call, returns (accepted, rejected for a stale record ID)"""
+        puts, posts = [], []
+        for change in changes:
+            fields = {
+                "type": change["type"],
+                "name": change["name"],
+                "content": change["content"],
+                "ttl": RECORD_TTL,
+                "proxied": change["proxied"]
+            }
+            if change["action"] == "put":
+                puts.append({"id": change["id"], **fields})
+            else:
+                posts.append(fields)
+        
+        started = time.monotonic()
+        try:
+            response = self.session.post(
+                f"{self.base_url}/zones/{self.zone_id}/dns_records/batch",
+                timeout=self.timeout,
+                json={"puts": puts, "posts": posts}
+            )
+            data = response.json()
+        except Exception as e:
+            logging.warning(f"Batch of {len(changes)} changes failed: {e}")
+            return False, False
+        stale = 81044 in {error.get("code") for error in data.get("errors") or []}
+        if response.status_code in (404, 405) and not stale:
+            # Endpoint not available, don't try it again this run
+            logging.warning("Batch endpoint not available, writing records one by one")
+            self.batch_supported = False
+            return False, False
+        if not data.get("success"):
+            logging.warning(f"Batch of {len(changes)} changes rejected: {data.get('errors')}")
+            return False, stale
+        
+        with self.index_lock:
+            index = self.load_index()
+            for kind in ("puts", "posts"):
+                for record in data["result"].get(kind) or []:
+                    index.setdefault(record["name"], {})[record["type"]] = _index_entry(record)
+            self.index_dirty = True
+        seconds = time.monotonic() - started
+        for change in changes:
+            proxy_status = "proxied" if change["proxied"] else "DNS only"
+            verb = "Updated" if change["action"] == "put" else "Created"
+            logging.info(f"{verb} {change['name']} {change['type']} → {change['content']} ({proxy_status})")
+        logging.info(f"Batch of {len(changes)} changes applied in {seconds:.2f}s")
+        return True, False
+    
+    def _apply_one(self, change):
+        """Apply one change with its own API call"""
+        if change["action"] == "put":
+            return self.update_record(change["name"], change["content"], change["proxied"], change["type"])
+        return self.create_record(change["name"], change["content"], change["proxied"])
+    
+    def _resolve_ids(self, changes, outcomes):
+        """Look up record IDs for put changes from the index, failing the ones that don't exist"""
+        resolved = []
+        for change in changes:
+            if change["action"] == "put":
+                change["id"] = self.get_record_id(change["name"], change["type"])
+                if not change["id"]:
+                    logging.error(f"Record not found: {change['name']} ({change['type']})")
+                    outcomes[_change_label(change)] = False
+                    continue
+            resolved.append(change)
+        return resolved
+    
+    def apply_changes(self, changes):
+        """
+        Write put/post changes and return {label: ok} for each one.
+        
+        Changes go out in batch calls of up to batch_size. A batch is all or
+        nothing, so a rejected batch (stale record ID, endpoint unavailable...)
+        is retried as concurrent per-record calls to find out which changes
+        actually fail.
+        """
+        outcomes = {}
+        pending = self._resolve_ids(changes, outcomes)
+        
+        fallback = pending
+        if self.batch_supported:
+            fallback = []
+            for start in range(0, len(pending), self.batch_size):
+                chunk = pending[start:start + self.batch_size]
+                accepted, stale = self._send_batch(chunk) if self.batch_supported else (False, False)
+                if stale and self._refresh_index():
+                    # Someone recreated a record, retry once with fresh IDs before going record by record
+                    chunk = self._resolve_ids(chunk, outcomes)
+                    accepted, _ = self._send_batch(chunk)
+                if accepted:
+                    outcomes.update({_change_label(change): True for change in chunk})
+                else:
+                    fallback.extend(chunk)
+        
+        if fallback:
+            results = self._run_parallel([(_change_label(change), self._apply_one, (change,)) for change in fallback])
+            outcomes.update({label: ok for label, ok, _ in results})
+        self.save_index()
+        return outcomes
+    
     def init_records(self, records):
         """Initialize records - create if they don't exist"""
-        current_ip = self.get_public_ip()
-        if not current_ip:
+        ips = self.get_public_ips()
+        if len(ips) < len(self.ip_discovery):
             return False
-            
-        success_count = 0
+        
+        changes = []
+        existing = 0
         for record in records:
-            if self.get_record_id(record):
-                logging.info(f"Record {record} already exists")
-                success_count += 1
-            else:
-                if self.create_record(record, current_ip):
-                    success_count += 1
+            for record_type, ip in ips.items():
+                if self.get_record_id(record, record_type):
+                    logging.info(f"Record {record} ({record_type}) already exists")
+                    existing += 1
+                else:
+                    changes.append({"action": "post", "name": record, "type": record_type, "content": ip, "proxied": True})
+        outcomes = self.apply_changes(changes)
+        success_count = existing + sum(1 for ok in outcomes.values() if ok)
+        total = existing + len(changes)
                     
-        logging.info(f"Initialized {success_count}/{len(records)} records")
-        return success_count == len(records)
+        logging.info(f"Initialized {success_count}/{total} records")
+        return success_count == total
+    
+    def load_state(self):
+        """Last published IP and record state, empty when missing or unreadable"""
+        try:
+            with open(self.state_file) as f:
+                state = json.load(f)
+            if state.get("zone_id") == self.zone_id and "ips" in state:
+                return state
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable state file {self.state_file}: {e}")
+        return {"zone_id": self.zone_id, "ips": {}, "reconciled_at": 0, "records": {}}
+    
+    def save_state(self, state):
+        """Write the published state file"""
+        try:
+            with open(self.state_file + ".tmp", "w") as f:
+                json.dump(state, f, indent=2)
+            os.replace(self.state_file + ".tmp", self.state_file)
+        except OSError as e:
+            logging.warning(f"Failed to save state file {self.state_file}: {e}")
     
-    def update_all(self, records, non_proxy_records=None):
-        """Update all specified records with current IP"""
-        current_ip = self.get_public_ip()
-        if not current_ip:
+    def unchanged(self, records, non_proxy_records=None):
+        """
+        Cheap check for the common run where nothing moved: no reconcile is due,
+        every record is published with the last addresses, and the source that
+        answered fastest last time (a non-HTTP one if any answered) still
+        reports them. One unconfirmed lookup per family and no Cloudflare
+        calls; any doubt falls back to update_all.
+        """
+        state = self.load_state()
+        if time.time() - state["reconciled_at"] >= self.reconcile_interval:
+            return False
+        wanted = [(r, True) for r in records if r.strip()] + [(r, False) for r in (non_proxy_records or []) if r.strip()]
+        for family, discovery in self.ip_discovery.items():
+            record_type = RECORD_TYPES[family]
+            published = state["ips"].get(record_type)
+            if published is None:
+                return False
+            if not all(
+                _matches(state["records"].get(record, {}).get(record_type), _desired_record(published, proxied))
+                for record, proxied in wanted
+            ):
+                return False
+            if not discovery.latencies:
+                # A fresh process ranks the sources by the last full run's latencies
+                discovery.latencies = state.get("ip_source_latency_seconds", {}).get(record_type, {})
+            if discovery.probe_fastest() != published:
+                return False
+        return True
+    
+    def update_all(self, records, non_proxy_records=None, force=False):
+        """Update records whose published state differs from the current IPs and proxy setting"""
+        ips = self.get_public_ips()
+        if not ips:
             return False
             
         # Filter out empty strings
         records = [r for r in records if r.strip()]
         non_proxy_records = [r for r in (non_proxy_records or []) if r.strip()]
         
-        success_count = 0
-        total_records = len(records) + len(non_proxy_records)
+        # (record, type) -> desired fields, for every family whose address is known
+        desired = {}
+        for record_type, ip in ips.items():
+            desired.update({(record, record_type): _desired_record(ip, True) for record in records})
+            desired.update({(record, record_type): _desired_record(ip, False) for record in non_proxy_records})
         
-        # Update proxied records
-        for record in records:
-            if self.update_record(record, current_ip, proxied=True):
-                success_count += 1
+        state = self.load_state()
+        reconcile = force or time.time() - state["reconciled_at"] >= self.reconcile_interval
+        if reconcile:
+            # Diff against the live zone so edits made outside this script get corrected too
+            try:
+                current = self.load_index(refresh=True)
+            except Exception as e:
+                logging.error(f"Failed to fetch DNS records for reconcile: {e}")
+                return False
+        else:
+            current = state["records"]
+        changed = [
+            key for key, want in desired.items()
+            if not _matches(current.get(key[0], {}).get(key[1]), want)
+        ]
         
-        # Update non-proxy records
-        for record in non_proxy_records:
-            if self.update_record(record, current_ip, proxied=False):
-                success_count += 1
-                
-        logging.info(f"Updated {success_count}/{total_records} records")
-        return success_count == total_records
+        # Write changed proxied and non-proxy records, batched when possible
+        changes = [
+            {"action": "put", "name": record, "type": record_type, **desired[record, record_type]}
+            for record, record_type in changed
+        ]
+        outcomes = self.apply_changes(changes)
+        failed = {
+            (change["name"], change["type"]) for change in changes
+            if not outcomes.get(_change_label(change))
+        }
+        
+        # Families that couldn't be discovered keep their last published state
+        published = {
+            record: {t: want for t, want in types.items() if t not in ips}
+            for record, types in state["records"].items()
+            if record in records or record in non_proxy_records
+        }
+        for (record, record_type), want in desired.items():
+            if (record, record_type) not in failed:
+                published.setdefault(record, {})[record_type] = want
+        state["records"] = published
+        state["ips"] = {**state["ips"], **ips}
+        state["ip_source_latency_seconds"] = {
+            RECORD_TYPES[family]: discovery.latencies for family, discovery in self.ip_discovery.items()
+        }
+        if reconcile and not failed and len(ips) == len(self.ip_discovery):
+            state["reconciled_at"] = time.time()
+        self.save_state(state)
+        
+        kind = "full reconcile" if reconcile else "state file diff"
+        addresses = ", ".join(ips.values())
+        logging.info(
+            f"Wrote {len(changed) - len(failed)}/{len(changed)} changed records, skipped "
+            f"{len(desired) - len(changed)} unchanged ({addresses}, {kind})"
+        )
+        return not failed and len(ips) == len(self.ip_discovery)
+
+def _index_entry(record):
+    """Index fields kept for an API record"""
+    return {
+        "id": record["id"],
+        "content": record["content"],
+        "proxied": record.get("proxied", False),
+        "ttl": record["ttl"]
+    }
+
+def _change_label(change):
+    """Name and type of a change, as used in logs and outcomes"""
+    return f"{change['name']} {change['type']}"
+
+def _desired_record(ip, proxied):
+    """Record fields update_record publishes"""
+    return {"content": ip, "proxied": proxied, "ttl": RECORD_TTL}
+
+def _matches(entry, want):
+    """Whether a published record already has the desired fields"""
+    return entry is not None and all(entry.get(key) == value for key, value in want.items())
 
 def load_config():
     """Load configuration from .env file"""
+    from dotenv import load_dotenv
     load_dotenv()
     
     return {
         "api_token": os.getenv("CLOUDFLARE_API_TOKEN"),
         "zone_id": os.getenv("CLOUDFLARE_ZONE_ID"),
+        "api_url": os.getenv("CLOUDFLARE_API_URL") or "https://api.cloudflare.com/client/v4",
         "records": os.getenv("DDNS_RECORDS", "").split(","),
-        "non_proxy_records": os.getenv("DDNS_NON_PROXY_RECORDS", "").split(",")
+        "non_proxy_records": os.getenv("DDNS_NON_PROXY_RECORDS", "").split(","),
+        "max_workers": int(os.getenv("DDNS_MAX_WORKERS") or "4"),
+        "timeout": float(os.getenv("DDNS_TIMEOUT_IN_SECONDS") or "10"),
+        "retries": int(os.getenv("DDNS_RETRIES") or "3"),
+        "batch_size": int(os.getenv("DDNS_BATCH_SIZE") or "200"),
+        "index_file": os.getenv("DDNS_INDEX_FILE") or ".ddns-index.json",
+        "index_max_age": int(os.getenv("DDNS_INDEX_MAX_AGE_IN_SECONDS") or "3600"),
+        "state_file": os.getenv("DDNS_STATE_FILE") or ".ddns-state.json",
+        "reconcile_interval": int(os.getenv("DDNS_RECONCILE_INTERVAL_IN_SECONDS") or "86400"),
+        "ipv6": os.getenv("DDNS_IPV6", "false").lower() == "true",
+        "ip_sources": os.getenv("DDNS_IP_SOURCES") or DEFAULT_SOURCES[4],
+        "ipv6_sources": os.getenv("DDNS_IPV6_SOURCES") or DEFAULT_SOURCES[6],
+        "ip_quorum": int(os.getenv("DDNS_IP_QUORUM") or "2"),
+        "ip_timeout": float(os.getenv("DDNS_IP_TIMEOUT_IN_SECONDS") or "5"),
+        "poll_interval": int(os.getenv("DDNS_POLL_INTERVAL_IN_SECONDS") or "60"),
+        "trigger_socket": os.getenv("DDNS_TRIGGER_SOCKET") or "/run/ddns/trigger.sock",
+        "watch_netlink": (os.getenv("DDNS_WATCH_NETLINK") or "true").lower() == "true",
+        "fast_path": (os.getenv("DDNS_FAST_PATH") or "true").lower() == "true"
     }
 
 def main():
@@ -184,6 +594,10 @@ def main():
                        help="Create record without proxy (DNS only)")
     parser.add_argument("--ip", metavar="IP_ADDRESS",
                        help="Use custom IP address instead of auto-detecting")
+    parser.add_argument("--force", action="store_true",
+                       help="Reconcile every record against Cloudflare instead of the state file")
+    parser.add_argument("--daemon", action="store_true",
+                       help="Stay resident, polling and reacting to address change triggers")
     args = parser.parse_args()
     
     # Setup logging
@@ -203,25 +617,62 @@ def main():
         logging.error("No records specified")
         sys.exit(1)
     
+    # Public IP sources per address family
+    ip_session = LazySession()
+    ip_discovery = {
+        4: IpDiscovery(parse_sources(config["ip_sources"], ip_session), 4, config["ip_quorum"], config["ip_timeout"])
+    }
+    if config["ipv6"]:
+        ip_discovery[6] = IpDiscovery(
+            parse_sources(config["ipv6_sources"], ip_session), 6, config["ip_quorum"], config["ip_timeout"]
+        )
+    
     # Initialize, create record once, or update DNS records
-    ddns = CloudflareDDNS(config["api_token"], config["zone_id"])
+    ddns = CloudflareDDNS(
+        config["api_token"],
+        config["zone_id"],
+        max_workers=config["max_workers"],
+        timeout=config["timeout"],
+        retries=config["retries"],
+        index_file=config["index_file"],
+        index_max_age=config["index_max_age"],
+        state_file=config["state_file"],
+        reconcile_interval=config["reconcile_interval"],
+        ip_discovery=ip_discovery,
+        batch_size=config["batch_size"],
+        base_url=config["api_url"]
+    )
     
     if args.add_record_once:
         proxied = not args.non_proxy  # Default to proxied unless --non-proxy specified
-        if ddns.create_record(args.add_record_once, args.ip, proxied):
+        created = ddns.create_record(args.add_record_once, args.ip, proxied)
+        ddns.save_index()
+        if created:
             proxy_status = "proxied" if proxied else "DNS only"
             logging.info(f"Record creation completed for {args.add_record_once} ({proxy_status})")
         else:
             logging.error(f"Record creation failed for {args.add_record_once}")
             sys.exit(1)
+    elif args.daemon:
+        from daemon import DdnsDaemon
+        DdnsDaemon(
+            ddns,
+            config["records"],
+            config["non_proxy_records"],
+            poll_interval=config["poll_interval"],
+            trigger_socket=config["trigger_socket"] or None,
+            watch_netlink=config["watch_netlink"]
+        ).run()
     elif args.init:
         if ddns.init_records(config["records"]):
             logging.info("DDNS initialization completed successfully")
         else:
             logging.error("DDNS initialization failed")
             sys.exit(1)
+    elif not args.force and config["fast_path"] and ddns.unchanged(config["records"], config["non_proxy_records"]):
+        logging.info("Public address unchanged, nothing to update")
     else:
-        if ddns.update_all(config["records"], config["non_proxy_records"]):
+        if ddns.update_all(config["records"], config["non_proxy_records"], force=args.force):
             logging.info("DDNS update completed successfully")
         else:
             logging.error("DDNS update failed")
@@ -0,0 +1,281 @@
+"""
+Public IP discovery for the DDNS updater
+Races HTTPS echo endpoints, DNS myip lookups and the router's UPnP WAN address, and accepts the first address a quorum agrees on.
+"""
+
+import re
+import time
+import queue
+import random
+import socket
+import struct
+import logging
+import threading
+import ipaddress
+
+DEFAULT_SOURCES = {
+    4: "https://ipv4.icanhazip.com,https://api.ipify.org,https://checkip.amazonaws.com,"
+       "dns:208.67.222.222/myip.opendns.com",
+    6: "https://ipv6.icanhazip.com,https://api6.ipify.org,dns:[2620:119:35::35]/myip.opendns.com",
+}
+RECORD_TYPES = {4: "A", 6: "AAAA"}
+
+UPNP_SERVICE = "urn:schemas-upnp-org:service:WANIPConnection:1"
+
+
+class LazySession:
+    """Stand-in for a requests.Session that imports requests and creates it on first use"""
+
+    def __init__(self):
+        self._session = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # Sources race on threads, only the first one creates the session
+        with self._lock:
+            if self._session is None:
+                import requests
+                self._session = requests.Session()
+        return getattr(self._session, name)
+
+
+class IpSource:
+    """One way of learning the public address, named by its spec string"""
+
+    # Whether a lookup goes through the requests session, which costs the HTTP stack import
+    uses_http = False
+
+    def __init__(self, spec):
+        self.spec = spec
+
+    def lookup(self, family, timeout):
+        """Return the public address as text, raising on failure"""
+        raise NotImplementedError
+
+
+class HttpEchoSource(IpSource):
+    """HTTP(S) endpoint that answers with the caller's address as plain text"""
+
+    uses_http = True
+
+    def __init__(self, spec, session):
+        super().__init__(spec)
+        self.session = session
+
+    def lookup(self, family, timeout):
+        response = self.session.get(self.spec, timeout=timeout)
+        response.raise_for_status()
+        return response.text.strip()
+
+
+class DnsSource(IpSource):
+    """
+    Resolver that answers a special name with the caller's address.
+
+    Spec is dns:server[:port]/name, e.g. dns:208.67.222.222/myip.opendns.com,
+    with IPv6 servers in brackets. The A or AAAA record is asked for depending
+    on the family, so the query has to reach the resolver over that family.
+    """
+
+    def __init__(self, spec):
+        super().__init__(spec)
+        server, _, self.name = spec[len("dns:"):].partition("/")
+        match = re.fullmatch(r"\[([^\]]+)\](?::(\d+))?|([^:]+)(?::(\d+))?", server)
+        if not match or not self.name:
+            raise ValueError(f"Invalid DNS IP source: {spec}")
+        self.server = match.group(1) or match.group(3)
+        self.port = int(match.group(2) or match.group(4) or 53)
+
+    def lookup(self, family, timeout):
+        qtype = 28 if family == 6 else 1
+        query_id = random.getrandbits(16)
+        qname = b"".join(bytes([len(label)]) + label.encode() for label in self.name.split(".")) + b"\x00"
+        query = struct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 0) + qname + struct.pack("!HH", qtype, 1)
+
+        address_family = socket.AF_INET6 if ":" in self.server else socket.AF_INET
+        deadline = time.monotonic() + timeout
+        with socket.socket(address_family, socket.SOCK_DGRAM) as sock:
+            sock.connect((self.server, self.port))
+            sock.send(query)
+            while True:
+                sock.settimeout(max(0.0, deadline - time.monotonic()))
+                response = sock.recv(512)
+                if len(response) >= 12 and struct.unpack("!H", response[:2])[0] == query_id:
+                    return _parse_answer(response, qtype)
+
+
+def _skip_name(message, offset):
+    """Offset just past a possibly compressed domain name"""
+    while True:
+        length = message[offset]
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        if length == 0:
+            return offset + 1
+        offset += length + 1
+
+
+def _parse_answer(message, qtype):
+    """First answer of the asked type in a DNS response"""
+    _, flags, qdcount, ancount, _, _ = struct.unpack("!HHHHHH", message[:12])
+    if flags & 0x000F:
+        raise ValueError(f"DNS rcode {flags & 0x000F}")
+    offset = 12
+    for _ in range(qdcount):
+        offset = _skip_name(message, offset) + 4
+    for _ in range(ancount):
+        offset = _skip_name(message, offset)
+        rtype, _, _, rdlength = struct.unpack("!HHIH", message[offset:offset + 10])
+        offset += 10
+        if rtype == qtype:
+            family = socket.AF_INET6 if qtype == 28 else socket.AF_INET
+            return socket.inet_ntop(family, message[offset:offset + rdlength])
+        offset += rdlength
+    raise ValueError("no address in DNS answer")
+
+
+class UpnpSource(IpSource):
+    """
+    Router WAN address over UPnP IGD.
+
+    Spec is upnp:<control URL of the WANIPConnection service>, e.g.
+    upnp:http://192.168.0.1:5000/ctl/IPConn. Routers only report IPv4 here,
+    and behind CGNAT the WAN address is not public and gets rejected.
+    """
+
+    uses_http = True
+
+    def __init__(self, spec, session):
+        super().__init__(spec)
+        self.control_url = spec[len("upnp:"):]
+        self.session = session
+
+    def lookup(self, family, timeout):
+        if family != 4:
+            raise ValueError("UPnP only reports an IPv4 WAN address")
+        response = self.session.post(
+            self.control_url,
+            timeout=timeout,
+            headers={
+                "Content-Type": 'text/xml; charset="utf-8"',
+                "SOAPAction": f'"{UPNP_SERVICE}#GetExternalIPAddress"'
+            },
+            data=(
+                '<?xml version="1.0"?>'
+                '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" '
+                's:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body>'
+                f'<u:GetExternalIPAddress xmlns:u="{UPNP_SERVICE}"/>'
+                '</s:Body></s:Envelope>'
+            )
+        )
+        response.raise_for_status()
+        match = re.search(r"<NewExternalIPAddress>\s*([^<\s]+)\s*</NewExternalIPAddress>", response.text)
+        if not match:
+            raise ValueError("no NewExternalIPAddress in UPnP response")
+        return match.group(1)
+
+
+def parse_sources(value, session):
+    """Build IP sources from a comma-separated list of specs"""
+    sources = []
+    for spec in value.split(","):
+        spec = spec.strip()
+        if not spec:
+            continue
+        if spec.startswith(("https://", "http://")):
+            sources.append(HttpEchoSource(spec, session))
+        elif spec.startswith("dns:"):
+            sources.append(DnsSource(spec))
+        elif spec.startswith("upnp:"):
+            sources.append(UpnpSource(spec, session))
+        else:
+            raise ValueError(f"Unknown IP source: {spec}")
+    return sources
+
+
+class IpDiscovery:
+    """Race every source for one address family and accept the first address a quorum agrees on"""
+
+    def __init__(self, sources, family=4, quorum=2, timeout=5):
+        if not sources:
+            raise ValueError(f"No IPv{family} sources configured")
+        self.sources = sources
+        self.family = family
+        self.quorum = min(quorum, len(sources))
+        self.timeout = timeout
+        # Source spec -> seconds its last answer took, None when it failed or was still pending
+        self.latencies = {}
+
+    def _lookup(self, source):
+        """Ask one source and validate its answer"""
+        started = time.monotonic()
+        try:
+            address = ipaddress.ip_address(source.lookup(self.family, self.timeout))
+            if address.version != self.family or not address.is_global:
+                raise ValueError(f"{address} is not a public IPv{self.family} address")
+            return str(address), time.monotonic() - started, None
+        except Exception as e:
+            return None, time.monotonic() - started, e
+
+    def _answer(self, source, answers):
+        """Ask one source on its own thread and queue the outcome"""
+        answers.put((source, self._lookup(source)))
+
+    def probe_fastest(self):
+        """
+        Single unconfirmed lookup from the source that answered fastest last
+        time, or None. Of the sources that answered, one that needs no HTTP
+        stack is preferred even when an HTTP one was faster, so a cheap run
+        doesn't pay for importing requests.
+        """
+        def rank(source):
+            latency = self.latencies.get(source.spec)
+            return latency is None, source.uses_http, latency or 0.0
+
+        address, _, _ = self._lookup(min(self.sources, key=rank))
+        return address
+
+    def discover(self):
+        """Public address of this family, or None when no quorum was reached in time"""
+        votes = {}
+        outcomes = {}
+        winner = None
+        # Daemon threads, so stragglers are abandoned instead of holding up the interpreter's exit
+        answers = queue.Queue()
+        for source in self.sources:
+            threading.Thread(target=self._answer, args=(source, answers), daemon=True).start()
+        deadline = time.monotonic() + self.timeout
+        while len(outcomes) < len(self.sources):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                source, outcome = answers.get(timeout=remaining)
+            except queue.Empty:
+                break
+            outcomes[source.spec] = outcome
+            address = outcome[0]
+            if address is None:
+                continue
+            votes[address] = votes.get(address, 0) + 1
+            if votes[address] >= self.quorum:
+                winner = address
+                break
+
+        self.latencies = {}
+        for source in self.sources:
+            address, seconds, error = outcomes.get(source.spec, (None, None, None))
+            self.latencies[source.spec] = seconds if address else None
+            if address:
+                logging.info(f"  IPv{self.family} via {source.spec}: {address} in {seconds:.3f}s")
+            elif error:
+                logging.info(f"  IPv{self.family} via {source.spec}: failed in {seconds:.3f}s ({error})")
+            else:
+                logging.info(f"  IPv{self.family} via {source.spec}: no answer before quorum")
+
+        if winner is None:
+            logging.error(
+                f"No IPv{self.family} address confirmed by {self.quorum} sources within {self.timeout}s "
+                f"(answers: {votes or 'none'})"
+            )
+        return winner
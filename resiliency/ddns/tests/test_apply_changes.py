@@ -0,0 +1,159 @@
+"""
+Tests for record writes against the fake Cloudflare API: batches, the
+per-record fallback, stale record IDs and per-record failure reporting.
+
+    python -m unittest discover -s resiliency/ddns/tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+DDNS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, DDNS_DIR)
+sys.path.insert(0, os.path.join(DDNS_DIR, "utils"))
+
+from ddns import CloudflareDDNS
+from fake_cloudflare import FakeCloudflare
+
+NAMES = ["home.example.com", "api.example.com", "vpn.example.com"]
+
+
+def _put(name, content="1.2.3.4", proxied=True):
+    return {"action": "put", "name": name, "type": "A", "content": content, "proxied": proxied}
+
+
+class Zone:
+    """Fake zone seeded with NAMES, served for the length of one test"""
+
+    def __init__(self, test, batch_supported=True, batch_size=200):
+        self.test = test
+        self.api = FakeCloudflare(batch_supported=batch_supported)
+        self.ids = {name: self.api.add_record(name) for name in NAMES}
+        server = self.api.serve()
+        test.addCleanup(server.server_close)
+        test.addCleanup(server.shutdown)
+        self.directory = tempfile.mkdtemp()
+        test.addCleanup(shutil.rmtree, self.directory)
+        self.base_url = f"http://127.0.0.1:{server.server_port}/client/v4"
+        self.batch_size = batch_size
+
+    def client(self):
+        """Client for one run, sharing the index cache with earlier runs"""
+        ddns = CloudflareDDNS(
+            "token", "zone", timeout=5, retries=0, batch_size=self.batch_size,
+            index_file=os.path.join(self.directory, "index.json"),
+            state_file=os.path.join(self.directory, "state.json"),
+            base_url=self.base_url
+        )
+        self.test.addCleanup(ddns.session.close)
+        return ddns
+
+    def cached_client(self):
+        """Client whose index was cached by a previous run, with the call count starting from it"""
+        self.client().load_index()
+        self.api.calls.clear()
+        return self.client()
+
+    def calls(self, method, endpoint):
+        """API calls made to one endpoint"""
+        return self.api.calls.count((method, endpoint))
+
+    def content(self, name):
+        """Published content of a record"""
+        return next(record["content"] for record in self.api.records.values() if record["name"] == name)
+
+    def recreate(self, name):
+        """Delete a record and create it again under a new ID, as the dashboard would"""
+        del self.api.records[self.ids[name]]
+        self.ids[name] = self.api.add_record(name)
+
+    def delete(self, name):
+        """Delete a record"""
+        del self.api.records[self.ids[name]]
+
+
+class ApplyChangesTest(unittest.TestCase):
+
+    def test_batch_accepted_in_one_call(self):
+        zone = Zone(self)
+        ddns = zone.client()
+        outcomes = ddns.apply_changes([_put(name) for name in NAMES])
+        self.assertEqual(outcomes, {f"{name} A": True for name in NAMES})
+        self.assertEqual(zone.calls("POST", "dns_records/batch"), 1)
+        self.assertEqual(zone.calls("PUT", "dns_records/:id"), 0)
+        self.assertEqual([zone.content(name) for name in NAMES], ["1.2.3.4"] * 3)
+
+    def test_batch_split_by_batch_size(self):
+        zone = Zone(self, batch_size=2)
+        ddns = zone.client()
+        outcomes = ddns.apply_changes([_put(name) for name in NAMES])
+        self.assertTrue(all(outcomes.values()))
+        self.assertEqual(zone.calls("POST", "dns_records/batch"), 2)
+
+    def test_batch_endpoint_missing_falls_back_to_per_record(self):
+        zone = Zone(self, batch_supported=False)
+        ddns = zone.client()
+        outcomes = ddns.apply_changes([_put(name) for name in NAMES])
+        self.assertEqual(outcomes, {f"{name} A": True for name in NAMES})
+        self.assertEqual(zone.calls("POST", "dns_records/batch"), 1)
+        self.assertEqual(zone.calls("PUT", "dns_records/:id"), 3)
+        self.assertEqual([zone.content(name) for name in NAMES], ["1.2.3.4"] * 3)
+        # Not tried again for the rest of the run
+        self.assertFalse(ddns.batch_supported)
+        ddns.apply_changes([_put(NAMES[0], "5.6.7.8")])
+        self.assertEqual(zone.calls("POST", "dns_records/batch"), 1)
+
+    def test_stale_record_id_refreshes_index_and_retries_batch(self):
+        zone = Zone(self)
+        ddns = zone.cached_client()
+        zone.recreate(NAMES[1])
+        outcomes = ddns.apply_changes([_put(name) for name in NAMES])
+        self.assertEqual(outcomes, {f"{name} A": True for name in NAMES})
+        # Rejected with 81044, index refetched once, batch retried with the new ID
+        self.assertEqual(zone.calls("POST", "dns_records/batch"), 2)
+        self.assertEqual(zone.calls("GET", "dns_records"), 1)
+        self.assertEqual(zone.calls("PUT", "dns_records/:id"), 0)
+        self.assertEqual(ddns.index[NAMES[1]]["A"]["id"], zone.ids[NAMES[1]])
+        self.assertEqual(zone.content(NAMES[1]), "1.2.3.4")
+
+    def test_stale_record_id_refreshes_index_and_retries_put(self):
+        zone = Zone(self, batch_size=0)
+        ddns = zone.cached_client()
+        zone.recreate(NAMES[0])
+        self.assertTrue(ddns.update_record(NAMES[0], "1.2.3.4"))
+        self.assertEqual(zone.calls("PUT", "dns_records/:id"), 2)
+        self.assertEqual(zone.calls("GET", "dns_records"), 1)
+        self.assertEqual(zone.content(NAMES[0]), "1.2.3.4")
+
+    def test_missing_record_fails_alone(self):
+        zone = Zone(self)
+        ddns = zone.client()
+        outcomes = ddns.apply_changes([_put(name) for name in NAMES + ["gone.example.com"]])
+        self.assertEqual(outcomes, {**{f"{name} A": True for name in NAMES}, "gone.example.com A": False})
+        self.assertEqual(zone.calls("POST", "dns_records/batch"), 1)
+        self.assertEqual([zone.content(name) for name in NAMES], ["1.2.3.4"] * 3)
+
+    def test_record_deleted_after_indexing_fails_alone(self):
+        zone = Zone(self)
+        ddns = zone.cached_client()
+        zone.delete(NAMES[2])
+        outcomes = ddns.apply_changes([_put(name) for name in NAMES])
+        self.assertEqual(outcomes, {f"{NAMES[0]} A": True, f"{NAMES[1]} A": True, f"{NAMES[2]} A": False})
+        # The all-or-nothing batch is retried without the missing record
+        self.assertEqual(zone.calls("POST", "dns_records/batch"), 2)
+        self.assertEqual([zone.content(name) for name in NAMES[:2]], ["1.2.3.4"] * 2)
+
+    def test_per_record_failure_is_reported(self):
+        zone = Zone(self, batch_supported=False)
+        ddns = zone.cached_client()
+        zone.delete(NAMES[2])
+        outcomes = ddns.apply_changes([_put(name) for name in NAMES])
+        self.assertEqual(outcomes, {f"{NAMES[0]} A": True, f"{NAMES[1]} A": True, f"{NAMES[2]} A": False})
+        self.assertEqual([zone.content(name) for name in NAMES[:2]], ["1.2.3.4"] * 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
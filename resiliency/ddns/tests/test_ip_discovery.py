@@ -0,0 +1,269 @@
+"""
+Tests for public IP discovery: quorum voting, answer validation, timeouts
+and the DNS and UPnP answer parsers.
+
+    python -m unittest discover -s resiliency/ddns/tests
+"""
+
+import os
+import sys
+import time
+import struct
+import threading
+import subprocess
+import unittest
+
+DDNS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, DDNS_DIR)
+sys.path.insert(0, os.path.join(DDNS_DIR, "utils"))
+
+from ip_discovery import DnsSource, IpDiscovery, IpSource, UpnpSource, _parse_answer, parse_sources
+import stub_ip_sources
+
+
+class StaticSource(IpSource):
+    """Answers with a fixed address after an optional delay"""
+
+    def __init__(self, spec, address, delay=0.0):
+        super().__init__(spec)
+        self.address = address
+        self.delay = delay
+        self.asked = None
+
+    def lookup(self, family, timeout):
+        self.asked = (family, timeout)
+        time.sleep(self.delay)
+        return self.address
+
+
+class HangingSource(IpSource):
+    """Never answers until released"""
+
+    def __init__(self, spec, released):
+        super().__init__(spec)
+        self.released = released
+        self.asked = None
+
+    def lookup(self, family, timeout):
+        self.asked = (family, timeout)
+        self.released.wait()
+        raise TimeoutError("released")
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+    """Records the last POST and answers it with canned text"""
+
+    def __init__(self, text):
+        self.text = text
+        self.request = None
+
+    def post(self, url, **kwargs):
+        self.request = (url, kwargs)
+        return FakeResponse(self.text)
+
+
+def _dns_response(answers, rcode=0):
+    """DNS response to a myip.opendns.com query with (type, rdata) answers, names compressed"""
+    qname = b"\x04myip\x07opendns\x03com\x00"
+    header = struct.pack("!HHHHHH", 0x1234, 0x8180 | rcode, 1, len(answers), 0, 0)
+    question = qname + struct.pack("!HH", 1, 1)
+    records = b"".join(
+        struct.pack("!HHHIH", 0xC00C, rtype, 1, 0, len(rdata)) + rdata for rtype, rdata in answers
+    )
+    return header + question + records
+
+
+class IpDiscoveryTest(unittest.TestCase):
+
+    def test_quorum_outvotes_disagreeing_source(self):
+        # The dissenter answers first, the two that agree win
+        discovery = IpDiscovery([
+            StaticSource("liar", "5.6.7.8"),
+            StaticSource("a", "1.2.3.4", delay=0.05),
+            StaticSource("b", "1.2.3.4", delay=0.1),
+        ], quorum=2, timeout=2)
+        self.assertEqual(discovery.discover(), "1.2.3.4")
+        self.assertEqual(discovery.sources[0].asked, (4, 2))
+
+    def test_no_quorum_when_sources_disagree(self):
+        discovery = IpDiscovery([
+            StaticSource("a", "5.6.7.8"),
+            StaticSource("b", "1.2.3.4"),
+        ], quorum=2, timeout=2)
+        self.assertIsNone(discovery.discover())
+
+    def test_non_global_address_is_rejected(self):
+        # A router reporting its CGNAT or private side must not be published
+        for address in ("10.0.0.1", "100.64.0.1", "192.168.1.1", "127.0.0.1"):
+            discovery = IpDiscovery([StaticSource("lan", address)], quorum=1, timeout=2)
+            self.assertIsNone(discovery.discover(), address)
+            self.assertIsNone(discovery.latencies["lan"])
+
+    def test_wrong_family_is_rejected(self):
+        discovery = IpDiscovery([StaticSource("v6", "2606:4700:4700::1111")], family=4, quorum=1, timeout=2)
+        self.assertIsNone(discovery.discover())
+
+    def test_invalid_answer_does_not_vote(self):
+        discovery = IpDiscovery([
+            StaticSource("html", "<html>rate limited</html>"),
+            StaticSource("a", "1.2.3.4"),
+            StaticSource("b", "1.2.3.4"),
+        ], quorum=2, timeout=2)
+        self.assertEqual(discovery.discover(), "1.2.3.4")
+
+    def test_all_sources_timing_out(self):
+        released = threading.Event()
+        self.addCleanup(released.set)
+        discovery = IpDiscovery([HangingSource("a", released), HangingSource("b", released)], quorum=2, timeout=0.2)
+        started = time.monotonic()
+        self.assertIsNone(discovery.discover())
+        # Gives up at the timeout rather than waiting for the stragglers
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(discovery.latencies, {"a": None, "b": None})
+
+    def test_straggler_does_not_hold_up_exit(self):
+        # A one-shot run exits once quorum is reached, not when the slowest source gives up
+        script = (
+            "import sys, time\n"
+            f"sys.path.insert(0, {DDNS_DIR!r})\n"
+            "from ip_discovery import IpDiscovery, IpSource\n"
+            "class Source(IpSource):\n"
+            "    def __init__(self, spec, delay):\n"
+            "        super().__init__(spec)\n"
+            "        self.delay = delay\n"
+            "    def lookup(self, family, timeout):\n"
+            "        time.sleep(self.delay)\n"
+            "        return '1.2.3.4'\n"
+            "sources = [Source('a', 0), Source('b', 0), Source('slow', 10)]\n"
+            "print(IpDiscovery(sources, quorum=2, timeout=10).discover())\n"
+        )
+        started = time.monotonic()
+        result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=20, check=True)
+        self.assertEqual(result.stdout.strip(), "1.2.3.4")
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_quorum_is_capped_at_source_count(self):
+        discovery = IpDiscovery([StaticSource("only", "1.2.3.4")], quorum=2, timeout=2)
+        self.assertEqual(discovery.discover(), "1.2.3.4")
+
+    def test_probe_fastest_uses_last_fastest_source(self):
+        discovery = IpDiscovery([
+            StaticSource("slow", "5.6.7.8", delay=0.1),
+            StaticSource("fast", "1.2.3.4"),
+            StaticSource("fast2", "1.2.3.4", delay=0.05),
+        ], quorum=2, timeout=2)
+        discovery.discover()
+        discovery.sources[1].address = "1.2.3.9"
+        self.assertEqual(discovery.probe_fastest(), "1.2.3.9")
+
+    def test_probe_fastest_prefers_source_without_http(self):
+        http = StaticSource("https://fast", "1.2.3.4")
+        http.uses_http = True
+        dns = StaticSource("dns:slow", "1.2.3.4", delay=0.05)
+        discovery = IpDiscovery([http, dns], quorum=2, timeout=2)
+        discovery.discover()
+        self.assertLess(discovery.latencies["https://fast"], discovery.latencies["dns:slow"])
+        dns.address = "1.2.3.9"
+        self.assertEqual(discovery.probe_fastest(), "1.2.3.9")
+        # Unless it didn't answer last time
+        discovery.latencies["dns:slow"] = None
+        self.assertEqual(discovery.probe_fastest(), "1.2.3.4")
+
+    def test_no_sources(self):
+        with self.assertRaises(ValueError):
+            IpDiscovery([], quorum=2)
+
+
+class DnsAnswerTest(unittest.TestCase):
+
+    def test_a_answer(self):
+        self.assertEqual(_parse_answer(_dns_response([(1, bytes([1, 2, 3, 4]))]), 1), "1.2.3.4")
+
+    def test_aaaa_answer(self):
+        rdata = bytes.fromhex("26064700470000000000000000001111")
+        self.assertEqual(_parse_answer(_dns_response([(28, rdata)]), 28), "2606:4700:4700::1111")
+
+    def test_txt_record_before_a_is_skipped(self):
+        response = _dns_response([(16, b"\x0bhello world"), (1, bytes([1, 2, 3, 4]))])
+        self.assertEqual(_parse_answer(response, 1), "1.2.3.4")
+
+    def test_txt_only_answer_has_no_address(self):
+        with self.assertRaisesRegex(ValueError, "no address"):
+            _parse_answer(_dns_response([(16, b"\x071.2.3.4")]), 1)
+
+    def test_error_rcode(self):
+        with self.assertRaisesRegex(ValueError, "rcode 3"):
+            _parse_answer(_dns_response([], rcode=3), 1)
+
+    def test_source_spec(self):
+        source = DnsSource("dns:[2620:119:35::35]:5353/myip.opendns.com")
+        self.assertEqual((source.server, source.port, source.name), ("2620:119:35::35", 5353, "myip.opendns.com"))
+        source = DnsSource("dns:208.67.222.222/myip.opendns.com")
+        self.assertEqual((source.server, source.port), ("208.67.222.222", 53))
+        with self.assertRaises(ValueError):
+            DnsSource("dns:208.67.222.222")
+
+    def test_lookup_against_stub(self):
+        sock = stub_ip_sources.serve_dns(0, "1.2.3.4", "2606:4700:4700::1111")
+        self.addCleanup(sock.close)
+        source = DnsSource(f"dns:127.0.0.1:{sock.getsockname()[1]}/myip.opendns.com")
+        self.assertEqual(source.lookup(4, 2), "1.2.3.4")
+        self.assertEqual(source.lookup(6, 2), "2606:4700:4700::1111")
+
+
+class UpnpSourceTest(unittest.TestCase):
+
+    RESPONSE = (
+        '<?xml version="1.0"?>'
+        '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" '
+        's:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body>'
+        '<u:GetExternalIPAddressResponse xmlns:u="urn:schemas-upnp-org:service:WANIPConnection:1">'
+        '<NewExternalIPAddress> 1.2.3.4 </NewExternalIPAddress>'
+        '</u:GetExternalIPAddressResponse></s:Body></s:Envelope>'
+    )
+
+    def test_external_address(self):
+        session = FakeSession(self.RESPONSE)
+        source = UpnpSource("upnp:http://192.168.0.1:5000/ctl/IPConn", session)
+        self.assertEqual(source.lookup(4, 2), "1.2.3.4")
+        url, request = session.request
+        self.assertEqual(url, "http://192.168.0.1:5000/ctl/IPConn")
+        self.assertIn('#GetExternalIPAddress"', request["headers"]["SOAPAction"])
+
+    def test_fault_without_address(self):
+        source = UpnpSource("upnp:http://192.168.0.1:5000/ctl/IPConn", FakeSession("<s:Fault>401</s:Fault>"))
+        with self.assertRaisesRegex(ValueError, "NewExternalIPAddress"):
+            source.lookup(4, 2)
+
+    def test_ipv6_unsupported(self):
+        source = UpnpSource("upnp:http://192.168.0.1:5000/ctl/IPConn", FakeSession(self.RESPONSE))
+        with self.assertRaises(ValueError):
+            source.lookup(6, 2)
+
+    def test_cgnat_wan_address_is_rejected(self):
+        response = self.RESPONSE.replace("1.2.3.4", "100.64.12.34")
+        source = UpnpSource("upnp:http://192.168.0.1:5000/ctl/IPConn", FakeSession(response))
+        self.assertIsNone(IpDiscovery([source], quorum=1, timeout=2).discover())
+
+
+class ParseSourcesTest(unittest.TestCase):
+
+    def test_kinds(self):
+        sources = parse_sources("https://api.ipify.org, dns:208.67.222.222/myip.opendns.com,upnp:http://r/ctl,", None)
+        self.assertEqual([type(s).__name__ for s in sources], ["HttpEchoSource", "DnsSource", "UpnpSource"])
+
+    def test_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            parse_sources("ftp://example.com", None)
+
+
+if __name__ == "__main__":
+    unittest.main()
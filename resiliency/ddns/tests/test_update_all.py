@@ -0,0 +1,85 @@
+"""
+Tests for full update runs and the daemon loop when Cloudflare is unreachable.
+
+    python -m unittest discover -s resiliency/ddns/tests
+"""
+
+import os
+import sys
+import shutil
+import socket
+import tempfile
+import unittest
+
+DDNS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, DDNS_DIR)
+sys.path.insert(0, os.path.join(DDNS_DIR, "utils"))
+
+from daemon import DdnsDaemon
+from ddns import CloudflareDDNS
+from ip_discovery import IpDiscovery, IpSource
+
+
+class StaticSource(IpSource):
+    """Always answers with the same address"""
+
+    asked = None
+
+    def lookup(self, family, timeout):
+        self.asked = (family, timeout)
+        return "1.2.3.4"
+
+
+def _closed_port():
+    """Local port with nothing listening on it"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FailingDdns:
+    """Client whose every call raises, as requests does with the API down"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def unchanged(self, *_):
+        self.calls += 1
+        raise ConnectionError("unreachable")
+
+    def update_all(self, *_, **__):
+        self.calls += 1
+        raise ConnectionError("unreachable")
+
+
+class UnreachableApiTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_reconcile_fails_cleanly(self):
+        ddns = CloudflareDDNS(
+            "token", "zone", timeout=1, retries=0,
+            index_file=os.path.join(self.directory, "index.json"),
+            state_file=os.path.join(self.directory, "state.json"),
+            ip_discovery={4: IpDiscovery([StaticSource("static")], quorum=1, timeout=1)},
+            base_url=f"http://127.0.0.1:{_closed_port()}/client/v4"
+        )
+        self.addCleanup(ddns.session.close)
+        with self.assertLogs(level="ERROR"):
+            self.assertFalse(ddns.update_all(["home.example.com"]))
+        # Still due, the next run reconciles again
+        self.assertEqual(ddns.load_state()["reconciled_at"], 0)
+
+    def test_daemon_survives_failed_update(self):
+        ddns = FailingDdns()
+        daemon = DdnsDaemon(ddns, ["home.example.com"], trigger_socket=None, watch_netlink=False)
+        with self.assertLogs(level="ERROR"):
+            self.assertFalse(daemon._update({"startup"}, False))
+            self.assertFalse(daemon._update(set(), False))
+        self.assertEqual(ddns.calls, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -17,27 +17,49 @@ echo "Updating DDNS service..."
 echo "Updating dependencies..."
 ./install.sh
 
-# Generate systemd service and timer files with environment variables
-echo "Generating systemd service files..."
-envsubst < ddns.service.template > /tmp/ddns.service
-cp ddns.timer /tmp/ddns.timer
+if [ "${DDNS_DAEMON:-false}" = "true" ]; then
+    # Resident mode replaces the timer
+    echo "Generating systemd service file..."
+    envsubst < ddns-daemon.service.template > /tmp/ddns-daemon.service
 
-# Copy updated service files
-echo "Installing systemd service files..."
-sudo cp /tmp/ddns.service /tmp/ddns.timer /etc/systemd/system/
+    echo "Installing systemd service file..."
+    sudo cp /tmp/ddns-daemon.service /etc/systemd/system/
+    rm /tmp/ddns-daemon.service
 
-# Cleanup temp files
-rm /tmp/ddns.service /tmp/ddns.timer
+    echo "Reloading systemd configuration..."
+    sudo systemctl daemon-reload
 
-# Reload systemd and restart service
-echo "Reloading systemd configuration..."
-sudo systemctl daemon-reload
+    echo "Disabling timer and restarting daemon..."
+    sudo systemctl disable --now ddns.timer 2>/dev/null || true
+    sudo systemctl enable ddns-daemon.service
+    sudo systemctl restart ddns-daemon.service
 
-echo "Enabling and starting timer..."
-sudo systemctl enable --now ddns.timer
+    echo "Daemon status:"
+    sudo systemctl status ddns-daemon.service --no-pager
+else
+    # Generate systemd service and timer files with environment variables
+    echo "Generating systemd service files..."
+    envsubst < ddns.service.template > /tmp/ddns.service
+    cp ddns.timer /tmp/ddns.timer
+
+    # Copy updated service files
+    echo "Installing systemd service files..."
+    sudo cp /tmp/ddns.service /tmp/ddns.timer /etc/systemd/system/
+
+    # Cleanup temp files
+    rm /tmp/ddns.service /tmp/ddns.timer
 
-# Check status
-echo "Timer status:"
-sudo systemctl status ddns.timer --no-pager
+    # Reload systemd and restart service
+    echo "Reloading systemd configuration..."
+    sudo systemctl daemon-reload
+
+    echo "Disabling daemon and enabling timer..."
+    sudo systemctl disable --now ddns-daemon.service 2>/dev/null || true
+    sudo systemctl enable --now ddns.timer
+
+    # Check status
+    echo "Timer status:"
+    sudo systemctl status ddns.timer --no-pager
+fi
 
 echo "Update complete!"
@@ -0,0 +1,168 @@
+"""
+In-memory stand-in for the Cloudflare DNS records API, for trying ddns.py without touching a real zone.
+
+Implements listing (with pagination and name/type filters), create, PUT,
+PATCH and the batch endpoint. Batches apply all or nothing, like the real one.
+
+    python utils/fake_cloudflare.py --records home.example.com,api.example.com --delay 0.05
+    CLOUDFLARE_API_URL=http://127.0.0.1:8089/client/v4 CLOUDFLARE_ZONE_ID=fake python ddns.py
+"""
+
+import re
+import json
+import time
+import uuid
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RECORD_NOT_FOUND = {"code": 81044, "message": "Record does not exist."}
+
+
+class FakeCloudflare:
+    """Zone records plus a count of API calls by method and endpoint"""
+
+    def __init__(self, delay=0.0, batch_supported=True, batch_limit=200):
+        self.delay = delay
+        self.batch_supported = batch_supported
+        self.batch_limit = batch_limit
+        self.records = {}
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def add_record(self, name, content="192.0.2.1", record_type="A", proxied=True, ttl=300):
+        """Seed one record and return its id"""
+        record_id = uuid.uuid4().hex
+        self.records[record_id] = {
+            "id": record_id, "name": name, "type": record_type,
+            "content": content, "proxied": proxied, "ttl": ttl
+        }
+        return record_id
+
+    def _create(self, fields):
+        record_id = uuid.uuid4().hex
+        record = {"proxied": False, "ttl": 1, **fields, "id": record_id}
+        self.records[record_id] = record
+        return record
+
+    def _list(self, query):
+        records = [
+            record for record in self.records.values()
+            if record["name"] == query.get("name", record["name"])
+            and record["type"] == query.get("type", record["type"])
+        ]
+        page = int(query.get("page", 1))
+        per_page = int(query.get("per_page", 100))
+        chunk = records[(page - 1) * per_page:page * per_page]
+        return 200, {
+            "success": True,
+            "result": chunk,
+            "result_info": {
+                "page": page, "per_page": per_page, "count": len(chunk), "total_count": len(records),
+                "total_pages": max(1, -(-len(records) // per_page))
+            }
+        }
+
+    def _batch(self, body):
+        if not self.batch_supported:
+            return 404, {"success": False, "errors": [{"code": 7003, "message": "No route for that URI"}]}
+        changes = sum(len(body.get(kind) or []) for kind in ("deletes", "patches", "puts", "posts"))
+        if changes > self.batch_limit:
+            return 400, {"success": False, "errors": [{"code": 81058, "message": "Too many changes in batch"}]}
+        for kind in ("deletes", "patches", "puts"):
+            if any(item["id"] not in self.records for item in body.get(kind) or []):
+                return 404, {"success": False, "errors": [RECORD_NOT_FOUND]}
+
+        result = {"deletes": [], "patches": [], "puts": [], "posts": []}
+        for item in body.get("deletes") or []:
+            result["deletes"].append(self.records.pop(item["id"]))
+        for item in body.get("patches") or []:
+            self.records[item["id"]].update(item)
+            result["patches"].append(dict(self.records[item["id"]]))
+        for item in body.get("puts") or []:
+            self.records[item["id"]] = {"proxied": False, "ttl": 1, **item}
+            result["puts"].append(dict(self.records[item["id"]]))
+        for item in body.get("posts") or []:
+            result["posts"].append(dict(self._create(item)))
+        return 200, {"success": True, "result": result}
+
+    def handle(self, method, path, query, body):
+        """Route one API call, returning (status, response body)"""
+        time.sleep(self.delay)
+        match = re.fullmatch(r"/client/v4/zones/[^/]+/dns_records(?:/([^/]+))?", path)
+        with self.lock:
+            if not match:
+                self.calls.append((method, path))
+                return 404, {"success": False, "errors": [{"code": 7003, "message": "No route for that URI"}]}
+            target = match.group(1)
+            endpoint = "dns_records" if target is None else "dns_records/batch" if target == "batch" else "dns_records/:id"
+            self.calls.append((method, endpoint))
+            if target is None and method == "GET":
+                return self._list(query)
+            if target is None and method == "POST":
+                return 200, {"success": True, "result": self._create(body)}
+            if target == "batch" and method == "POST":
+                return self._batch(body)
+            if target not in self.records:
+                return 404, {"success": False, "errors": [RECORD_NOT_FOUND]}
+            if method == "PUT":
+                self.records[target] = {"proxied": False, "ttl": 1, **body, "id": target}
+            elif method == "PATCH":
+                self.records[target].update(body)
+            return 200, {"success": True, "result": dict(self.records[target])}
+
+    def serve(self, port=0):
+        """Start the API in a background thread and return the HTTP server"""
+        api = self
+
+        class ApiHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out as separate writes; with Nagle on, keep-alive clients stall on delayed ACKs
+            disable_nagle_algorithm = True
+
+            def _respond(self):
+                url = urlsplit(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                status, response = api.handle(self.command, url.path, query, body)
+                payload = json.dumps(response).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_PUT = do_PATCH = _respond
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), ApiHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Cloudflare DNS records API")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--records", default="", help="Comma-separated A records to seed")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before each response")
+    parser.add_argument("--no-batch", action="store_true", help="Answer the batch endpoint with 404")
+    args = parser.parse_args()
+
+    api = FakeCloudflare(args.delay, batch_supported=not args.no_batch)
+    for name in filter(None, args.records.split(",")):
+        api.add_record(name.strip())
+    api.serve(args.port)
+    print(f"CLOUDFLARE_API_URL=http://127.0.0.1:{args.port}/client/v4 (any zone id and token)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        for method, endpoint in sorted(set(api.calls)):
+            print(f"{method} {endpoint}: {api.calls.count((method, endpoint))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Local stand-ins for public IP sources, for trying ddns.py without the internet.
+
+Serves an HTTP echo endpoint (/ answers the IPv4 address, /v6 the IPv6 one)
+and a DNS server answering any A/AAAA query with the same addresses, e.g.
+
+    python utils/stub_ip_sources.py --address 1.2.3.4 --delay 0.2
+    DDNS_IP_SOURCES=http://127.0.0.1:8088/,dns:127.0.0.1:5353/myip.opendns.com python ddns.py
+"""
+
+import time
+import socket
+import struct
+import argparse
+import threading
+import ipaddress
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def serve_http(port, address, address6, delay=0.0):
+    """Start the echo endpoint in a background thread and return the server"""
+    class EchoHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            body = f"{address6 if self.path.startswith('/v6') else address}\n".encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), EchoHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def serve_dns(port, address, address6, delay=0.0):
+    """Start the myip DNS responder in a background thread and return its socket"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", port))
+
+    def answer(query):
+        # Echo the question back with one answer pointing at it
+        offset = 12
+        while query[offset]:
+            offset += query[offset] + 1
+        question = query[12:offset + 5]
+        qtype = struct.unpack("!H", query[offset + 1:offset + 3])[0]
+        rdata = ipaddress.ip_address(address6 if qtype == 28 else address).packed
+        header = struct.pack("!HHHHHH", struct.unpack("!H", query[:2])[0], 0x8180, 1, 1, 0, 0)
+        record = struct.pack("!HHHIH", 0xC00C, qtype, 1, 0, len(rdata)) + rdata
+        return header + question + record
+
+    def loop():
+        while True:
+            query, client = sock.recvfrom(512)
+            time.sleep(delay)
+            sock.sendto(answer(query), client)
+
+    threading.Thread(target=loop, daemon=True).start()
+    return sock
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub public IP sources")
+    parser.add_argument("--address", default="1.2.3.4", help="IPv4 address to answer with")
+    parser.add_argument("--address6", default="2606:4700:4700::1111", help="IPv6 address to answer with")
+    parser.add_argument("--http-port", type=int, default=8088)
+    parser.add_argument("--dns-port", type=int, default=5353)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before each answer")
+    args = parser.parse_args()
+
+    serve_http(args.http_port, args.address, args.address6, args.delay)
+    serve_dns(args.dns_port, args.address, args.address6, args.delay)
+    print(f"HTTP echo on http://127.0.0.1:{args.http_port}/ (IPv6 on /v6), DNS on 127.0.0.1:{args.dns_port}")
+    print(f"DDNS_IP_SOURCES=http://127.0.0.1:{args.http_port}/,dns:127.0.0.1:{args.dns_port}/myip.opendns.com")
+    threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
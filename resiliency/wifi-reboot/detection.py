@@ -0,0 +1,83 @@
+"""
+Outage detectors for the internet monitor
+Decide when a run of failed probe rounds is a real outage worth a modem restart.
+"""
+
+import math
+
+
+class ThresholdDetector:
+    """Declare an outage after a fixed number of consecutive failed check cycles"""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.failures = 0
+
+    def observe(self, rounds):
+        """Feed one check cycle of round results, True once an outage is declared"""
+        # A cycle fails only if every round in it got no reply from any host
+        if any(rounds):
+            self.failures = 0
+        else:
+            self.failures += 1
+        return self.failures >= self.threshold
+
+    def reset(self):
+        """Start over after a restart"""
+        self.failures = 0
+
+    def describe(self):
+        """Progress towards an outage, for logs"""
+        return f"{self.failures}/{self.threshold}"
+
+
+class SprtDetector:
+    """
+    Sequential probability ratio test on probe round loss.
+
+    Each round (one probe to every host) is lost when no host replied. The
+    detector accumulates the log-likelihood ratio of "outage" (rounds lost
+    with probability outage_loss) against "healthy" (baseline_loss) and
+    declares an outage once the evidence reaches the bound for the requested
+    confidence. Evidence is floored at zero (CUSUM style), so a long healthy
+    stretch cannot bank credit against a later outage. An EWMA of round loss
+    is kept alongside for logging.
+    """
+
+    def __init__(self, baseline_loss, outage_loss, confidence, ewma_alpha=0.3):
+        if not 0 < baseline_loss < outage_loss < 1:
+            raise ValueError("Expected 0 < BASELINE_LOSS_RATIO < OUTAGE_LOSS_RATIO < 1")
+        if not 0.5 < confidence < 1:
+            raise ValueError("Expected 0.5 < DETECTION_CONFIDENCE < 1")
+        self.loss_weight = math.log(outage_loss / baseline_loss)
+        self.reply_weight = math.log((1 - outage_loss) / (1 - baseline_loss))
+        self.bound = math.log(confidence / (1 - confidence))
+        self.ewma_alpha = ewma_alpha
+        self.evidence = 0.0
+        self.loss_ewma = 0.0
+
+    def observe(self, rounds):
+        """Feed one check cycle of round results, True once an outage is declared"""
+        for replied in rounds:
+            self.loss_ewma += self.ewma_alpha * ((0.0 if replied else 1.0) - self.loss_ewma)
+            self.evidence = max(0.0, self.evidence + (self.reply_weight if replied else self.loss_weight))
+        # Judged on where the cycle ends, replies late in the burst count against an earlier crossing
+        return self.evidence >= self.bound
+
+    def reset(self):
+        """Start over after a restart"""
+        self.evidence = 0.0
+        self.loss_ewma = 0.0
+
+    def describe(self):
+        """Progress towards an outage, for logs"""
+        return f"evidence {self.evidence:.1f}/{self.bound:.1f}, loss {self.loss_ewma * 100:.0f}%"
+
+
+def create_detector(mode, failure_threshold, baseline_loss, outage_loss, confidence):
+    """Build the outage detector selected by DETECTION_MODE"""
+    if mode == 'threshold':
+        return ThresholdDetector(failure_threshold)
+    if mode == 'sprt':
+        return SprtDetector(baseline_loss, outage_loss, confidence)
+    raise ValueError(f"Unknown detection mode: {mode} (expected threshold, sprt)")
@@ -0,0 +1,254 @@
+"""
+Layered path diagnosis for the internet monitor
+Probes the default gateway, the first ISP hop, DNS and HTTP concurrently to locate the failing layer.
+"""
+
+import time
+import random
+import socket
+import struct
+import asyncio
+import logging
+import ipaddress
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+logger = logging.getLogger('internet-monitor')
+
+LAYERS = ('gateway', 'isp', 'dns', 'http')
+DEFAULT_STAGE_DEADLINES = 'gateway:1,isp:2,dns:2,http:5'
+
+# Not exported by the socket module, value from linux/in.h
+IP_RECVERR = getattr(socket, 'IP_RECVERR', 11)
+SO_EE_ORIGIN_ICMP = 2
+ICMP_TIME_EXCEEDED = 11
+TRACE_PORT = 33434
+MAX_TRACE_HOPS = 8
+# Pause after a trace that found no public hop before tracing again
+TRACE_RETRY_SECONDS = 300
+
+
+@dataclass
+class LayerStatus:
+    """Outcome of one diagnosis stage, ok is None when the stage could not run"""
+    layer: str
+    ok: bool = None
+    latency_seconds: float = None
+    error: str = None
+
+
+def parse_stage_deadlines(value):
+    """Parse 'layer:seconds,...' into a dict, missing layers keep their defaults"""
+    deadlines = {}
+    for item in (DEFAULT_STAGE_DEADLINES + ',' + value).split(','):
+        if item.strip():
+            layer, seconds = item.split(':')
+            deadlines[layer.strip()] = float(seconds)
+    return deadlines
+
+
+def public_trace_target(hosts, fallback):
+    """First public IPv4 address among the probed hosts, the trace has to leave the LAN to find the ISP hop"""
+    for host in hosts:
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            continue
+        if address.version == 4 and address.is_global:
+            return host
+    return fallback
+
+
+def default_gateway():
+    """IPv4 default gateway from the kernel routing table, or None"""
+    try:
+        with open('/proc/net/route') as f:
+            next(f)
+            for line in f:
+                fields = line.split()
+                if fields[1] == '00000000' and int(fields[3], 16) & 0x2:
+                    return socket.inet_ntoa(struct.pack('<L', int(fields[2], 16)))
+    except (OSError, StopIteration, IndexError, ValueError):
+        pass
+    return None
+
+
+class PathDiagnoser:
+    """Run the gateway, ISP hop, DNS and HTTP stages concurrently with per-stage deadlines"""
+
+    def __init__(self, prober, trace_target, isp_hop=None, dns_server='1.1.1.1',
+                 dns_name='example.com', http_url='http://connectivitycheck.gstatic.com/generate_204',
+                 stage_deadlines=None):
+        self.prober = prober
+        self.trace_target = trace_target
+        self.isp_hop = isp_hop
+        self.isp_hop_pinned = isp_hop is not None
+        self.discovery_task = None
+        self.next_discovery_at = 0.0
+        self.dns_server = dns_server
+        self.dns_name = dns_name
+        self.http_url = urlsplit(http_url)
+        self.stage_deadlines = stage_deadlines or parse_stage_deadlines('')
+
+    async def diagnose(self):
+        """Run every stage at once and return their statuses keyed by layer"""
+        stages = {
+            'gateway': self._check_gateway,
+            'isp': self._check_isp_hop,
+            'dns': self._check_dns,
+            'http': self._check_http,
+        }
+        statuses = await asyncio.gather(*(self._run_stage(layer, stages[layer]) for layer in LAYERS))
+        statuses = {status.layer: status for status in statuses}
+
+        # The cached hop stopped answering while traffic beyond it flows, so the route changed
+        if (not self.isp_hop_pinned and statuses['isp'].ok is False
+                and (statuses['dns'].ok or statuses['http'].ok)):
+            logger.info(f"ISP hop {self.isp_hop} no longer answers, rediscovering")
+            self.isp_hop = None
+        return statuses
+
+    async def _run_stage(self, layer, stage):
+        """Run one stage under its deadline and time it"""
+        deadline = self.stage_deadlines[layer]
+        started = time.perf_counter()
+        try:
+            ok, error = await asyncio.wait_for(stage(deadline), timeout=deadline)
+        except asyncio.TimeoutError:
+            ok, error = False, f"no answer within {deadline}s"
+        except OSError as e:
+            ok, error = False, str(e)
+        latency = time.perf_counter() - started if ok else None
+        return LayerStatus(layer, ok, latency, error)
+
+    async def _check_gateway(self, deadline):
+        """ICMP echo to the default gateway"""
+        gateway = default_gateway()
+        if gateway is None:
+            return False, "no default route"
+        result = await self.prober.probe(gateway, deadline)
+        return result.success, result.error
+
+    async def _check_isp_hop(self, deadline):
+        """ICMP echo to the first ISP hop, discovered in the background when unknown"""
+        if self.isp_hop is None:
+            # Tracing takes longer than a stage deadline, so report unknown until it finishes
+            if ((self.discovery_task is None or self.discovery_task.done())
+                    and time.monotonic() >= self.next_discovery_at):
+                self.discovery_task = asyncio.create_task(self._discover_in_background())
+            return None, "ISP hop unknown"
+        result = await self.prober.probe(self.isp_hop, deadline)
+        return result.success, result.error
+
+    async def _check_dns(self, deadline):
+        """UDP query for an A record, any NOERROR answer passes"""
+        query_id = random.getrandbits(16)
+        qname = b''.join(bytes([len(label)]) + label.encode() for label in self.dns_name.split('.')) + b'\x00'
+        query = struct.pack('!HHHHHH', query_id, 0x0100, 1, 0, 0, 0) + qname + struct.pack('!HH', 1, 1)
+
+        loop = asyncio.get_running_loop()
+        end = loop.time() + deadline
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            sock.connect((self.dns_server, 53))
+            await loop.sock_sendall(sock, query)
+            while True:
+                # Unrelated datagrams don't restart the clock
+                response = await asyncio.wait_for(loop.sock_recv(sock, 512), end - loop.time())
+                if len(response) < 12:
+                    continue
+                response_id, flags = struct.unpack('!HH', response[:4])
+                if response_id != query_id or not flags & 0x8000:
+                    continue
+                rcode = flags & 0x000F
+                return rcode == 0, None if rcode == 0 else f"rcode {rcode}"
+
+    async def _check_http(self, deadline):
+        """HTTP HEAD request, any HTTP status line passes"""
+        url = self.http_url
+        secure = url.scheme == 'https'
+        port = url.port or (443 if secure else 80)
+        loop = asyncio.get_running_loop()
+        end = loop.time() + deadline
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(url.hostname, port, ssl=secure or None), deadline
+        )
+        try:
+            writer.write(
+                f"HEAD {url.path or '/'} HTTP/1.1\r\nHost: {url.hostname}\r\n"
+                f"User-Agent: internet-monitor\r\nConnection: close\r\n\r\n".encode()
+            )
+            await writer.drain()
+            status_line = await asyncio.wait_for(reader.readline(), end - loop.time())
+        finally:
+            writer.close()
+        if not status_line.startswith(b'HTTP/'):
+            return False, "invalid HTTP response"
+        return True, None
+
+    async def _discover_in_background(self):
+        """Trace the path and remember the ISP hop for later cycles"""
+        hop = await self.discover_isp_hop()
+        if hop is None:
+            # Don't retrace every cycle while the path is down or the hops don't answer
+            self.next_discovery_at = time.monotonic() + TRACE_RETRY_SECONDS
+            logger.info(f"No ISP hop found towards {self.trace_target}, tracing again in {TRACE_RETRY_SECONDS}s")
+        elif self.isp_hop is None:
+            self.isp_hop = hop
+            logger.info(f"Discovered first ISP hop: {hop}")
+
+    async def discover_isp_hop(self):
+        """First public address on the path to the trace target, found with TTL-limited probes"""
+        for ttl in range(1, MAX_TRACE_HOPS + 1):
+            hop = await self._trace_hop(ttl)
+            if hop is not None and not ipaddress.ip_address(hop).is_private:
+                return hop
+        return None
+
+    async def _trace_hop(self, ttl, timeout=1):
+        """Address of the router that drops a UDP probe sent with the given TTL"""
+        loop = asyncio.get_running_loop()
+        replied = loop.create_future()
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, ttl)
+            sock.setsockopt(socket.IPPROTO_IP, IP_RECVERR, 1)
+            # ICMP errors land on the socket error queue, which wakes the selector
+            loop.add_reader(sock, lambda: replied.done() or replied.set_result(None))
+            try:
+                sock.sendto(b'internet-monitor', (self.trace_target, TRACE_PORT + ttl))
+                await asyncio.wait_for(replied, timeout)
+                _, ancillary, _, _ = sock.recvmsg(512, 512, socket.MSG_ERRQUEUE)
+            except (asyncio.TimeoutError, OSError):
+                return None
+            finally:
+                loop.remove_reader(sock)
+
+        for level, kind, data in ancillary:
+            if level != socket.IPPROTO_IP or kind != IP_RECVERR or len(data) < 24:
+                continue
+            _, origin, icmp_type, _, _, _, _ = struct.unpack('=IBBBBII', data[:16])
+            if origin == SO_EE_ORIGIN_ICMP and icmp_type == ICMP_TIME_EXCEEDED:
+                return socket.inet_ntoa(data[20:24])
+        return None
+
+
+def failing_layer(statuses):
+    """Nearest layer that failed, or None when every stage that ran passed"""
+    for layer in LAYERS:
+        if statuses[layer].ok is False:
+            return layer
+    return None
+
+
+def modem_suspected(statuses, modem_is_gateway=False):
+    """
+    Whether the modem link is the failing layer.
+
+    A dead gateway is a LAN problem, unless the modem is the gateway (a
+    combined modem/router), and an answering ISP hop or any working DNS/HTTP
+    stage proves the link through the modem is up.
+    """
+    if statuses['gateway'].ok is False and not modem_is_gateway:
+        return False
+    return not any(statuses[layer].ok for layer in ('isp', 'dns', 'http'))
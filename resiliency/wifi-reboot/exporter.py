@@ -0,0 +1,446 @@
+"""
+Metrics exporter for the internet monitor
+Prometheus metrics and a JSON /status endpoint served from their own thread, fed through a queue so a scrape never holds up a probe.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+from restarts import OUTCOMES
+
+logger = logging.getLogger('internet-monitor')
+
+OUTAGE_BUCKETS_IN_SECONDS = (10, 30, 60, 120, 300, 600, 1800, 3600, 7200, 21600)
+DETECT_BUCKETS_IN_SECONDS = (5, 10, 20, 30, 60, 120, 180, 300, 600, 1200)
+RECOVER_BUCKETS_IN_SECONDS = (15, 30, 60, 90, 120, 180, 240, 300, 450, 600, 900)
+
+
+class QueuedGauge:
+    """Gauge.set() stand-in for a plug's connected state, applied by the exporter thread"""
+
+    def __init__(self, exporter, site, device):
+        self.exporter = exporter
+        self.site = site
+        self.device = device
+
+    def set(self, value):
+        self.exporter.plug_connected(self.site, self.device, value)
+
+
+class SiteMetrics:
+    """
+    Producer side of the exporter for one site.
+
+    The monitor of a site reports through this, every event goes onto the
+    shared queue tagged with the site's label.
+    """
+
+    def __init__(self, exporter, site):
+        self.exporter = exporter
+        self.site = site
+
+    def probe(self, host, success, rtt_ms, jitter_ms, loss_ratio):
+        self.exporter.probe(self.site, host, success, rtt_ms, jitter_ms, loss_ratio)
+
+    def group(self, name, up, failures):
+        self.exporter.group(self.site, name, up, failures)
+
+    def check(self, up):
+        self.exporter.check(self.site, up)
+
+    def path_layer(self, layer, ok, latency_seconds):
+        self.exporter.path_layer(self.site, layer, ok, latency_seconds)
+
+    def power_off(self, latency_seconds):
+        self.exporter.power_off(self.site, latency_seconds)
+
+    def restarted(self, device):
+        self.exporter.restarted(self.site, device)
+
+    def detected(self, group, seconds):
+        self.exporter.detected(self.site, group, seconds)
+
+    def recovered(self, group, seconds):
+        self.exporter.recovered(self.site, group, seconds)
+
+    def restart_state(self, device, outcome, consecutive_ineffective, effectiveness, breaker_open):
+        self.exporter.restart_state(self.site, device, outcome, consecutive_ineffective, effectiveness, breaker_open)
+
+    def plug_gauge(self, device):
+        """Object for PlugHandle.connected_gauge that reports through the queue"""
+        return QueuedGauge(self.exporter, self.site, device)
+
+
+class MetricsExporter:
+    """
+    Owns the monitor's Prometheus metrics and current state.
+
+    The monitor only appends events to a deque (atomic under the GIL, no
+    lock on the probe path). A background thread drains it every
+    flush_interval_in_seconds and before every scrape, so metric locks
+    are only ever contended between the drain and the HTTP threads.
+
+    Every series carries a site label. A single monitor registers the
+    unnamed site (the label is left empty, which Prometheus drops), with
+    SITES_DIR each site registers its own and they share the queue, the
+    drain thread and the endpoint.
+
+    With PROMETHEUS_MULTIPROC_DIR set, /metrics aggregates every process
+    writing to that directory; /status always describes this process.
+    """
+
+    def __init__(self, rtt_buckets_in_ms, flush_interval_in_seconds=1.0):
+        self.flush_interval_in_seconds = flush_interval_in_seconds
+        self.events = deque()
+        self.lock = threading.Lock()
+        self.server = None
+        self.multiprocess_dir = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+
+        # Counters and histograms, names unchanged from the inline metrics they replace
+        self.ping_success_counter = Counter('ping_success_total', 'Successful ping attempts', ['site', 'host'])
+        self.ping_failure_counter = Counter('ping_failure_total', 'Failed ping attempts', ['site', 'host'])
+        self.ping_rtt_histogram = Histogram(
+            'ping_rtt_seconds', 'Round-trip time of successful pings', ['site', 'host'],
+            buckets=[bucket / 1000 for bucket in rtt_buckets_in_ms]
+        )
+        self.internet_up_counter = Counter('internet_up_total', 'Internet connectivity checks that passed', ['site'])
+        self.internet_down_counter = Counter('internet_down_total', 'Internet connectivity checks that failed', ['site'])
+        self.modem_restart_counter = Counter('modem_restart_total', 'Number of modem restarts triggered', ['site'])
+        self.modem_restart_latency_histogram = Histogram(
+            'modem_restart_latency_seconds', 'Seconds from restart trigger until the plug confirmed power off', ['site'],
+            buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+        )
+        self.device_restart_counter = Counter('device_restart_total', 'Power cycles per device', ['site', 'device'])
+        self.restart_outcome_counter = Counter(
+            'restart_outcome_total', 'Resolved power cycles by whether connectivity came back', ['site', 'device', 'outcome']
+        )
+        self.outage_duration_histogram = Histogram(
+            'probe_group_outage_duration_seconds', 'Duration of finished probe group outages', ['site', 'group'],
+            buckets=OUTAGE_BUCKETS_IN_SECONDS
+        )
+        self.time_to_detect_histogram = Histogram(
+            'outage_time_to_detect_seconds', 'Seconds from the last passing check until a restart was triggered', ['site', 'group'],
+            buckets=DETECT_BUCKETS_IN_SECONDS
+        )
+        self.time_to_recover_histogram = Histogram(
+            'outage_time_to_recover_seconds', 'Seconds from a restart trigger until the group passed a check again', ['site', 'group'],
+            buckets=RECOVER_BUCKETS_IN_SECONDS
+        )
+
+        # State gauges, in multiprocess mode only live processes count
+        def state_gauge(name, documentation, labels=()):
+            return Gauge(name, documentation, labels, multiprocess_mode='livemostrecent')
+        self.ping_jitter_gauge = state_gauge('ping_jitter_seconds', 'Mean RTT variation over the rolling window', ['site', 'host'])
+        self.ping_loss_gauge = state_gauge('ping_loss_ratio', 'Fraction of pings lost over the rolling window', ['site', 'host'])
+        self.internet_up_gauge = state_gauge('internet_status', 'Whether every probe group answered last cycle', ['site'])
+        self.group_up_gauge = state_gauge('probe_group_up', 'Whether any host in the probe group answered last cycle', ['site', 'group'])
+        self.group_failures_gauge = state_gauge(
+            'probe_group_consecutive_failures', 'Consecutive failed checks of the probe group', ['site', 'group']
+        )
+        self.last_outage_gauge = state_gauge(
+            'probe_group_last_outage_duration_seconds', 'Duration of the last finished outage of the probe group', ['site', 'group']
+        )
+        self.since_restart_gauge = state_gauge(
+            'device_seconds_since_restart', 'Seconds since the device was last power cycled', ['site', 'device']
+        )
+        self.plug_connected_gauge = state_gauge('plug_connected', 'Whether a warm smart plug connection is cached', ['site', 'device'])
+        self.restart_effectiveness_gauge = state_gauge(
+            'restart_effectiveness_ratio', 'Share of the remembered power cycles that brought the group back', ['site', 'device']
+        )
+        self.restart_ineffective_gauge = state_gauge(
+            'restart_consecutive_ineffective', 'Power cycles in a row that did not bring the group back', ['site', 'device']
+        )
+        self.restart_breaker_gauge = state_gauge(
+            'restart_breaker_open', 'Whether restarts of the device are paused after too many ineffective ones', ['site', 'device']
+        )
+        self.path_layer_up_gauge = state_gauge('path_layer_up', 'Whether the diagnosis stage for the layer passed', ['site', 'layer'])
+        self.path_layer_latency_gauge = state_gauge(
+            'path_layer_latency_seconds', 'Latency of the last passing diagnosis stage', ['site', 'layer']
+        )
+
+        # Snapshot served by /status per site, only touched under the lock
+        self.sites = {}
+        threading.Thread(target=self._flush_periodically, name='metrics-flush', daemon=True).start()
+
+    def site(self, name, hosts, groups, devices):
+        """Register a site and return the SiteMetrics its monitor reports through"""
+        with self.lock:
+            self.sites[name] = {
+                'up': True,
+                'checks': 0,
+                'groups': {group: self._new_group_state() for group in groups},
+                'devices': {device: self._new_device_state() for device in devices},
+                'hosts': {host: {'success': None, 'rtt_ms': None, 'jitter_ms': 0.0, 'loss_ratio': 0.0} for host in hosts},
+                'path': {},
+            }
+
+            # Initialize all metrics to ensure they exist from startup
+            for host in hosts:
+                self.ping_success_counter.labels(site=name, host=host).inc(0)
+                self.ping_failure_counter.labels(site=name, host=host).inc(0)
+                self.ping_jitter_gauge.labels(site=name, host=host).set(0)
+                self.ping_loss_gauge.labels(site=name, host=host).set(0)
+            for group in groups:
+                self.group_up_gauge.labels(site=name, group=group).set(1)
+                self.group_failures_gauge.labels(site=name, group=group).set(0)
+            for device in devices:
+                self.plug_connected_gauge.labels(site=name, device=device).set(0)
+                self.device_restart_counter.labels(site=name, device=device).inc(0)
+                for outcome in OUTCOMES:
+                    self.restart_outcome_counter.labels(site=name, device=device, outcome=outcome).inc(0)
+                self.restart_ineffective_gauge.labels(site=name, device=device).set(0)
+                self.restart_breaker_gauge.labels(site=name, device=device).set(0)
+            self.internet_up_gauge.labels(site=name).set(1)
+            self.internet_up_counter.labels(site=name).inc(0)
+            self.internet_down_counter.labels(site=name).inc(0)
+            self.modem_restart_counter.labels(site=name).inc(0)
+        return SiteMetrics(self, name)
+
+    # Producer side, called from the event loop: append and return
+
+    def probe(self, site, host, success, rtt_ms, jitter_ms, loss_ratio):
+        self.events.append((self._apply_probe, (site, host, success, rtt_ms, jitter_ms, loss_ratio)))
+
+    def group(self, site, name, up, failures):
+        self.events.append((self._apply_group, (site, name, up, failures, time.monotonic())))
+
+    def check(self, site, up):
+        self.events.append((self._apply_check, (site, up)))
+
+    def path_layer(self, site, layer, ok, latency_seconds):
+        self.events.append((self._apply_path_layer, (site, layer, ok, latency_seconds)))
+
+    def power_off(self, site, latency_seconds):
+        self.events.append((self._apply_power_off, (site, latency_seconds)))
+
+    def restarted(self, site, device):
+        self.events.append((self._apply_restarted, (site, device, time.monotonic())))
+
+    def plug_connected(self, site, device, value):
+        self.events.append((self._apply_plug_connected, (site, device, value)))
+
+    def detected(self, site, group, seconds):
+        self.events.append((self._apply_detected, (site, group, seconds)))
+
+    def recovered(self, site, group, seconds):
+        self.events.append((self._apply_recovered, (site, group, seconds)))
+
+    def restart_state(self, site, device, outcome, consecutive_ineffective, effectiveness, breaker_open):
+        self.events.append((
+            self._apply_restart_state, (site, device, outcome, consecutive_ineffective, effectiveness, breaker_open)
+        ))
+
+    # Consumer side, called with the lock held
+
+    def _apply_probe(self, site, host, success, rtt_ms, jitter_ms, loss_ratio):
+        if success:
+            self.ping_success_counter.labels(site=site, host=host).inc()
+            if rtt_ms is not None:
+                self.ping_rtt_histogram.labels(site=site, host=host).observe(rtt_ms / 1000)
+        else:
+            self.ping_failure_counter.labels(site=site, host=host).inc()
+        self.ping_jitter_gauge.labels(site=site, host=host).set(jitter_ms / 1000)
+        self.ping_loss_gauge.labels(site=site, host=host).set(loss_ratio)
+        self.sites[site]['hosts'][host] = {
+            'success': success, 'rtt_ms': rtt_ms, 'jitter_ms': jitter_ms, 'loss_ratio': loss_ratio
+        }
+
+    @staticmethod
+    def _new_group_state():
+        return {
+            'up': True, 'consecutive_failures': 0, 'down_since': None, 'last_outage_seconds': None,
+            'last_time_to_detect_seconds': None, 'last_time_to_recover_seconds': None,
+        }
+
+    @staticmethod
+    def _new_device_state():
+        return {
+            'connected': False, 'restarts': 0, 'restarted_at': None,
+            'consecutive_ineffective_restarts': 0, 'restart_effectiveness': None, 'restart_breaker_open': False,
+        }
+
+    def _apply_group(self, site, name, up, failures, at):
+        state = self.sites[site]['groups'].setdefault(name, self._new_group_state())
+        if not up and state['down_since'] is None:
+            state['down_since'] = at
+        elif up and state['down_since'] is not None:
+            # Outage lasted from the first failed check until this passing one
+            duration = at - state['down_since']
+            state['down_since'] = None
+            state['last_outage_seconds'] = duration
+            self.outage_duration_histogram.labels(site=site, group=name).observe(duration)
+            self.last_outage_gauge.labels(site=site, group=name).set(duration)
+        state['up'] = up
+        state['consecutive_failures'] = failures
+        self.group_up_gauge.labels(site=site, group=name).set(1 if up else 0)
+        self.group_failures_gauge.labels(site=site, group=name).set(failures)
+
+    def _apply_detected(self, site, group, seconds):
+        self.time_to_detect_histogram.labels(site=site, group=group).observe(seconds)
+        self.sites[site]['groups'].setdefault(group, self._new_group_state())['last_time_to_detect_seconds'] = seconds
+
+    def _apply_recovered(self, site, group, seconds):
+        self.time_to_recover_histogram.labels(site=site, group=group).observe(seconds)
+        self.sites[site]['groups'].setdefault(group, self._new_group_state())['last_time_to_recover_seconds'] = seconds
+
+    def _apply_check(self, site, up):
+        if up:
+            self.internet_up_counter.labels(site=site).inc()
+        else:
+            self.internet_down_counter.labels(site=site).inc()
+        self.internet_up_gauge.labels(site=site).set(1 if up else 0)
+        self.sites[site]['up'] = up
+        self.sites[site]['checks'] += 1
+
+    def _apply_path_layer(self, site, layer, ok, latency_seconds):
+        self.path_layer_up_gauge.labels(site=site, layer=layer).set(1 if ok else 0)
+        if ok:
+            self.path_layer_latency_gauge.labels(site=site, layer=layer).set(latency_seconds)
+        self.sites[site]['path'][layer] = {'ok': ok, 'latency_seconds': latency_seconds if ok else None}
+
+    def _apply_power_off(self, site, latency_seconds):
+        self.modem_restart_latency_histogram.labels(site=site).observe(latency_seconds)
+
+    def _apply_restarted(self, site, device, at):
+        self.modem_restart_counter.labels(site=site).inc()
+        self.device_restart_counter.labels(site=site, device=device).inc()
+        state = self.sites[site]['devices'].setdefault(device, self._new_device_state())
+        state['restarts'] += 1
+        state['restarted_at'] = at
+
+    def _apply_plug_connected(self, site, device, value):
+        self.plug_connected_gauge.labels(site=site, device=device).set(value)
+        self.sites[site]['devices'].setdefault(device, self._new_device_state())['connected'] = bool(value)
+
+    def _apply_restart_state(self, site, device, outcome, consecutive_ineffective, effectiveness, breaker_open):
+        if outcome is not None:
+            self.restart_outcome_counter.labels(site=site, device=device, outcome=outcome).inc()
+        if effectiveness is not None:
+            self.restart_effectiveness_gauge.labels(site=site, device=device).set(effectiveness)
+        self.restart_ineffective_gauge.labels(site=site, device=device).set(consecutive_ineffective)
+        self.restart_breaker_gauge.labels(site=site, device=device).set(1 if breaker_open else 0)
+        state = self.sites[site]['devices'].setdefault(device, self._new_device_state())
+        state['consecutive_ineffective_restarts'] = consecutive_ineffective
+        state['restart_effectiveness'] = effectiveness
+        state['restart_breaker_open'] = breaker_open
+
+    def flush(self):
+        """Apply every queued event and refresh the time-based gauges"""
+        with self.lock:
+            while True:
+                try:
+                    apply, args = self.events.popleft()
+                except IndexError:
+                    break
+                try:
+                    apply(*args)
+                except Exception as e:
+                    logger.error(f"Failed to apply metrics update {apply.__name__}: {e}")
+            now = time.monotonic()
+            for site, site_state in self.sites.items():
+                for device, state in site_state['devices'].items():
+                    if state['restarted_at'] is not None:
+                        self.since_restart_gauge.labels(site=site, device=device).set(now - state['restarted_at'])
+
+    def status(self):
+        """Current state as a JSON-serializable dict, keyed by site unless this is a single unnamed one"""
+        self.flush()
+        with self.lock:
+            now = time.monotonic()
+            sites = {name: self._site_status(state, now) for name, state in self.sites.items()}
+        if list(sites) == ['']:
+            return sites['']
+        return {'sites': sites}
+
+    @staticmethod
+    def _site_status(site, now):
+        """/status of one site"""
+        return {
+            'up': site['up'],
+            'checks': site['checks'],
+            'groups': {
+                name: {
+                    'up': state['up'],
+                    'consecutive_failures': state['consecutive_failures'],
+                    'down_for_seconds': None if state['down_since'] is None else round(now - state['down_since'], 3),
+                    'last_outage_seconds': state['last_outage_seconds'],
+                    'last_time_to_detect_seconds': state['last_time_to_detect_seconds'],
+                    'last_time_to_recover_seconds': state['last_time_to_recover_seconds'],
+                }
+                for name, state in site['groups'].items()
+            },
+            'devices': {
+                name: {
+                    'connected': state['connected'],
+                    'restarts': state['restarts'],
+                    'seconds_since_restart': (
+                        None if state['restarted_at'] is None else round(now - state['restarted_at'], 3)
+                    ),
+                    'consecutive_ineffective_restarts': state['consecutive_ineffective_restarts'],
+                    'restart_effectiveness': state['restart_effectiveness'],
+                    'restart_breaker_open': state['restart_breaker_open'],
+                }
+                for name, state in site['devices'].items()
+            },
+            'hosts': {name: dict(state) for name, state in site['hosts'].items()},
+            'path': {name: dict(state) for name, state in site['path'].items()},
+        }
+
+    def metrics(self):
+        """Prometheus text exposition of every metric"""
+        self.flush()
+        if self.multiprocess_dir:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            return generate_latest(registry)
+        with self.lock:
+            return generate_latest(REGISTRY)
+
+    def _flush_periodically(self):
+        """Background thread: drain the queue so it never grows between scrapes"""
+        while True:
+            time.sleep(self.flush_interval_in_seconds)
+            self.flush()
+
+    def serve(self, port, address='0.0.0.0'):
+        """Start /metrics and /status on their own threads"""
+        exporter = self
+
+        class ExporterHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?')[0]
+                if path == '/metrics':
+                    body, content_type = exporter.metrics(), CONTENT_TYPE_LATEST
+                elif path == '/status':
+                    body, content_type = json.dumps(exporter.status()).encode(), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((address, port), ExporterHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name='metrics-server', daemon=True).start()
+
+    def close(self):
+        """Stop serving and drop this process from multiprocess aggregation"""
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.multiprocess_dir:
+            multiprocess.mark_process_dead(os.getpid())
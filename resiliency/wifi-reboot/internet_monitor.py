@@ -7,16 +7,28 @@ Monitors internet connectivity and power cycles modem when failures detected.
 import os
 import sys
 import asyncio
-import subprocess
 import logging
 import random
+import socket
+import struct
 import time
 import argparse
 from datetime import datetime
 
-from kasa import Discover
-from dotenv import load_dotenv
-from prometheus_client import Counter, start_http_server
+# python-kasa, prometheus_client and python-dotenv are imported where first needed, see plug.py and exporter.py
+from probers import create_prober
+from detection import create_detector
+from scheduler import create_scheduler
+from plug import PlugHandle
+from inventory import KasaInventory
+from restarts import RestartController
+from topology import default_topology, load_topology, responsible_groups
+from store import ProbeStore, replay
+from rolling_stats import RollingStats, RttWindow, window_for
+from diagnosis import (
+    LAYERS, PathDiagnoser, failing_layer, modem_suspected, parse_stage_deadlines, public_trace_target
+)
+from sites import current_site, configure_site_logging, load_sites, run_sites
 
 # Configure logging (will be updated based on test mode in constructor)
 logging.basicConfig(
@@ -25,45 +37,180 @@ logging.basicConfig(
 )
 logger = logging.getLogger('internet-monitor')
 
+DEFAULT_RTT_BUCKETS_IN_MS = '5,10,20,30,50,75,100,150,250,500,1000,2500'
+
+
+def state_file(value, default):
+    """State file setting: unset or empty keeps the default, 'none' keeps the state in memory only"""
+    value = value or default
+    return None if value.lower() == 'none' else value
+
+
 class InternetMonitor:
-    def __init__(self, test_mode=False, metrics_enabled=False):
+    def __init__(self, test_mode=False, metrics_enabled=False, site='', config=None, prober=None, exporter=None):
         self.test_mode = test_mode
         self.metrics_enabled = metrics_enabled
+        # Name under SITES_DIR, empty for a single monitor configured by the environment
+        self.site = site
         
         # Set logging level based on test mode
         if self.test_mode:
             logging.getLogger().setLevel(logging.DEBUG)
         
-        # Load test environment if in test mode
-        if self.test_mode:
+        # Load test environment if in test mode, site configs come from their own files
+        if self.test_mode and config is None:
+            from dotenv import load_dotenv
             load_dotenv('test.env')
             print("Loaded test configuration from test.env")
         
-        # Load configuration from environment variables
-        self.plug_ip = os.getenv('PLUG_IP')
-        self.check_interval_in_seconds = int(os.getenv('CHECK_INTERVAL_IN_SECONDS'))
-        self.failure_threshold = int(os.getenv('FAILURE_THRESHOLD'))
-        self.test_hosts = os.getenv('TEST_HOSTS').split(',')
-        self.restart_delay_in_seconds = int(os.getenv('RESTART_DELAY_IN_SECONDS'))
-        self.recovery_wait_in_seconds = int(os.getenv('RECOVERY_WAIT_IN_SECONDS'))
+        # Load configuration from environment variables, or the site's config
+        getenv = (os.environ if config is None else config).get
+        # PLUG_NAME (alias or MAC) follows the plug across DHCP changes, PLUG_IP pins an address
+        self.plug_ip = getenv('PLUG_NAME') or getenv('PLUG_IP')
+        self.check_interval_in_seconds = int(getenv('CHECK_INTERVAL_IN_SECONDS'))
+        self.failure_threshold = int(getenv('FAILURE_THRESHOLD'))
+        self.restart_delay_in_seconds = int(getenv('RESTART_DELAY_IN_SECONDS'))
+        self.recovery_wait_in_seconds = int(getenv('RECOVERY_WAIT_IN_SECONDS'))
+        self.check_deadline_in_seconds = float(getenv('CHECK_DEADLINE_IN_SECONDS') or '5')
+        self.stop_on_first_success = (getenv('STOP_ON_FIRST_SUCCESS') or 'false').lower() == 'true'
+        self.probe_timeout_in_seconds = float(getenv('PROBE_TIMEOUT_IN_SECONDS') or '3')
+        self.prober = prober or create_prober(getenv('PROBE_BACKEND') or 'auto')
+        self.rtt_buckets_in_ms = [float(b) for b in (getenv('RTT_BUCKETS_IN_MS') or DEFAULT_RTT_BUCKETS_IN_MS).split(',')]
+        self.rtt_window_size = int(getenv('RTT_WINDOW_SIZE') or '60')
+        
+        self.burst_probes = int(getenv('BURST_PROBES') or '1')
+        self.burst_gap_in_seconds = int(getenv('BURST_GAP_IN_MS') or '200') / 1000
+        self.detection_mode = getenv('DETECTION_MODE') or 'threshold'
+        self.baseline_loss_ratio = float(getenv('BASELINE_LOSS_RATIO') or '0.05')
+        self.outage_loss_ratio = float(getenv('OUTAGE_LOSS_RATIO') or '0.9')
+        self.detection_confidence = float(getenv('DETECTION_CONFIDENCE') or '0.999')
+        
+        # How long to sleep between check cycles, fixed or adapting to how things are going
+        self.scheduler = create_scheduler(
+            getenv('SCHEDULE_MODE') or 'fixed',
+            self.check_interval_in_seconds,
+            max_interval=int(getenv('MAX_CHECK_INTERVAL_IN_SECONDS') or '180'),
+            failing_interval=int(getenv('FAILING_CHECK_INTERVAL_IN_SECONDS') or '10'),
+            recovery_poll_interval=int(getenv('RECOVERY_POLL_INTERVAL_IN_SECONDS') or '5'),
+            jitter_ratio=float(getenv('CHECK_JITTER_RATIO') or '0.1')
+        )
+        
+        # Probe groups and the plugs behind them, a single modem group unless a topology is given
+        self.topology_file = getenv('TOPOLOGY_FILE')
+        if self.topology_file:
+            self.groups = load_topology(self.topology_file)
+        else:
+            self.groups = default_topology(getenv('TEST_HOSTS').split(','), self.plug_ip)
+        self.test_hosts = list(dict.fromkeys(host for group in self.groups for host in group.hosts))
+        
+        # Optional gateway -> ISP hop -> DNS -> HTTP diagnosis gating modem restarts
+        self.path_diagnosis = getenv('PATH_DIAGNOSIS', 'false').lower() == 'true'
+        # The single plug setup powers a combined modem/router, so a dead gateway doesn't clear the modem there
+        modem_is_gateway = getenv('MODEM_IS_GATEWAY') or ('false' if self.topology_file else 'true')
+        self.modem_is_gateway = modem_is_gateway.lower() == 'true'
+        if self.path_diagnosis:
+            dns_server = getenv('DNS_PROBE_SERVER') or '1.1.1.1'
+            self.diagnoser = PathDiagnoser(
+                self.prober,
+                trace_target=public_trace_target(self.test_hosts, dns_server),
+                isp_hop=getenv('ISP_HOP') or None,
+                dns_server=dns_server,
+                dns_name=getenv('DNS_PROBE_NAME') or 'example.com',
+                http_url=getenv('HTTP_PROBE_URL') or 'http://connectivitycheck.gstatic.com/generate_204',
+                stage_deadlines=parse_stage_deadlines(getenv('PATH_STAGE_DEADLINES_IN_SECONDS', ''))
+            )
+        else:
+            self.diagnoser = None
+        
+        # Kasa devices by MAC, so plugs named by alias or MAC are found at their current address
+        self.inventory = KasaInventory(
+            cache_file=state_file(getenv('KASA_INVENTORY_FILE'), '.kasa-inventory.json'),
+            subnets=(getenv('DISCOVERY_SUBNETS') or '255.255.255.255').split(','),
+            timeout_in_seconds=int(getenv('DISCOVERY_TIMEOUT_IN_SECONDS') or '5'),
+            username=getenv('KASA_USERNAME') or None,
+            password=getenv('KASA_PASSWORD') or None
+        )
+        
+        # Each plug is discovered once and kept warm so restarts skip discovery
+        self.plugs = {}
+        for group in self.groups:
+            if group.plug_ip and group.plug_ip not in self.plugs:
+                self.plugs[group.plug_ip] = PlugHandle(
+                    group.plug_ip,
+                    name=group.device,
+                    health_check_interval_in_seconds=int(getenv('PLUG_HEALTH_CHECK_INTERVAL_IN_SECONDS') or '60'),
+                    max_backoff_in_seconds=int(getenv('PLUG_MAX_BACKOFF_IN_SECONDS') or '300'),
+                    inventory=self.inventory,
+                    username=self.inventory.username,
+                    password=self.inventory.password
+                )
+            group.plug = self.plugs.get(group.plug_ip)
+            group.detector = self.new_detector()
         
-        # Initialize Prometheus metrics if enabled (after test_hosts is loaded)
+        # Outcome of every power cycle, persisted so backoff and the breaker survive service restarts
+        self.restarts = RestartController(
+            state_file=state_file(getenv('RESTART_STATE_FILE'), '.restart-state.json'),
+            history_size=int(getenv('RESTART_HISTORY_SIZE') or '50'),
+            recovery_window_in_seconds=int(getenv('RESTART_RECOVERY_WINDOW_IN_SECONDS') or '600'),
+            backoff_base_in_seconds=int(getenv('RESTART_BACKOFF_BASE_IN_SECONDS') or '300'),
+            backoff_max_in_seconds=int(getenv('RESTART_BACKOFF_MAX_IN_SECONDS') or '3600'),
+            breaker_threshold=int(getenv('RESTART_BREAKER_THRESHOLD') or '5'),
+            breaker_cooldown_in_seconds=int(getenv('RESTART_BREAKER_COOLDOWN_IN_SECONDS') or '21600')
+        )
+        
+        # Rolling RTT/loss windows used for the jitter and loss gauges
+        self.rtt_windows = {host: RttWindow(self.rtt_window_size) for host in self.test_hosts}
+        
+        # Prometheus metrics and /status, updated off the probe path (after test_hosts is loaded)
         if self.metrics_enabled:
-            self._initialize_prom_metrics(self.test_hosts)
+            if exporter is None:
+                from exporter import MetricsExporter
+                exporter = MetricsExporter(
+                    self.rtt_buckets_in_ms,
+                    flush_interval_in_seconds=float(getenv('METRICS_FLUSH_INTERVAL_IN_SECONDS') or '1')
+                )
+            # Shared with the other sites, this monitor reports through its own site's view of it
+            self.metrics_exporter = exporter
+            self.exporter = exporter.site(
+                self.site,
+                self.test_hosts,
+                [group.name for group in self.groups],
+                [plug.name for plug in self.plugs.values()]
+            )
+            self.restarts.exporter = self.exporter
+            for plug in self.plugs.values():
+                plug.connected_gauge = self.exporter.plug_gauge(plug.name)
+                self.restarts.report(plug.name)
         else:
-            self.ping_success_counter = None
-            self.ping_failure_counter = None
-            self.internet_up_counter = None
-            self.internet_down_counter = None
-            self.modem_restart_counter = None
+            self.metrics_exporter = None
+            self.exporter = None
         
-        # Stats tracking for production
-        self.stats = {host: {'success': 0, 'total': 0} for host in self.test_hosts}
-        self.last_stats_report = time.time()
+        # Optional on-disk probe history, kept across service restarts for --replay
+        self.probe_store_dir = getenv('PROBE_STORE_DIR')
+        if self.probe_store_dir:
+            self.probe_store = ProbeStore(
+                self.probe_store_dir,
+                segment_records=int(getenv('PROBE_STORE_SEGMENT_RECORDS') or '65536'),
+                retention_days=int(getenv('PROBE_STORE_RETENTION_DAYS') or '90')
+            )
+        else:
+            self.probe_store = None
+        self.probe_store_failing = False
+        # Seeded from the clock so cycle ids stay distinct across service restarts
+        self.cycle_id = int(time.time())
+        
+        # Rolling 1m/5m/1h stats, reported on a timer in production
+        self.stats = RollingStats(self.test_hosts)
+        self.stats_report_interval_in_seconds = int(getenv('STATS_REPORT_INTERVAL_IN_SECONDS') or '3600')
+        # Each report covers the shortest window spanning the time since the previous one
+        self.stats_report_window = window_for(self.stats_report_interval_in_seconds)
+        
+        # Resident DDNS updater to nudge when connectivity comes back, the public IP may have changed
+        self.ddns_notify_socket = getenv('DDNS_NOTIFY_SOCKET')
         
         # Outage simulation for test mode only
         if self.test_mode:
-            self.simulate_outage = os.getenv('SIMULATE_OUTAGE', 'false').lower() == 'true'
+            self.simulate_outage = getenv('SIMULATE_OUTAGE', 'false').lower() == 'true'
             self.start_time = time.time()
             self.outage_trigger_time = None
             self.outage_recovery_time = None
@@ -76,28 +223,29 @@ class InternetMonitor:
                 logger.info(f"Outage simulation enabled - will trigger at {int(self.outage_trigger_time - self.start_time)}s")
         
         logger.info("Internet Monitor Starting:")
-        logger.info(f"  Smart Plug: {self.plug_ip}")
-        logger.info(f"  Check Interval: {self.check_interval_in_seconds}s")
+        for group in self.groups:
+            plug = group.plug_ip or 'no plug'
+            logger.info(f"  {group.label}: {', '.join(group.hosts)} -> {plug}")
+        logger.info(f"  Check Interval: {self.scheduler.describe()}")
         logger.info(f"  Failure Threshold: {self.failure_threshold}")
-        logger.info(f"  Test Hosts: {', '.join(self.test_hosts)}")
-        
-    def _initialize_prom_metrics(self, hosts):
-        """Initialize Prometheus metrics and ensure they exist from startup"""
-        self.ping_success_counter = Counter('ping_success_total', 'Successful ping attempts', ['host'])
-        self.ping_failure_counter = Counter('ping_failure_total', 'Failed ping attempts', ['host'])
-        self.internet_up_counter = Counter('internet_up_total', 'Internet connectivity checks that passed')
-        self.internet_down_counter = Counter('internet_down_total', 'Internet connectivity checks that failed')
-        self.modem_restart_counter = Counter('modem_restart_total', 'Number of modem restarts triggered')
-        
-        # Initialize all metrics to ensure they exist from startup
-        for host in hosts:
-            self.ping_success_counter.labels(host=host).inc(0)
-            self.ping_failure_counter.labels(host=host).inc(0)
-        self.internet_up_counter.inc(0)
-        self.internet_down_counter.inc(0)
-        self.modem_restart_counter.inc(0)
-        
-    def ping_test(self, host):
+        logger.info(f"  Detection: {self.detection_mode} ({self.burst_probes} probes/host per cycle)")
+        logger.info(f"  Check Deadline: {self.check_deadline_in_seconds}s")
+        logger.info(f"  Probe Backend: {self.prober.name}")
+        if self.diagnoser is not None:
+            gateway = "modem is the gateway" if self.modem_is_gateway else "dead gateway vetoes modem restarts"
+            logger.info(f"  Path Diagnosis: ISP hop traced towards {self.diagnoser.trace_target}, {gateway}")
+        
+    def new_detector(self):
+        """Build a fresh outage detector from the configured detection settings"""
+        return create_detector(
+            self.detection_mode,
+            self.failure_threshold,
+            baseline_loss=self.baseline_loss_ratio,
+            outage_loss=self.outage_loss_ratio,
+            confidence=self.detection_confidence
+        )
+    
+    async def ping_test(self, host, round_index=0):
         """Test connectivity to a single host"""
         # Outage simulation (test mode only)
         if self.test_mode:
@@ -121,149 +269,325 @@ class InternetMonitor:
             # If outage is active, simulate failure
             if self.outage_active:
                 logger.debug(f"✗ {host} failed (simulated outage)")
+                self._record_result(host, False, round_index=round_index)
                 return False
         
         success = False
+        rtt_ms = None
         try:
             if self.test_mode:
                 logger.debug(f"Pinging {host}...")
             
-            result = subprocess.run(
-                ['ping', '-c', '1', '-W', '3', host], 
-                capture_output=True, 
-                timeout=5,
-                text=True
-            )
-            
-            success = result.returncode == 0
+            result = await self.prober.probe(host, self.probe_timeout_in_seconds)
+            success = result.success
+            rtt_ms = result.rtt_ms
             
             if self.test_mode:
                 if success:
-                    # Extract ping time from output
-                    output_lines = result.stdout.strip().split('\n')
-                    ping_line = next((line for line in output_lines if 'time=' in line), '')
-                    if ping_line:
-                        time_part = ping_line.split('time=')[1].split()[0]
-                        logger.debug(f"✓ {host} responded in {time_part}")
+                    if rtt_ms is not None:
+                        logger.debug(f"✓ {host} responded in {rtt_ms:.2f}ms")
                     else:
                         logger.debug(f"✓ {host} responded (no timing info)")
                 else:
-                    logger.debug(f"✗ {host} failed (exit code: {result.returncode})")
+                    logger.debug(f"✗ {host} failed ({result.error})")
             
-        except subprocess.TimeoutExpired:
-            if self.test_mode:
-                logger.debug(f"✗ {host} timed out (>5s)")
-            success = False
         except Exception as e:
             logger.error(f"Ping error to {host}: {e}")
             success = False
         
+        self._record_result(host, success, rtt_ms, round_index)
+        return success
+    
+    def _record_result(self, host, success, rtt_ms=None, round_index=0):
+        """Update logged stats, probe history and Prometheus metrics for a single probe"""
+        if self.probe_store is not None:
+            try:
+                self.probe_store.append(time.time(), self.cycle_id, round_index, host, success, rtt_ms)
+                if self.probe_store_failing:
+                    logger.info(f"Probe history writes to {self.probe_store_dir} working again")
+                    self.probe_store_failing = False
+            except (OSError, ValueError, struct.error) as e:
+                # A full disk or a damaged segment costs history, never the checks
+                if not self.probe_store_failing:
+                    logger.error(f"Failed to store probe result in {self.probe_store_dir}: {e}")
+                    self.probe_store_failing = True
+        
+        window = self.rtt_windows[host]
+        window.add(success, rtt_ms)
+        
         # Update logged stats
-        if not self.test_mode:
-            self.stats[host]['total'] += 1
-            if success:
-                self.stats[host]['success'] += 1
-            
-            # Report hourly stats
-            current_time = time.time()
-            if current_time - self.last_stats_report >= 3600:  # 1 hour
-                self.report_hourly_stats()
-                self.last_stats_report = current_time
+        self.stats.add(host, success, rtt_ms)
         
         # Update Prometheus metrics (if enabled)
-        if self.metrics_enabled:
-            if success:
-                self.ping_success_counter.labels(host=host).inc()
-            else:
-                self.ping_failure_counter.labels(host=host).inc()
-        
-        return success
+        if self.exporter is not None:
+            self.exporter.probe(host, success, rtt_ms, window.jitter_ms(), window.loss_ratio())
     
-    def report_hourly_stats(self):
-        """Report ping success statistics for the past hour"""
-        current_hour = datetime.now().strftime("%Y-%m-%d %H:00")
-        logger.info(f"📊 Hourly Ping Statistics ({current_hour}):")
+    def report_stats(self):
+        """Report ping success and latency statistics over the report window"""
+        now = datetime.now().strftime("%Y-%m-%d %H:%M")
+        logger.info(f"📊 Ping Statistics, last {self.stats_report_window} ({now}):")
         for host in self.test_hosts:
-            stats = self.stats[host]
-            if stats['total'] > 0:
-                success_rate = (stats['success'] / stats['total']) * 100
-                logger.info(f"  {host}: {stats['success']}/{stats['total']} ({success_rate:.1f}%)")
-            else:
+            stats = self.stats.summary(host, self.stats_report_window)
+            if stats.total == 0:
                 logger.info(f"  {host}: No pings recorded")
-        
-        # Reset stats for next hour
-        self.stats = {host: {'success': 0, 'total': 0} for host in self.test_hosts}
+                continue
+            line = f"  {host}: {stats.success}/{stats.total} ({stats.success_rate * 100:.1f}%)"
+            if stats.rtt_mean is not None:
+                line += (f" rtt min/avg/max/sd {stats.rtt_min:.1f}/{stats.rtt_mean:.1f}/"
+                         f"{stats.rtt_max:.1f}/{stats.rtt_stddev:.1f}ms"
+                         f" p50/p95/p99 {stats.rtt_p50:.1f}/{stats.rtt_p95:.1f}/{stats.rtt_p99:.1f}ms")
+            logger.info(line)
+    
+    async def _report_stats_periodically(self):
+        """Background task: log the rolling stats every STATS_REPORT_INTERVAL_IN_SECONDS"""
+        while True:
+            await asyncio.sleep(self.stats_report_interval_in_seconds)
+            self.report_stats()
     
-    def check_internet(self):
-        """Test internet connectivity using multiple hosts"""
+    async def probe_round(self, hosts, round_index=0):
+        """Probe hosts concurrently within one deadline, True if any host replied"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.check_deadline_in_seconds
+        tasks = {asyncio.create_task(self.ping_test(host, round_index)): host for host in hosts}
+        pending = set(tasks)
         internet_available = False
+        stopped_early = False
         
-        # Ping all hosts to get complete metrics
-        for host in self.test_hosts:
-            if self.ping_test(host):
-                internet_available = True
+        try:
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(
+                    pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                if any(task.result() for task in done):
+                    internet_available = True
+                    # Decision is known, skip waiting on slower hosts
+                    if self.stop_on_first_success:
+                        stopped_early = True
+                        break
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
         
-        # Update internet connectivity metrics (if enabled)
-        if self.metrics_enabled:
-            if internet_available:
-                self.internet_up_counter.inc()
-            else:
-                self.internet_down_counter.inc()
+        # Hosts that missed the cycle deadline count as failed probes,
+        # unless they were cut short because the cycle already passed
+        if not stopped_early:
+            for task in pending:
+                host = tasks[task]
+                logger.debug(f"✗ {host} missed the {self.check_deadline_in_seconds}s cycle deadline")
+                self._record_result(host, False, round_index=round_index)
         
         return internet_available
     
-    async def restart_modem(self):
-        """Power cycle the modem via smart plug"""
+    async def check_internet(self, hosts=None):
+        """Test connectivity to hosts (all test hosts by default), one result per probe round of the burst"""
+        hosts = hosts or self.test_hosts
+        if self.burst_probes <= 1:
+            return [await self.probe_round(hosts)]
+        
+        # Rounds are staggered but overlap, so a burst takes (K-1) gaps plus one deadline
+        async def delayed_round(index):
+            await asyncio.sleep(index * self.burst_gap_in_seconds)
+            return await self.probe_round(hosts, index)
+        return list(await asyncio.gather(*(delayed_round(i) for i in range(self.burst_probes))))
+    
+    def _is_busy(self, group):
+        """Whether the device behind this group, or any layer in front of it, is being power cycled"""
+        return any(
+            layer.plug is not None and layer.plug.busy()
+            for layer in (group, *group.ancestors())
+        )
+    
+    def _is_recovering(self, group):
+        """Whether the group's device was power cycled and is inside its recovery wait"""
+        plug = group.plug
+        return (
+            group.restart_triggered_at is not None
+            and plug is not None
+            and (plug.restart_task is None or plug.restart_task.done())
+            and time.monotonic() < plug.recovering_until
+            and not any(ancestor.plug is not None and ancestor.plug.busy() for ancestor in group.ancestors())
+        )
+    
+    def _mark_up(self, group):
+        """Note a passing check, closing out the recovery of a restarted device"""
+        now = time.monotonic()
+        if group.restart_triggered_at is not None:
+            seconds = now - group.restart_triggered_at
+            logger.info(f"{group.label} back {seconds:.1f}s after {group.device} restart")
+            if self.exporter is not None:
+                self.exporter.recovered(group.name, seconds)
+            group.restart_triggered_at = None
+            if group.plug is not None:
+                group.plug.recovering_until = 0.0
+                self.restarts.recovered(group.plug.name, group.name, seconds)
+            self.notify_ddns(f"{group.device} restarted")
+        elif group.plug is not None:
+            self.restarts.healthy(group.plug.name, group.name)
+        group.last_success_at = now
+    
+    async def check_groups(self):
+        """Probe every group concurrently and restart the devices behind the failing layers"""
+        active = [group for group in self.groups if not self._is_busy(group)]
+        # Restarted devices are polled for recovery instead of sitting out the whole wait
+        recovering = [group for group in self.groups if self.scheduler.polls_recovery and self._is_recovering(group)]
+        if not active and not recovering:
+            return
+        self.cycle_id += 1
+        diagnosis_task = asyncio.create_task(self.diagnoser.diagnose()) if self.diagnoser and active else None
+        results = await asyncio.gather(*(self.check_internet(group.hosts) for group in active + recovering))
+        statuses = await diagnosis_task if diagnosis_task else None
+        if statuses is not None:
+            self._record_diagnosis(statuses)
+        
+        for group, rounds in zip(recovering, results[len(active):]):
+            if any(rounds):
+                self._mark_up(group)
+        results = results[:len(active)]
+        
+        outages = []
+        for group, rounds in zip(active, results):
+            if group.detector.observe(rounds):
+                outages.append(group)
+            if any(rounds):
+                if group.failures > 0:
+                    logger.info(f"{group.label} restored after {group.failures} failures")
+                    self.notify_ddns(f"{group.name} restored")
+                group.failures = 0
+                self._mark_up(group)
+            else:
+                group.failures += 1
+                logger.warning(f"{group.label} down ({group.detector.describe()})")
+            if self.exporter is not None:
+                self.exporter.group(group.name, any(rounds), group.failures)
+        
+        # Update internet connectivity metrics (if enabled)
+        if self.exporter is not None:
+            self.exporter.check(all(any(rounds) for rounds in results))
+        
+        # Only blame the nearest failing layer, independent devices are cycled in parallel
+        for group in responsible_groups(outages):
+            if group.plug is None:
+                logger.warning(f"{group.label} is down but has no plug to power cycle")
+                group.detector.reset()
+                continue
+            if group.plug.busy():
+                continue
+            if statuses is not None and group.device == 'modem' and not modem_suspected(statuses, self.modem_is_gateway):
+                layer = failing_layer(statuses) or 'none'
+                logger.warning(f"Not restarting {group.device}: diagnosis points at the {layer} layer")
+                continue
+            allowed, reason = self.restarts.allow(group.plug.name)
+            if not allowed:
+                logger.warning(f"Not restarting {group.device}: {reason}")
+                continue
+            logger.warning(f"Triggering {group.device} restart" + (f" ({reason})" if reason else ""))
+            if group.restart_triggered_at is None and group.last_success_at is not None:
+                # Upper bound, the outage started somewhere after the last passing check
+                seconds = time.monotonic() - group.last_success_at
+                logger.info(f"Outage on {group.label} detected within {seconds:.1f}s of the last passing check")
+                if self.exporter is not None:
+                    self.exporter.detected(group.name, seconds)
+            group.restart_triggered_at = time.monotonic()
+            self.restarts.started(group.plug.name, group.name)
+            group.plug.restart_task = asyncio.create_task(self.restart_group(group))
+    
+    def notify_ddns(self, reason):
+        """Ask the DDNS daemon to republish now instead of at its next poll"""
+        if not self.ddns_notify_socket:
+            return
         try:
-            # Use new API instead of deprecated SmartPlug
-            device = await Discover.discover_single(self.plug_ip)
-            
-            logger.warning("Restarting modem...")
+            with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+                sock.sendto(reason.encode(), self.ddns_notify_socket)
+        except OSError as e:
+            logger.debug(f"DDNS notification to {self.ddns_notify_socket} failed: {e}")
+    
+    def _record_diagnosis(self, statuses):
+        """Log and export the per-layer diagnosis results"""
+        for layer in LAYERS:
+            status = statuses[layer]
+            if self.test_mode:
+                if status.ok:
+                    logger.debug(f"✓ {layer} layer passed in {status.latency_seconds * 1000:.1f}ms")
+                else:
+                    logger.debug(f"✗ {layer} layer {'failed' if status.ok is False else 'skipped'} ({status.error})")
+            if self.exporter is not None and status.ok is not None:
+                self.exporter.path_layer(layer, status.ok, status.latency_seconds)
+    
+    async def restart_group(self, group):
+        """Power cycle the device behind a group and hold off its checks while it recovers"""
+        plug = group.plug
+        try:
+            await self.restart_modem(plug)
+            plug.recovering_until = time.monotonic() + self.recovery_wait_in_seconds
+        except Exception:
+            # Wait a bit before retrying to avoid rapid failures
+            plug.recovering_until = time.monotonic() + 30
+            self.restarts.failed(plug.name)
+        
+        # Everything behind the restarted device starts from a clean slate
+        for other in self.groups:
+            if other is group or group in other.ancestors() or other.plug is plug:
+                other.failures = 0
+                other.detector.reset()
+    
+    async def restart_modem(self, plug):
+        """Power cycle the modem (or any device) via its smart plug"""
+        try:
+            logger.warning(f"Restarting {plug.name}...")
+            triggered_at = time.monotonic()
             
-            # Turn off modem
-            await device.turn_off()
-            logger.info("Modem powered OFF")
-            await asyncio.sleep(self.restart_delay_in_seconds)
+            def on_power_off():
+                latency = time.monotonic() - triggered_at
+                logger.info(f"Plug switched off {latency:.2f}s after restart trigger")
+                if self.exporter is not None:
+                    self.exporter.power_off(latency)
             
-            # Turn on modem
-            await device.turn_on()
-            logger.info("Modem powered ON")
-            logger.info(f"Waiting {self.recovery_wait_in_seconds}s for modem recovery...")
+            # Reuses the warm plug handle, rediscovering only if it went stale
+            await plug.power_cycle(self.restart_delay_in_seconds, on_power_off)
+            logger.info(f"Waiting {self.recovery_wait_in_seconds}s for {plug.name} recovery...")
             
             # Update modem restart metrics (if enabled)
-            if self.metrics_enabled:
-                self.modem_restart_counter.inc()
+            if self.exporter is not None:
+                self.exporter.restarted(plug.name)
             
         except Exception as e:
-            logger.error(f"Failed to restart modem: {e}")
+            logger.error(f"Failed to restart {plug.name}: {e}")
             raise
     
     async def monitor(self):
         """Main monitoring loop"""
-        failures = 0
+        # Plugs connect in the background, an unreachable one must not hold up the first checks
+        background_tasks = [asyncio.create_task(plug.keep_warm()) for plug in self.plugs.values()]
+        if not self.test_mode:
+            background_tasks.append(asyncio.create_task(self._report_stats_periodically()))
         
         logger.info("Monitoring started")
         
+        try:
+            await self._monitor_loop()
+        finally:
+            for task in background_tasks:
+                task.cancel()
+            for plug in self.plugs.values():
+                await plug.close()
+            if self.probe_store is not None:
+                self.probe_store.close()
+    
+    async def _monitor_loop(self):
+        """Check connectivity forever and restart devices on outages"""
         while True:
             try:
-                if self.check_internet():
-                    if failures > 0:
-                        logger.info(f"Internet restored after {failures} failures")
-                    failures = 0
-                else:
-                    failures += 1
-                    logger.warning(f"Internet down ({failures}/{self.failure_threshold})")
-                    
-                    if failures >= self.failure_threshold:
-                        logger.warning("Triggering modem restart")
-                        await self.restart_modem()
-                        failures = 0
-                        # Wait longer after restart for modem to fully recover
-                        await asyncio.sleep(self.recovery_wait_in_seconds)
-                        continue
+                await self.check_groups()
                 
-                # Normal check interval
-                await asyncio.sleep(self.check_interval_in_seconds)
+                # Next check as chosen by the scheduler
+                failing = any(group.failures > 0 for group in self.groups)
+                recovering = any(plug.busy() for plug in self.plugs.values())
+                await asyncio.sleep(self.scheduler.next_delay(failing, recovering))
                 
             except KeyboardInterrupt:
                 logger.info("Monitoring stopped by user")
@@ -273,6 +597,21 @@ class InternetMonitor:
                 # Wait a bit before retrying to avoid rapid failures
                 await asyncio.sleep(30)
 
+def create_site_monitors(sites, test_mode=False, metrics_enabled=False):
+    """One monitor per site config, sharing the first one's prober and metrics exporter"""
+    monitors = {}
+    prober = exporter = None
+    for name, config in sites.items():
+        # Startup logs carry the site name like everything the site logs later
+        token = current_site.set(name)
+        try:
+            monitor = InternetMonitor(test_mode, metrics_enabled, site=name, config=config, prober=prober, exporter=exporter)
+        finally:
+            current_site.reset(token)
+        prober, exporter = monitor.prober, monitor.metrics_exporter
+        monitors[name] = monitor
+    return monitors
+
 def main():
     """Entry point"""
     # Parse command line arguments
@@ -283,23 +622,54 @@ def main():
                        help="Enable Prometheus metrics server")
     parser.add_argument("--metrics-port", type=int, default=8000,
                        help="Port for Prometheus metrics server (default: 8000)")
+    parser.add_argument("--metrics-address", default=os.getenv('METRICS_ADDRESS') or '0.0.0.0',
+                       help="Address for the metrics server to listen on (default: 0.0.0.0)")
+    parser.add_argument("--replay", metavar="STORE_DIR",
+                       help="Replay stored probe history through outage detection and exit")
+    parser.add_argument("--sites", metavar="SITES_DIR", default=os.getenv('SITES_DIR') or None,
+                       help="Monitor every site configured by a <site>.env file in this directory")
     args = parser.parse_args()
     
+    # Offline replay of recorded probes against the current detection settings
+    if args.replay:
+        monitor = InternetMonitor(test_mode=args.test)
+        replay(
+            ProbeStore(args.replay),
+            monitor.groups,
+            monitor.new_detector,
+            hold_off_in_seconds=monitor.restart_delay_in_seconds + monitor.recovery_wait_in_seconds
+        )
+        return
+    
+    if args.sites:
+        # Many networks in this process, one monitor per site on the same event loop
+        configure_site_logging()
+        monitors = create_site_monitors(load_sites(args.sites), test_mode=args.test, metrics_enabled=args.with_metrics)
+        logger.info(f"Monitoring {len(monitors)} sites from {args.sites}: {', '.join(monitors)}")
+    else:
+        monitors = {'': InternetMonitor(test_mode=args.test, metrics_enabled=args.with_metrics)}
+    exporter = next(iter(monitors.values())).metrics_exporter
+    
     # Start Prometheus metrics server if enabled
     if args.with_metrics:
         try:
-            start_http_server(args.metrics_port, addr='0.0.0.0')
-            logger.info(f"📊 Prometheus metrics server started on 0.0.0.0:{args.metrics_port}")
-            logger.info(f"   Metrics available at /metrics endpoint")
+            exporter.serve(args.metrics_port, args.metrics_address)
+            logger.info(f"📊 Prometheus metrics server started on {args.metrics_address}:{args.metrics_port}")
+            logger.info("   Metrics available at /metrics, current state as JSON at /status")
         except Exception as e:
-            logger.error(f"Failed to start metrics server on port {args.metrics_port}: {e}")
-            sys.exit(1)
+            if not exporter.multiprocess_dir:
+                logger.error(f"Failed to start metrics server on port {args.metrics_port}: {e}")
+                sys.exit(1)
+            # Another process sharing PROMETHEUS_MULTIPROC_DIR already serves the combined metrics
+            logger.info(f"Metrics port {args.metrics_port} taken, metrics are served by another process: {e}")
     
-    monitor = InternetMonitor(test_mode=args.test, metrics_enabled=args.with_metrics)
     try:
-        asyncio.run(monitor.monitor())
+        asyncio.run(run_sites(monitors) if args.sites else monitors[''].monitor())
     except KeyboardInterrupt:
         logger.info("Shutting down...")
+    finally:
+        if exporter is not None:
+            exporter.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,195 @@
+"""
+Kasa device inventory for the internet monitor
+Finds smart plugs on every configured subnet and remembers them by MAC, so a plug can be named by alias or MAC instead of a DHCP address.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import ipaddress
+
+logger = logging.getLogger('internet-monitor')
+
+
+def is_address(value):
+    """Whether a plug reference is an IP address rather than an alias or MAC"""
+    try:
+        ipaddress.ip_address(value)
+        return True
+    except ValueError:
+        return False
+
+
+def normalize_mac(value):
+    """AA:BB:CC:DD:EE:FF form of a MAC written with any case or separator, None if it isn't one"""
+    digits = ''.join(c for c in value if c not in ':-.').upper()
+    if len(digits) != 12 or any(c not in '0123456789ABCDEF' for c in digits):
+        return None
+    return ':'.join(digits[i:i + 2] for i in range(0, 12, 2))
+
+
+def broadcast_target(subnet):
+    """Broadcast address to discover on for a CIDR subnet, plain addresses are used as given"""
+    if '/' not in subnet:
+        return subnet
+    return str(ipaddress.ip_network(subnet, strict=False).broadcast_address)
+
+
+def _read(device, attribute):
+    """Device attribute that may not be known before an update, None if so"""
+    try:
+        return getattr(device, attribute)
+    except Exception:
+        return None
+
+
+class KasaInventory:
+    """
+    Kasa devices seen on the network, keyed by MAC.
+
+    Each entry keeps the device's alias, model, IP and when it was last
+    seen. scan() broadcasts discovery on every subnet at once and merges
+    the answers into the cache, entries for devices that didn't answer are
+    kept. seen() records a device the monitor connected to directly, so
+    the cache stays current without scanning. With cache_file set the
+    inventory is written there whenever an entry changes.
+    """
+
+    def __init__(self, cache_file=None, subnets=('255.255.255.255',), timeout_in_seconds=5,
+                 username=None, password=None):
+        self.cache_file = cache_file
+        self.subnets = list(subnets)
+        self.timeout_in_seconds = timeout_in_seconds
+        self.username = username
+        self.password = password
+        self.devices = {}
+        self.lock = asyncio.Lock()
+        self._load()
+
+    def _load(self):
+        """Restore the inventory from the cache file"""
+        if not self.cache_file:
+            return
+        try:
+            with open(self.cache_file) as f:
+                self.devices = json.load(f)['devices']
+            logger.info(f"Loaded {len(self.devices)} Kasa devices from {self.cache_file}")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable Kasa inventory {self.cache_file}: {e}")
+
+    def _save(self):
+        """Write the inventory to the cache file"""
+        if not self.cache_file:
+            return
+        try:
+            with open(self.cache_file + '.tmp', 'w') as f:
+                json.dump({'devices': self.devices}, f, indent=2)
+            os.replace(self.cache_file + '.tmp', self.cache_file)
+        except OSError as e:
+            logger.warning(f"Failed to save Kasa inventory {self.cache_file}: {e}")
+
+    def lookup(self, key):
+        """Cached entry for a MAC or alias (case-insensitive), the most recently seen on duplicates"""
+        mac = normalize_mac(key)
+        if mac is not None and mac in self.devices:
+            return self.devices[mac]
+        matches = [
+            entry for entry in self.devices.values()
+            if entry['alias'] is not None and entry['alias'].lower() == key.lower()
+        ]
+        return max(matches, key=lambda entry: entry['last_seen'], default=None)
+
+    def matches(self, key, device):
+        """Whether a connected device is the one a MAC or alias refers to"""
+        mac = normalize_mac(key)
+        if mac is not None:
+            return normalize_mac(_read(device, 'mac') or '') == mac
+        alias = _read(device, 'alias')
+        return alias is not None and alias.lower() == key.lower()
+
+    def _merge(self, device):
+        """Record a device, returns its entry (None without a MAC) and whether anything but last_seen changed"""
+        mac = normalize_mac(_read(device, 'mac') or '')
+        if mac is None:
+            return None, False
+        entry = {
+            'mac': mac,
+            'alias': _read(device, 'alias'),
+            'model': _read(device, 'model'),
+            'ip': device.host,
+            'last_seen': time.time(),
+        }
+        previous = self.devices.get(mac)
+        if previous is not None and entry['alias'] is None:
+            # Newer devices only report their alias after an authenticated update
+            entry['alias'] = previous['alias']
+        self.devices[mac] = entry
+        if previous is None:
+            logger.info(f"Found Kasa device {entry['alias']} ({entry['model']}, {mac}) at {entry['ip']}")
+            return entry, True
+        if previous['ip'] != entry['ip']:
+            logger.info(f"Kasa device {entry['alias']} ({mac}) moved from {previous['ip']} to {entry['ip']}")
+        return entry, any(previous[field] != entry[field] for field in ('alias', 'model', 'ip'))
+
+    def seen(self, device):
+        """Record a device the monitor connected to"""
+        _, changed = self._merge(device)
+        if changed:
+            self._save()
+
+    async def _discover(self, subnet):
+        """Discover on one subnet, naming devices that only report their alias after an update"""
+        from kasa import Discover
+        devices = await asyncio.wait_for(
+            Discover.discover(
+                target=broadcast_target(subnet),
+                discovery_timeout=self.timeout_in_seconds,
+                username=self.username,
+                password=self.password
+            ),
+            timeout=self.timeout_in_seconds * 2
+        )
+
+        async def named(device):
+            if _read(device, 'alias') is None:
+                try:
+                    await asyncio.wait_for(device.update(), timeout=self.timeout_in_seconds)
+                except Exception as e:
+                    logger.debug(f"Kasa device at {device.host} answered discovery but not an update: {e}")
+            return device
+
+        return await asyncio.gather(*(named(device) for device in devices.values()))
+
+    async def scan(self):
+        """Discover on every subnet concurrently and merge the answers, returns the entries found"""
+        async with self.lock:
+            started = time.monotonic()
+            results = await asyncio.gather(
+                *(self._discover(subnet) for subnet in self.subnets), return_exceptions=True
+            )
+            found = []
+            changed = False
+            for subnet, result in zip(self.subnets, results):
+                if isinstance(result, BaseException):
+                    logger.warning(f"Kasa discovery on {subnet} failed: {result!r}")
+                    continue
+                for device in result:
+                    entry, entry_changed = self._merge(device)
+                    changed = changed or entry_changed
+                    if entry is not None:
+                        found.append(entry)
+                    try:
+                        await device.disconnect()
+                    except Exception as e:
+                        logger.debug(f"Error closing discovered device {device.host}: {e}")
+            if changed:
+                self._save()
+            logger.info(
+                f"Kasa discovery on {', '.join(self.subnets)} found {len(found)} devices "
+                f"in {time.monotonic() - started:.1f}s"
+            )
+            return found
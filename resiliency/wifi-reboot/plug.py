@@ -0,0 +1,189 @@
+"""
+Smart plug handle for the internet monitor
+Keeps a discovered Kasa device warm so a modem restart doesn't start with discovery.
+"""
+
+import asyncio
+import logging
+import time
+
+from inventory import is_address
+
+logger = logging.getLogger('internet-monitor')
+
+
+class PlugHandle:
+    """
+    Cached connection to a Kasa smart plug with background health checks.
+
+    The plug is given by IP address, or by alias or MAC looked up in a
+    KasaInventory: its cached address is tried first and the subnets are
+    only scanned when the plug isn't there any more, e.g. after a DHCP change.
+    """
+
+    def __init__(self, plug_ip, name='modem', health_check_interval_in_seconds=60, max_backoff_in_seconds=300,
+                 inventory=None, username=None, password=None):
+        self.inventory = inventory
+        # Kasa cloud credentials, needed by plugs on newer firmware
+        self.username = username
+        self.password = password
+        if is_address(plug_ip):
+            self.plug_id = None
+            self.plug_ip = plug_ip
+        elif inventory is None:
+            raise ValueError(f"Smart plug {plug_ip} is not an IP address and there is no inventory to look it up in")
+        else:
+            self.plug_id = plug_ip
+            entry = inventory.lookup(plug_ip)
+            self.plug_ip = entry['ip'] if entry is not None else None
+        self.name = name
+        self.health_check_interval_in_seconds = health_check_interval_in_seconds
+        self.max_backoff_in_seconds = max_backoff_in_seconds
+        self.device = None
+        self.backoff_in_seconds = 0
+        self.next_attempt = 0.0
+        self.lock = asyncio.Lock()
+        self.connected_gauge = None
+
+        # Power cycle in progress, and how long the device needs to come back afterwards
+        self.restart_task = None
+        self.recovering_until = 0.0
+
+    @property
+    def connected(self):
+        """Whether a warm device handle is cached"""
+        return self.device is not None
+
+    def busy(self):
+        """Whether the plug is being power cycled or its device is still recovering"""
+        restarting = self.restart_task is not None and not self.restart_task.done()
+        return restarting or time.monotonic() < self.recovering_until
+
+    def _set_device(self, device):
+        self.device = device
+        if self.connected_gauge is not None:
+            self.connected_gauge.set(1 if device is not None else 0)
+
+    async def connect(self):
+        """Discover the plug and cache its device handle"""
+        async with self.lock:
+            if self.device is not None:
+                return self.device
+            try:
+                device = await self._discover()
+            except Exception:
+                # Back off exponentially so a missing plug isn't hammered with discovery
+                self.backoff_in_seconds = min(
+                    self.max_backoff_in_seconds, max(5, self.backoff_in_seconds * 2)
+                )
+                self.next_attempt = time.monotonic() + self.backoff_in_seconds
+                raise
+            self.backoff_in_seconds = 0
+            self._set_device(device)
+            if self.inventory is not None:
+                self.inventory.seen(device)
+            logger.info(f"🔌 Connected to smart plug {device.alias} ({device.model}) at {self.plug_ip}")
+            return device
+
+    async def _discover_at(self, address):
+        """Updated device handle for the Kasa device at an address"""
+        # python-kasa pulls in aiohttp, only pay for it once a plug is actually contacted
+        from kasa import Discover
+        device = await Discover.discover_single(address, username=self.username, password=self.password)
+        if device is None:
+            raise ConnectionError(f"No Kasa device answered at {address}")
+        await device.update()
+        return device
+
+    async def _discover(self):
+        """Device handle for the plug, through the inventory when it is named by alias or MAC"""
+        if self.plug_id is None:
+            return await self._discover_at(self.plug_ip)
+        entry = self.inventory.lookup(self.plug_id)
+        if entry is not None:
+            try:
+                device = await self._discover_at(entry['ip'])
+                if self.inventory.matches(self.plug_id, device):
+                    self.plug_ip = entry['ip']
+                    return device
+                await device.disconnect()
+                logger.info(f"{entry['ip']} is no longer smart plug {self.plug_id}")
+            except Exception as e:
+                logger.info(f"Smart plug {self.plug_id} not answering at {entry['ip']}: {e}")
+        await self.inventory.scan()
+        entry = self.inventory.lookup(self.plug_id)
+        if entry is None:
+            raise ConnectionError(f"No Kasa device {self.plug_id} on {', '.join(self.inventory.subnets)}")
+        device = await self._discover_at(entry['ip'])
+        if not self.inventory.matches(self.plug_id, device):
+            await device.disconnect()
+            raise ConnectionError(f"Kasa device at {entry['ip']} is not {self.plug_id}")
+        self.plug_ip = entry['ip']
+        return device
+
+    async def _disconnect(self):
+        """Close and forget the cached handle"""
+        device = self.device
+        self._set_device(None)
+        if device is not None:
+            try:
+                await device.disconnect()
+            except Exception as e:
+                logger.debug(f"Error closing smart plug connection: {e}")
+
+    async def drop(self, reason):
+        """Forget the cached handle so the next use reconnects"""
+        if self.device is not None:
+            logger.warning(f"Smart plug connection lost: {reason}")
+            await self._disconnect()
+
+    async def keep_warm(self):
+        """Background task: connect, then health check the cached handle and reconnect lazily with backoff"""
+        # Connect up front, while the network is still healthy
+        try:
+            await self.connect()
+        except Exception as e:
+            logger.warning(
+                f"Smart plug {self.plug_id or self.plug_ip} not reachable at startup, "
+                f"retrying in {self.backoff_in_seconds}s: {e}"
+            )
+        while True:
+            await asyncio.sleep(self.health_check_interval_in_seconds)
+            if self.device is not None:
+                try:
+                    await self.device.update()
+                    continue
+                except Exception as e:
+                    await self.drop(e)
+            if time.monotonic() < self.next_attempt:
+                continue
+            try:
+                await self.connect()
+            except Exception as e:
+                logger.warning(f"Smart plug reconnect failed, retrying in {self.backoff_in_seconds}s: {e}")
+
+    async def power_cycle(self, off_delay_in_seconds, on_power_off=None):
+        """Turn the plug off, wait, and turn it back on, reusing the warm handle when possible"""
+        device = self.device
+        try:
+            if device is None:
+                device = await self.connect()
+            await device.turn_off()
+        except Exception as e:
+            if device is None:
+                raise
+            # The cached handle may be stale, retry once with a fresh discovery
+            await self.drop(e)
+            device = await self.connect()
+            await device.turn_off()
+        logger.info(f"{self.name.capitalize()} powered OFF")
+        if on_power_off is not None:
+            on_power_off()
+        await asyncio.sleep(off_delay_in_seconds)
+
+        await device.turn_on()
+        logger.info(f"{self.name.capitalize()} powered ON")
+
+    async def close(self):
+        """Close the cached connection"""
+        await self._disconnect()
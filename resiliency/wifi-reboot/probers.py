@@ -0,0 +1,225 @@
+"""
+Probe backends for the internet monitor
+ICMP echo probes either in-process over an ICMP socket or through the system ping binary.
+"""
+
+import os
+import math
+import time
+import socket
+import struct
+import asyncio
+import logging
+from dataclasses import dataclass
+
+logger = logging.getLogger('internet-monitor')
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+ICMP_PAYLOAD = b'internet-monitor'
+
+
+@dataclass
+class ProbeResult:
+    """Outcome of a single echo probe"""
+    host: str
+    success: bool
+    rtt_ms: float = None
+    error: str = None
+
+
+def _checksum(data):
+    """RFC 1071 internet checksum"""
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+class Prober:
+    """Base class for probe backends"""
+
+    name = None
+
+    async def probe(self, host, timeout):
+        """Send one echo request to host and wait up to timeout seconds for the reply"""
+        raise NotImplementedError
+
+    async def probe_many(self, hosts, timeout):
+        """Probe every host concurrently and collect all results"""
+        return await asyncio.gather(*(self.probe(host, timeout) for host in hosts))
+
+    def close(self):
+        """Release any resources held by the backend"""
+
+
+class SubprocessProber(Prober):
+    """Probe hosts by running the system ping binary (one process per probe)"""
+
+    name = 'subprocess'
+
+    async def probe(self, host, timeout):
+        """Send one echo request to host and wait up to timeout seconds for the reply"""
+        process = None
+        try:
+            process = await asyncio.create_subprocess_exec(
+                'ping', '-c', '1', '-W', str(max(1, math.ceil(timeout))), host,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            stdout, _ = await asyncio.wait_for(process.communicate(), timeout=timeout + 2)
+            if process.returncode != 0:
+                return ProbeResult(host, False, error=f"exit code: {process.returncode}")
+
+            # Extract ping time from output
+            output_lines = stdout.decode(errors='replace').strip().split('\n')
+            ping_line = next((line for line in output_lines if 'time=' in line), '')
+            rtt_ms = None
+            if ping_line:
+                rtt_ms = float(ping_line.split('time=')[1].split()[0])
+            return ProbeResult(host, True, rtt_ms=rtt_ms)
+        except asyncio.TimeoutError:
+            return ProbeResult(host, False, error=f"timed out (>{timeout + 2}s)")
+        finally:
+            # Don't leave ping processes behind on timeout or cancellation
+            if process is not None and process.returncode is None:
+                process.kill()
+                await process.wait()
+
+
+class IcmpProber(Prober):
+    """
+    Probe hosts in-process over a single ICMP socket.
+
+    Uses an unprivileged ICMP datagram socket (net.ipv4.ping_group_range) and
+    falls back to a raw socket when running with CAP_NET_RAW. Every probe sent
+    in the same event loop tick goes out back-to-back on the shared socket and
+    replies are matched to their request by ident and sequence number.
+    """
+
+    name = 'icmp'
+
+    def __init__(self):
+        try:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+            self.raw = False
+        except PermissionError:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+            self.raw = True
+        self.sock.setblocking(False)
+
+        # Datagram sockets get their ident rewritten by the kernel, which also
+        # filters replies for us. Raw sockets see every ICMP packet on the box.
+        self.ident = os.getpid() & 0xFFFF
+        self.sequence = 0
+        self.pending = {}
+        self.addresses = {}
+        self.loop = None
+
+    def _attach(self):
+        """Register the socket reader with the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            if self.loop is not None and not self.loop.is_closed():
+                self.loop.remove_reader(self.sock)
+            loop.add_reader(self.sock, self._on_readable)
+            self.loop = loop
+
+    async def _resolve(self, host):
+        """Resolve host to an IPv4 address, cached for the life of the prober"""
+        if host not in self.addresses:
+            infos = await self.loop.getaddrinfo(host, None, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+            self.addresses[host] = infos[0][4][0]
+        return self.addresses[host]
+
+    def _next_sequence(self):
+        """Next free 16-bit sequence number"""
+        for _ in range(0x10000):
+            self.sequence = (self.sequence + 1) & 0xFFFF
+            if self.sequence not in self.pending:
+                return self.sequence
+        raise RuntimeError("No free ICMP sequence numbers")
+
+    def _on_readable(self):
+        """Drain the socket and resolve the futures of matching echo replies"""
+        while True:
+            try:
+                data, address = self.sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logger.debug(f"ICMP receive error: {e}")
+                return
+            received_ns = time.perf_counter_ns()
+
+            if self.raw:
+                # Raw sockets deliver the IP header as well
+                data = data[(data[0] & 0x0F) * 4:]
+            if len(data) < 8:
+                continue
+            icmp_type, _, _, ident, sequence = struct.unpack('!BBHHH', data[:8])
+            if icmp_type != ICMP_ECHO_REPLY or (self.raw and ident != self.ident):
+                continue
+
+            entry = self.pending.get(sequence)
+            if entry is None:
+                continue
+            target, sent_ns, future = entry
+            if address[0] != target or future.done():
+                continue
+            future.set_result((received_ns - sent_ns) / 1_000_000)
+
+    async def probe(self, host, timeout):
+        """Send one echo request to host and wait up to timeout seconds for the reply"""
+        self._attach()
+        try:
+            target = await self._resolve(host)
+        except OSError as e:
+            return ProbeResult(host, False, error=f"resolve failed: {e}")
+
+        sequence = self._next_sequence()
+        header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, self.ident, sequence)
+        checksum = _checksum(header + ICMP_PAYLOAD)
+        packet = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, checksum, self.ident, sequence) + ICMP_PAYLOAD
+
+        future = self.loop.create_future()
+        self.pending[sequence] = (target, time.perf_counter_ns(), future)
+        try:
+            try:
+                self.sock.sendto(packet, (target, 0))
+            except OSError as e:
+                # Unreachable networks are an expected failure mode during outages
+                return ProbeResult(host, False, error=f"send failed: {e}")
+            rtt_ms = await asyncio.wait_for(future, timeout=timeout)
+            return ProbeResult(host, True, rtt_ms=rtt_ms)
+        except asyncio.TimeoutError:
+            return ProbeResult(host, False, error=f"timed out (>{timeout}s)")
+        finally:
+            del self.pending[sequence]
+
+    def close(self):
+        """Release the ICMP socket"""
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.remove_reader(self.sock)
+        self.sock.close()
+
+
+PROBERS = {
+    'icmp': IcmpProber,
+    'subprocess': SubprocessProber,
+}
+
+
+def create_prober(backend='auto'):
+    """Build the requested probe backend, falling back to ping when ICMP sockets are unavailable"""
+    if backend == 'auto':
+        try:
+            return IcmpProber()
+        except OSError as e:
+            logger.warning(f"ICMP socket unavailable ({e}), falling back to ping subprocess")
+            return SubprocessProber()
+    if backend not in PROBERS:
+        raise ValueError(f"Unknown probe backend: {backend} (expected auto, {', '.join(PROBERS)})")
+    return PROBERS[backend]()
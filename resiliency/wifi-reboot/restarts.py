@@ -0,0 +1,210 @@
+"""
+Restart controller for the internet monitor
+Tracks whether power cycles actually bring connectivity back and stops cycling a device when they don't.
+"""
+
+import os
+import json
+import time
+import logging
+from collections import deque
+
+logger = logging.getLogger('internet-monitor')
+
+# Resolved restart outcomes, anything else in the history is still pending
+OUTCOMES = ('recovered', 'ineffective', 'failed')
+
+
+class RestartController:
+    """
+    Decides whether a device may be power cycled, and remembers how it went.
+
+    A restart counts as recovered when its probe group answers within
+    recovery_window_in_seconds, and as ineffective when it comes back later
+    or the monitor asks to restart the device again first. Each ineffective
+    restart in a row doubles the hold-off before the next one, from
+    backoff_base_in_seconds up to backoff_max_in_seconds. After
+    breaker_threshold of them the breaker opens: no restarts for
+    breaker_cooldown_in_seconds, then a single trial restart. A passing
+    check of the group the device was last restarted for resets the streak
+    and closes the breaker, other groups behind the same plug don't. A zero
+    backoff_base_in_seconds or breaker_threshold turns that stage off.
+
+    The last history_size restarts per device and the streak are kept in
+    state_file (wall clock timestamps) so they survive a service restart.
+    """
+
+    def __init__(self, state_file=None, history_size=50, recovery_window_in_seconds=600,
+                 backoff_base_in_seconds=300, backoff_max_in_seconds=3600,
+                 breaker_threshold=5, breaker_cooldown_in_seconds=21600):
+        self.state_file = state_file
+        self.history_size = history_size
+        self.recovery_window_in_seconds = recovery_window_in_seconds
+        self.backoff_base_in_seconds = backoff_base_in_seconds
+        self.backoff_max_in_seconds = backoff_max_in_seconds
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown_in_seconds = breaker_cooldown_in_seconds
+        self.exporter = None
+        self.devices = {}
+        self._load()
+
+    def _device(self, device):
+        """Mutable state of one device, created on first use"""
+        if device not in self.devices:
+            self.devices[device] = {
+                'consecutive_ineffective': 0,
+                'last_restart_at': None,
+                'breaker_opened_at': None,
+                'history': deque(maxlen=self.history_size),
+            }
+        return self.devices[device]
+
+    def _load(self):
+        """Restore history and streaks from the state file"""
+        if not self.state_file:
+            return
+        try:
+            with open(self.state_file) as f:
+                saved = json.load(f)
+            for device, state in saved['devices'].items():
+                restored = self._device(device)
+                restored['consecutive_ineffective'] = state['consecutive_ineffective']
+                restored['last_restart_at'] = state['last_restart_at']
+                restored['breaker_opened_at'] = state['breaker_opened_at']
+                restored['history'].extend(state['history'])
+            logger.info(f"Loaded restart history of {len(self.devices)} devices from {self.state_file}")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable restart state {self.state_file}: {e}")
+
+    def _save(self):
+        """Write history and streaks to the state file"""
+        if not self.state_file:
+            return
+        state = {
+            'devices': {
+                device: {**{key: value for key, value in state.items() if key != 'history'},
+                         'history': list(state['history'])}
+                for device, state in self.devices.items()
+            }
+        }
+        try:
+            with open(self.state_file + '.tmp', 'w') as f:
+                json.dump(state, f, indent=2)
+            os.replace(self.state_file + '.tmp', self.state_file)
+        except OSError as e:
+            logger.warning(f"Failed to save restart state {self.state_file}: {e}")
+
+    def _pending(self, device):
+        """Last restart of the device if its outcome is still open"""
+        history = self._device(device)['history']
+        return history[-1] if history and history[-1]['outcome'] == 'pending' else None
+
+    def _resolve(self, device, outcome, time_to_recover=None):
+        """Close the pending restart with an outcome and update the streak"""
+        state = self._device(device)
+        pending = self._pending(device)
+        if pending is None:
+            return
+        pending['outcome'] = outcome
+        pending['time_to_recover_seconds'] = time_to_recover
+        if outcome == 'ineffective':
+            state['consecutive_ineffective'] += 1
+            if self.breaker_threshold and state['consecutive_ineffective'] >= self.breaker_threshold:
+                if state['breaker_opened_at'] is None:
+                    logger.warning(
+                        f"{state['consecutive_ineffective']} restarts of {device} in a row didn't help, "
+                        f"pausing restarts for {self.breaker_cooldown_in_seconds}s"
+                    )
+                state['breaker_opened_at'] = time.time()
+        elif outcome == 'recovered':
+            state['consecutive_ineffective'] = 0
+            state['breaker_opened_at'] = None
+        self.report(device, outcome)
+
+    def report(self, device, outcome=None):
+        """Push the outcome and current state to the exporter"""
+        if self.exporter is not None:
+            summary = self.summary(device)
+            self.exporter.restart_state(
+                device, outcome, summary['consecutive_ineffective'], summary['effectiveness'], summary['breaker_open']
+            )
+
+    def allow(self, device):
+        """(allowed, reason) for power cycling the device now"""
+        state = self._device(device)
+        if self._pending(device) is not None:
+            # Asked to restart again while the last one is open: it didn't fix the outage
+            self._resolve(device, 'ineffective')
+            self._save()
+
+        now = time.time()
+        if state['breaker_opened_at'] is not None:
+            reopens_in = state['breaker_opened_at'] + self.breaker_cooldown_in_seconds - now
+            if reopens_in > 0:
+                return False, f"circuit breaker open for another {reopens_in:.0f}s"
+            return True, "circuit breaker trial restart"
+        if state['consecutive_ineffective'] > 0 and state['last_restart_at'] is not None:
+            hold_off = min(
+                self.backoff_max_in_seconds,
+                self.backoff_base_in_seconds * 2 ** (state['consecutive_ineffective'] - 1)
+            )
+            allowed_in = state['last_restart_at'] + hold_off - now
+            if allowed_in > 0:
+                return False, f"{state['consecutive_ineffective']} ineffective restarts, backing off another {allowed_in:.0f}s"
+        return True, None
+
+    def started(self, device, group):
+        """A power cycle of the device was triggered for a failing group"""
+        state = self._device(device)
+        state['last_restart_at'] = time.time()
+        state['history'].append({
+            'at': state['last_restart_at'],
+            'group': group,
+            'outcome': 'pending',
+            'time_to_recover_seconds': None,
+        })
+        self._save()
+
+    def failed(self, device):
+        """The plug could not power cycle the device, doesn't count against the device"""
+        self._resolve(device, 'failed')
+        self._save()
+
+    def recovered(self, device, group, seconds):
+        """The group answered again seconds after the restart trigger"""
+        outcome = 'recovered' if seconds <= self.recovery_window_in_seconds else 'ineffective'
+        self._resolve(device, outcome, seconds)
+        self.healthy(device, group)
+        self._save()
+
+    def healthy(self, device, group):
+        """A passing check of a group, its outage is over whether or not a restart fixed it"""
+        state = self._device(device)
+        if state['consecutive_ineffective'] == 0 and state['breaker_opened_at'] is None:
+            return
+        history = state['history']
+        # Another group on the plug still answering says nothing about the outage the restarts were for
+        if history and history[-1]['group'] != group:
+            return
+        if self._pending(device) is None:
+            state['consecutive_ineffective'] = 0
+            state['breaker_opened_at'] = None
+            self.report(device)
+            self._save()
+
+    def summary(self, device):
+        """Streak, breaker state and recovered share of the resolved restarts in the history"""
+        state = self._device(device)
+        resolved = [entry for entry in state['history'] if entry['outcome'] in ('recovered', 'ineffective')]
+        recovered = [entry for entry in resolved if entry['outcome'] == 'recovered']
+        return {
+            'consecutive_ineffective': state['consecutive_ineffective'],
+            'breaker_open': state['breaker_opened_at'] is not None,
+            'effectiveness': len(recovered) / len(resolved) if resolved else None,
+            'mean_time_to_recover_seconds': (
+                sum(entry['time_to_recover_seconds'] for entry in recovered) / len(recovered) if recovered else None
+            ),
+            'restarts': len(state['history']),
+        }
@@ -0,0 +1,204 @@
+"""
+Rolling probe statistics for the internet monitor
+Bounded-memory per-host success rate and RTT summaries over sliding time windows.
+"""
+
+import math
+import time
+from array import array
+from bisect import bisect_left
+from collections import deque, namedtuple
+
+# Log-spaced RTT bucket upper bounds in ms (0.1ms to ~15s, 25% apart) for approximate quantiles
+QUANTILE_BOUNDS_MS = tuple(0.1 * 1.25 ** i for i in range(54))
+
+# Zeroed bucket counts copied over a slot when it is reused
+_EMPTY_BUCKETS = array('I', bytes(4 * (len(QUANTILE_BOUNDS_MS) + 1)))
+
+# Window name -> span in seconds
+WINDOWS = {'1m': 60, '5m': 300, '1h': 3600}
+SLOTS_PER_WINDOW = 12
+
+WindowSummary = namedtuple('WindowSummary', [
+    'total', 'success', 'success_rate',
+    'rtt_min', 'rtt_mean', 'rtt_max', 'rtt_stddev',
+    'rtt_p50', 'rtt_p95', 'rtt_p99',
+])
+
+
+class RttWindow:
+    """
+    Fixed-size ring buffer of recent probe outcomes for one host.
+
+    The lost count and the sum of RTT differences are kept up to date as
+    probes come and go, so both gauges cost O(1) per probe.
+    """
+
+    def __init__(self, size):
+        # Each entry is (success, RTT in milliseconds or None)
+        self.samples = deque(maxlen=size)
+        # RTTs of the successful samples still in the window, oldest first
+        self.rtts = deque()
+        self.lost = 0
+        self.rtt_diff_sum = 0.0
+
+    def add(self, success, rtt_ms):
+        """Record one probe outcome, evicting the oldest once the window is full"""
+        if len(self.samples) == self.samples.maxlen:
+            evicted_success, evicted_rtt = self.samples[0]
+            if not evicted_success:
+                self.lost -= 1
+            elif evicted_rtt is not None:
+                self.rtts.popleft()
+                self.rtt_diff_sum = self.rtt_diff_sum - abs(self.rtts[0] - evicted_rtt) if self.rtts else 0.0
+        self.samples.append((success, rtt_ms))
+        if not success:
+            self.lost += 1
+        elif rtt_ms is not None:
+            if self.rtts:
+                self.rtt_diff_sum += abs(rtt_ms - self.rtts[-1])
+            self.rtts.append(rtt_ms)
+
+    def loss_ratio(self):
+        """Fraction of probes in the window that got no reply"""
+        if not self.samples:
+            return 0.0
+        return self.lost / len(self.samples)
+
+    def jitter_ms(self):
+        """Mean absolute difference between consecutive RTTs in the window"""
+        if len(self.rtts) < 2:
+            return 0.0
+        # Running sum, floating point drift can take it a hair below zero
+        return max(0.0, self.rtt_diff_sum) / (len(self.rtts) - 1)
+
+
+class _Slot:
+    """Accumulator for the probes that landed in one time slice of a window"""
+
+    __slots__ = ('index', 'total', 'success', 'rtt_count', 'rtt_sum', 'rtt_sumsq', 'rtt_min', 'rtt_max', 'buckets')
+
+    def __init__(self):
+        self.index = -1
+        self.buckets = array('I', _EMPTY_BUCKETS)
+        self.clear(-1)
+
+    def clear(self, index):
+        """Reuse the slot for a new time slice"""
+        self.index = index
+        self.total = 0
+        self.success = 0
+        self.rtt_count = 0
+        self.rtt_sum = 0.0
+        self.rtt_sumsq = 0.0
+        self.rtt_min = math.inf
+        self.rtt_max = -math.inf
+        self.buckets[:] = _EMPTY_BUCKETS
+
+
+class RollingWindow:
+    """
+    Sliding time window split into a fixed ring of slots.
+
+    Probes are added to the slot for their time slice; slots older than the
+    window are recycled, so memory stays constant and the window edge is
+    accurate to one slot (span / SLOTS_PER_WINDOW).
+    """
+
+    __slots__ = ('slot_seconds', 'slots')
+
+    def __init__(self, span_seconds, slots=SLOTS_PER_WINDOW):
+        self.slot_seconds = span_seconds / slots
+        self.slots = [_Slot() for _ in range(slots)]
+
+    def add(self, now, success, rtt_ms):
+        """Record one probe at time now"""
+        index = int(now // self.slot_seconds)
+        slot = self.slots[index % len(self.slots)]
+        if slot.index != index:
+            slot.clear(index)
+        slot.total += 1
+        if success:
+            slot.success += 1
+            if rtt_ms is not None:
+                slot.rtt_count += 1
+                slot.rtt_sum += rtt_ms
+                slot.rtt_sumsq += rtt_ms * rtt_ms
+                slot.rtt_min = min(slot.rtt_min, rtt_ms)
+                slot.rtt_max = max(slot.rtt_max, rtt_ms)
+                slot.buckets[bisect_left(QUANTILE_BOUNDS_MS, rtt_ms)] += 1
+
+    def summary(self, now):
+        """Summarise the probes still inside the window at time now"""
+        oldest = int(now // self.slot_seconds) - len(self.slots) + 1
+        live = [slot for slot in self.slots if slot.index >= oldest]
+
+        total = sum(slot.total for slot in live)
+        success = sum(slot.success for slot in live)
+        rtt_count = sum(slot.rtt_count for slot in live)
+        success_rate = success / total if total else None
+        if not rtt_count:
+            return WindowSummary(total, success, success_rate, None, None, None, None, None, None, None)
+
+        rtt_sum = sum(slot.rtt_sum for slot in live)
+        rtt_mean = rtt_sum / rtt_count
+        variance = max(0.0, sum(slot.rtt_sumsq for slot in live) / rtt_count - rtt_mean * rtt_mean)
+        buckets = [sum(counts) for counts in zip(*(slot.buckets for slot in live))]
+        rtt_min = min(slot.rtt_min for slot in live)
+        rtt_max = max(slot.rtt_max for slot in live)
+        return WindowSummary(
+            total, success, success_rate,
+            rtt_min, rtt_mean, rtt_max, math.sqrt(variance),
+            *(_quantile(buckets, rtt_count, q, rtt_min, rtt_max) for q in (0.5, 0.95, 0.99))
+        )
+
+
+def _quantile(buckets, count, q, lowest, highest):
+    """Approximate quantile by interpolating inside the bucket that holds it"""
+    rank = q * count
+    cumulative = 0
+    for i, bucket_count in enumerate(buckets):
+        if bucket_count and cumulative + bucket_count >= rank:
+            lower = QUANTILE_BOUNDS_MS[i - 1] if i > 0 else 0.0
+            upper = QUANTILE_BOUNDS_MS[i] if i < len(QUANTILE_BOUNDS_MS) else highest
+            value = lower + (upper - lower) * (rank - cumulative) / bucket_count
+            return min(max(value, lowest), highest)
+        cumulative += bucket_count
+    return highest
+
+
+def window_for(seconds):
+    """Name of the shortest of the WINDOWS spanning at least seconds, the longest one if none does"""
+    for name, span in sorted(WINDOWS.items(), key=lambda item: item[1]):
+        if span >= seconds:
+            return name
+    return max(WINDOWS, key=WINDOWS.get)
+
+
+class HostStats:
+    """1m/5m/1h rolling windows for one host"""
+
+    __slots__ = ('windows',)
+
+    def __init__(self):
+        self.windows = {name: RollingWindow(span) for name, span in WINDOWS.items()}
+
+    def add(self, now, success, rtt_ms):
+        """Record one probe in every window"""
+        for window in self.windows.values():
+            window.add(now, success, rtt_ms)
+
+
+class RollingStats:
+    """Per-host rolling statistics in bounded memory"""
+
+    def __init__(self, hosts):
+        self.hosts = {host: HostStats() for host in hosts}
+
+    def add(self, host, success, rtt_ms=None, now=None):
+        """Record one probe result"""
+        self.hosts[host].add(time.time() if now is None else now, success, rtt_ms)
+
+    def summary(self, host, window='1h', now=None):
+        """WindowSummary for a host over one of the WINDOWS"""
+        return self.hosts[host].windows[window].summary(time.time() if now is None else now)
@@ -0,0 +1,78 @@
+"""
+Check schedulers for the internet monitor
+Decide how long to sleep before the next check cycle given how the probe groups are doing.
+"""
+
+import random
+
+
+class FixedScheduler:
+    """Check every CHECK_INTERVAL_IN_SECONDS and sit out RECOVERY_WAIT_IN_SECONDS after a restart"""
+
+    polls_recovery = False
+
+    def __init__(self, interval):
+        self.interval = interval
+
+    def next_delay(self, _failing, _recovering):
+        """Seconds until the next cycle"""
+        return self.interval
+
+    def describe(self):
+        return f"fixed {self.interval}s"
+
+
+class AdaptiveScheduler:
+    """
+    Sparse checks while healthy, rapid ones while anything is failing or recovering.
+
+    Each healthy cycle in a row multiplies the interval by backoff_factor,
+    from interval up to max_interval, with +/- jitter_ratio so checks don't
+    fall into lockstep with anything periodic. The first failed check drops
+    straight to failing_interval. After a power cycle the device is polled
+    every recovery_poll_interval and the recovery wait ends as soon as it
+    answers, RECOVERY_WAIT_IN_SECONDS only caps how long that can take.
+    """
+
+    polls_recovery = True
+
+    def __init__(self, interval, max_interval, failing_interval, recovery_poll_interval,
+                 jitter_ratio=0.1, backoff_factor=2.0, rng=None):
+        if not 0 < failing_interval <= interval <= max_interval:
+            raise ValueError(
+                "Expected 0 < FAILING_CHECK_INTERVAL_IN_SECONDS <= CHECK_INTERVAL_IN_SECONDS "
+                "<= MAX_CHECK_INTERVAL_IN_SECONDS"
+            )
+        if not 0 <= jitter_ratio < 1:
+            raise ValueError("Expected 0 <= CHECK_JITTER_RATIO < 1")
+        self.interval = interval
+        self.max_interval = max_interval
+        self.failing_interval = failing_interval
+        self.recovery_poll_interval = recovery_poll_interval
+        self.jitter_ratio = jitter_ratio
+        self.backoff_factor = backoff_factor
+        self.random = rng or random.Random()
+        self.healthy_interval = interval
+
+    def next_delay(self, failing, recovering):
+        """Seconds until the next cycle"""
+        if recovering or failing:
+            # Start over from the base interval once everything is healthy again
+            self.healthy_interval = self.interval
+            return self.recovery_poll_interval if recovering else self.failing_interval
+        delay = self.healthy_interval
+        self.healthy_interval = min(self.max_interval, self.healthy_interval * self.backoff_factor)
+        return delay * (1 + self.random.uniform(-self.jitter_ratio, self.jitter_ratio))
+
+    def describe(self):
+        return (f"adaptive {self.interval}-{self.max_interval}s healthy, {self.failing_interval}s failing, "
+                f"{self.recovery_poll_interval}s recovery polls")
+
+
+def create_scheduler(mode, interval, max_interval, failing_interval, recovery_poll_interval, jitter_ratio):
+    """Build the check scheduler selected by SCHEDULE_MODE"""
+    if mode == 'fixed':
+        return FixedScheduler(interval)
+    if mode == 'adaptive':
+        return AdaptiveScheduler(interval, max_interval, failing_interval, recovery_poll_interval, jitter_ratio)
+    raise ValueError(f"Unknown schedule mode: {mode} (expected fixed, adaptive)")
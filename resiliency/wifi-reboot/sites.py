@@ -0,0 +1,99 @@
+"""
+Multi-site mode for the internet monitor
+Loads one config per site from SITES_DIR and runs every site's monitor on one event loop, each logging under its site name.
+"""
+
+import os
+import asyncio
+import logging
+import contextvars
+
+logger = logging.getLogger('internet-monitor')
+
+# Site of the running task, set by run_sites and inherited by every task a site starts
+current_site = contextvars.ContextVar('site', default='')
+
+# Settings of the whole process, taken from the main environment only
+SHARED_SETTINGS = (
+    'SITES_DIR', 'PROBE_BACKEND', 'RTT_BUCKETS_IN_MS', 'METRICS_ADDRESS', 'METRICS_FLUSH_INTERVAL_IN_SECONDS',
+)
+
+# State kept on disk, made per site unless a site config sets its own path
+SITE_PATHS = {
+    'RESTART_STATE_FILE': '.restart-state.json',
+    'KASA_INVENTORY_FILE': '.kasa-inventory.json',
+    'PROBE_STORE_DIR': '',
+}
+
+SITE_LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(site)s] %(message)s'
+
+
+def site_path(path, site):
+    """Path with the site name inserted before its extension, .restart-state.json -> .restart-state-home.json"""
+    root, extension = os.path.splitext(path.rstrip('/'))
+    return f"{root}-{site}{extension}"
+
+
+def load_sites(directory, base=None):
+    """
+    {site name: config} for every <site>.env in directory, sorted by name.
+
+    A site config is the main environment (base) overlaid with the site's
+    file, so shared defaults live in the main .env. Process-wide settings
+    in a site file are ignored.
+    """
+    from dotenv import dotenv_values
+
+    base = dict(os.environ if base is None else base)
+    sites = {}
+    for filename in sorted(os.listdir(directory)):
+        name, extension = os.path.splitext(filename)
+        if extension != '.env':
+            continue
+        values = {key: value for key, value in dotenv_values(os.path.join(directory, filename)).items() if value is not None}
+        for key in SHARED_SETTINGS:
+            if values.pop(key, None) is not None:
+                logger.warning(f"Ignoring {key} in {filename}, it applies to the whole process")
+        config = {**base, **values}
+        for key, default in SITE_PATHS.items():
+            path = config.get(key) or default
+            if key not in values and path and path.lower() != 'none':
+                config[key] = site_path(path, name)
+        sites[name] = config
+    if not sites:
+        raise ValueError(f"No site configs (*.env) in {directory}")
+    return sites
+
+
+class SiteLogFilter(logging.Filter):
+    """Adds the current site to every record for SITE_LOG_FORMAT"""
+
+    def filter(self, record):
+        record.site = current_site.get() or '-'
+        return True
+
+
+def configure_site_logging():
+    """Prefix every log line with the site it came from"""
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(SiteLogFilter())
+        handler.setFormatter(logging.Formatter(SITE_LOG_FORMAT))
+
+
+async def run_sites(monitors):
+    """
+    Run every site's monitor until cancelled.
+
+    Sites start spread over one check interval so their probes don't go out
+    in lockstep. A site whose monitor stops on an error is logged and left
+    stopped, the others keep running.
+    """
+    async def run(index, name, monitor):
+        current_site.set(name)
+        await asyncio.sleep(monitor.check_interval_in_seconds * index / len(monitors))
+        try:
+            await monitor.monitor()
+        except Exception as e:
+            logger.error(f"Monitor stopped: {e!r}")
+
+    await asyncio.gather(*(run(index, name, monitor) for index, (name, monitor) in enumerate(monitors.items())))
@@ -0,0 +1,208 @@
+"""
+Probe history store for the internet monitor
+Appends every probe result to memory-mapped fixed-record segment files and replays them offline.
+"""
+
+import os
+import json
+import glob
+import mmap
+import math
+import struct
+import logging
+from datetime import datetime
+
+from topology import responsible_groups
+
+logger = logging.getLogger('internet-monitor')
+
+MAGIC = b'IMPS'
+VERSION = 1
+# magic, version, record size, record count
+HEADER = struct.Struct('<4sHHQ')
+# timestamp, cycle id, round index, host id, success, RTT in ms (NaN when lost)
+RECORD = struct.Struct('<dIBHBf')
+
+
+class ProbeStore:
+    """Append-only probe history split into fixed-size, memory-mapped segments"""
+
+    def __init__(self, directory, segment_records=65536, retention_days=90):
+        self.directory = directory
+        self.segment_records = segment_records
+        self.retention_days = retention_days
+        os.makedirs(directory, exist_ok=True)
+
+        self.hosts_path = os.path.join(directory, 'hosts.json')
+        self.hosts = []
+        if os.path.exists(self.hosts_path):
+            with open(self.hosts_path) as f:
+                self.hosts = json.load(f)
+        self.host_ids = {host: index for index, host in enumerate(self.hosts)}
+
+        self.file = None
+        self.map = None
+        self.count = 0
+        self.capacity = 0
+
+    def segments(self):
+        """Segment files, oldest first"""
+        return sorted(glob.glob(os.path.join(self.directory, 'probes-*.bin')))
+
+    def _host_id(self, host):
+        """Stable numeric id for a host, persisted in hosts.json"""
+        if host not in self.host_ids:
+            self.host_ids[host] = len(self.hosts)
+            self.hosts.append(host)
+            with open(self.hosts_path + '.tmp', 'w') as f:
+                json.dump(self.hosts, f)
+            os.replace(self.hosts_path + '.tmp', self.hosts_path)
+        return self.host_ids[host]
+
+    def _open_segment(self, path, create):
+        """Map a segment file, preallocating it when new"""
+        size = HEADER.size + self.segment_records * RECORD.size
+        if create:
+            with open(path, 'wb') as f:
+                try:
+                    # Real blocks up front: writing a sparse map on a full disk is a SIGBUS, not an error
+                    os.posix_fallocate(f.fileno(), 0, size)
+                except OSError:
+                    os.remove(path)
+                    raise
+        self.file = open(path, 'r+b')
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        if create:
+            HEADER.pack_into(self.map, 0, MAGIC, VERSION, RECORD.size, 0)
+        _, _, _, self.count = HEADER.unpack_from(self.map, 0)
+        self.capacity = (len(self.map) - HEADER.size) // RECORD.size
+
+    def _rotate(self, timestamp):
+        """Close the full segment, start a new one and drop segments past retention"""
+        self.close()
+        # Names must stay unique and in order, even when a segment fills within its first second
+        start = int(timestamp)
+        segments = self.segments()
+        if segments:
+            start = max(start, _segment_start(segments[-1]) + 1)
+        self._open_segment(os.path.join(self.directory, f"probes-{start:010d}.bin"), create=True)
+
+        # A segment is expired once the segment after it starts before the cutoff
+        cutoff = timestamp - self.retention_days * 86400
+        segments = self.segments()
+        for older, newer in zip(segments, segments[1:]):
+            if _segment_start(newer) < cutoff:
+                os.remove(older)
+                logger.info(f"Removed expired probe history segment {os.path.basename(older)}")
+
+    def append(self, timestamp, cycle, round_index, host, success, rtt_ms):
+        """Append one probe result"""
+        if self.map is None:
+            segments = self.segments()
+            if segments:
+                self._open_segment(segments[-1], create=False)
+        if self.map is None or self.count >= self.capacity:
+            self._rotate(timestamp)
+
+        offset = HEADER.size + self.count * RECORD.size
+        RECORD.pack_into(
+            self.map, offset, timestamp, cycle & 0xFFFFFFFF, round_index, self._host_id(host),
+            1 if success else 0, rtt_ms if rtt_ms is not None else math.nan
+        )
+        self.count += 1
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, RECORD.size, self.count)
+
+    def records(self):
+        """Yield (timestamp, cycle, round, host, success, rtt_ms) for every stored probe, oldest first"""
+        for path in self.segments():
+            with open(path, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as segment:
+                    magic, _, record_size, count = HEADER.unpack_from(segment, 0)
+                    if magic != MAGIC or record_size != RECORD.size:
+                        logger.warning(f"Skipping unrecognised probe history segment {path}")
+                        continue
+                    data = segment[HEADER.size:HEADER.size + count * RECORD.size]
+            for timestamp, cycle, round_index, host_id, success, rtt_ms in RECORD.iter_unpack(data):
+                yield (timestamp, cycle, round_index, self.hosts[host_id], bool(success),
+                       None if math.isnan(rtt_ms) else rtt_ms)
+
+    def cycles(self):
+        """Group stored records into check cycles: (timestamp, {host: {round: success}})"""
+        current, timestamp, results = None, None, {}
+        for record_time, cycle, round_index, host, success, _ in self.records():
+            if cycle != current:
+                if current is not None:
+                    yield timestamp, results
+                current, timestamp, results = cycle, record_time, {}
+            results.setdefault(host, {})[round_index] = success
+        if current is not None:
+            yield timestamp, results
+
+    def close(self):
+        """Flush and unmap the current segment"""
+        if self.map is not None:
+            self.map.flush()
+            self.map.close()
+            self.file.close()
+            self.map = None
+            self.file = None
+
+
+def _segment_start(path):
+    """Timestamp of the first record in a segment, from its file name"""
+    return int(os.path.basename(path)[len('probes-'):-len('.bin')])
+
+
+def replay(store, groups, create_detector, hold_off_in_seconds):
+    """
+    Feed stored probe history through the outage detectors.
+
+    Uses the current topology and detection settings, so thresholds can be
+    tuned against recorded outages without waiting for real ones. Returns
+    the simulated restarts as (timestamp, group name) pairs.
+    """
+    for group in groups:
+        group.detector = create_detector()
+        group.failures = 0
+    hold_until = {}
+    restarts = []
+    cycles = 0
+
+    def held(group, timestamp):
+        return any(
+            hold_until.get(layer.plug_ip, 0) > timestamp
+            for layer in (group, *group.ancestors())
+        )
+
+    for timestamp, results in store.cycles():
+        cycles += 1
+        outages = []
+        for group in groups:
+            host_rounds = [results[host] for host in group.hosts if host in results]
+            if not host_rounds or held(group, timestamp):
+                continue
+            round_count = max(max(rounds) for rounds in host_rounds) + 1
+            rounds = [any(rounds.get(i, False) for rounds in host_rounds) for i in range(round_count)]
+            if group.detector.observe(rounds):
+                outages.append(group)
+            group.failures = 0 if any(rounds) else group.failures + 1
+
+        for group in responsible_groups(outages):
+            if group.plug_ip is None:
+                group.detector.reset()
+                continue
+            if hold_until.get(group.plug_ip, 0) > timestamp:
+                continue
+            hold_until[group.plug_ip] = timestamp + hold_off_in_seconds
+            restarts.append((timestamp, group.name))
+            for other in groups:
+                if other is group or group in other.ancestors():
+                    other.failures = 0
+                    other.detector.reset()
+
+    logger.info(f"📼 Replayed {cycles} check cycles from {store.directory}")
+    for timestamp, name in restarts:
+        logger.info(f"  {datetime.fromtimestamp(timestamp):%Y-%m-%d %H:%M:%S}: restart {name}")
+    logger.info(f"  {len(restarts)} simulated restarts")
+    return restarts
+
@@ -0,0 +1,50 @@
+"""
+Tests for the outage detectors.
+
+    python -m unittest discover -s resiliency/wifi-reboot/tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from detection import SprtDetector, ThresholdDetector
+
+
+class ThresholdDetectorTest(unittest.TestCase):
+
+    def test_consecutive_failed_cycles(self):
+        detector = ThresholdDetector(2)
+        self.assertFalse(detector.observe([False, False]))
+        self.assertFalse(detector.observe([False, True]))
+        self.assertFalse(detector.observe([False]))
+        self.assertTrue(detector.observe([False]))
+
+
+class SprtDetectorTest(unittest.TestCase):
+
+    def detector(self):
+        return SprtDetector(baseline_loss=0.05, outage_loss=0.9, confidence=0.999)
+
+    def test_lost_rounds_declare_outage(self):
+        detector = self.detector()
+        self.assertTrue(detector.observe([False] * 3))
+
+    def test_reply_after_crossing_ends_below_bound(self):
+        # Evidence crosses the bound mid-burst, the last round replied and brings it back under
+        detector = self.detector()
+        self.assertFalse(detector.observe([False, False, False, True]))
+        self.assertLess(detector.evidence, detector.bound)
+
+    def test_evidence_carries_across_cycles(self):
+        detector = self.detector()
+        self.assertFalse(detector.observe([False, False]))
+        self.assertTrue(detector.observe([False]))
+        detector.reset()
+        self.assertEqual(detector.evidence, 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+"""
+Tests for the path diagnosis verdicts and ISP hop tracing.
+
+    python -m unittest discover -s resiliency/wifi-reboot/tests
+"""
+
+import os
+import sys
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from diagnosis import LAYERS, LayerStatus, PathDiagnoser, modem_suspected, public_trace_target
+
+
+def _statuses(**ok):
+    return {layer: LayerStatus(layer, ok.get(layer)) for layer in LAYERS}
+
+
+class ModemSuspectedTest(unittest.TestCase):
+
+    def test_everything_past_the_gateway_down(self):
+        self.assertTrue(modem_suspected(_statuses(gateway=True, isp=False, dns=False, http=False)))
+
+    def test_working_upstream_stage_clears_modem(self):
+        self.assertFalse(modem_suspected(_statuses(gateway=True, isp=False, dns=True, http=False)))
+        self.assertFalse(modem_suspected(_statuses(gateway=False, isp=True), modem_is_gateway=True))
+
+    def test_dead_gateway(self):
+        statuses = _statuses(gateway=False, isp=None, dns=False, http=False)
+        # A separate router is to blame, unless the modem is the router
+        self.assertFalse(modem_suspected(statuses))
+        self.assertTrue(modem_suspected(statuses, modem_is_gateway=True))
+
+
+class TraceTargetTest(unittest.TestCase):
+
+    def test_first_public_host(self):
+        hosts = ['192.168.0.1', '10.0.0.1', 'example.com', '8.8.8.8', '1.1.1.1']
+        self.assertEqual(public_trace_target(hosts, '9.9.9.9'), '8.8.8.8')
+
+    def test_falls_back_without_public_host(self):
+        self.assertEqual(public_trace_target(['192.168.0.1'], '1.1.1.1'), '1.1.1.1')
+
+
+class IspHopDiscoveryTest(unittest.TestCase):
+
+    def test_failed_trace_is_not_repeated_every_cycle(self):
+        diagnoser = PathDiagnoser(prober=None, trace_target='1.1.1.1')
+        traces = []
+
+        async def no_hop():
+            traces.append(1)
+
+        diagnoser.discover_isp_hop = no_hop
+
+        async def cycles():
+            for _ in range(3):
+                self.assertEqual(await diagnoser._check_isp_hop(1), (None, "ISP hop unknown"))
+                await asyncio.sleep(0)
+
+        asyncio.run(cycles())
+        self.assertEqual(len(traces), 1)
+        self.assertGreater(diagnoser.next_discovery_at, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+Tests for the restart controller: the ineffective-restart streak, backoff
+and circuit breaker.
+
+    python -m unittest discover -s resiliency/wifi-reboot/tests
+"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from restarts import RestartController
+
+
+class RestartControllerTest(unittest.TestCase):
+
+    def controller(self):
+        # No backoff, so only the streak and the breaker decide
+        return RestartController(backoff_base_in_seconds=0, breaker_threshold=3, breaker_cooldown_in_seconds=3600)
+
+    def test_breaker_opens_after_ineffective_streak(self):
+        restarts = self.controller()
+        for _ in range(3):
+            self.assertEqual(restarts.allow('modem'), (True, None))
+            restarts.started('modem', 'public')
+        allowed, reason = restarts.allow('modem')
+        self.assertFalse(allowed)
+        self.assertIn('circuit breaker open', reason)
+        self.assertEqual(restarts.summary('modem')['consecutive_ineffective'], 3)
+
+    def test_other_group_on_plug_does_not_reset_streak(self):
+        # isp and public share the modem plug, the ISP hop keeps answering through an upstream outage
+        restarts = RestartController(breaker_threshold=3)
+        clock = [1000.0]
+        streaks = []
+        with mock.patch('restarts.time.time', lambda: clock[0]):
+            for _ in range(8):
+                if restarts.allow('modem')[0]:
+                    restarts.started('modem', 'public')
+                restarts.healthy('modem', 'isp')
+                streaks.append(restarts.summary('modem')['consecutive_ineffective'])
+                clock[0] += 200
+            self.assertFalse(restarts.allow('modem')[0])
+        self.assertEqual(streaks, sorted(streaks))
+        self.assertEqual(streaks[-1], 3)
+        self.assertTrue(restarts.summary('modem')['breaker_open'])
+
+    def test_restarted_group_passing_resets_streak(self):
+        restarts = self.controller()
+        for _ in range(3):
+            restarts.allow('modem')
+            restarts.started('modem', 'public')
+        restarts.allow('modem')
+        restarts.healthy('modem', 'public')
+        summary = restarts.summary('modem')
+        self.assertEqual(summary['consecutive_ineffective'], 0)
+        self.assertFalse(summary['breaker_open'])
+        self.assertEqual(restarts.allow('modem'), (True, None))
+
+    def test_recovery_in_window_resets_streak(self):
+        restarts = self.controller()
+        restarts.started('modem', 'public')
+        restarts.allow('modem')
+        restarts.started('modem', 'public')
+        restarts.recovered('modem', 'public', 30)
+        summary = restarts.summary('modem')
+        self.assertEqual(summary['consecutive_ineffective'], 0)
+        self.assertEqual(summary['effectiveness'], 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+Tests for the probe history store: segment rotation and reading records back.
+
+    python -m unittest discover -s resiliency/wifi-reboot/tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from store import ProbeStore, _segment_start
+
+
+class ProbeStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def store(self, **kwargs):
+        store = ProbeStore(self.directory, **kwargs)
+        self.addCleanup(store.close)
+        return store
+
+    def test_segments_filling_within_a_second(self):
+        store = self.store(segment_records=2)
+        for index in range(7):
+            store.append(1000.5, index, 0, 'host', True, 1.0)
+        segments = store.segments()
+        self.assertEqual([_segment_start(path) for path in segments], [1000, 1001, 1002, 1003])
+        self.assertEqual([record[1] for record in store.records()], list(range(7)))
+
+    def test_reopens_last_segment_after_restart(self):
+        store = self.store(segment_records=4)
+        store.append(1000.0, 1, 0, 'host', True, 1.0)
+        store.close()
+        store = self.store(segment_records=4)
+        store.append(1000.0, 2, 0, 'host', False, None)
+        self.assertEqual(len(store.segments()), 1)
+        self.assertEqual(list(store.records()), [
+            (1000.0, 1, 0, 'host', True, 1.0),
+            (1000.0, 2, 0, 'host', False, None),
+        ])
+
+    def test_segments_are_preallocated(self):
+        store = self.store(segment_records=1024)
+        store.append(1000.0, 1, 0, 'host', True, 1.0)
+        stat = os.stat(store.segments()[0])
+        self.assertGreaterEqual(stat.st_blocks * 512, stat.st_size)
+
+    def test_expired_segments_are_removed(self):
+        store = self.store(segment_records=1, retention_days=1)
+        store.append(1000.0, 1, 0, 'host', True, 1.0)
+        store.append(2000.0, 2, 0, 'host', True, 1.0)
+        store.append(1000.0 + 2 * 86400, 3, 0, 'host', True, 1.0)
+        self.assertEqual([record[1] for record in store.records()], [2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+Network topology for the internet monitor
+Maps probe groups (gateway, ISP hop, public hosts...) to the plugs powering the devices behind them.
+"""
+
+import json
+
+
+class ProbeGroup:
+    """A set of probe targets whose failure points at one powered device"""
+
+    def __init__(self, name, hosts, plug_ip=None, device=None, depends_on=None, label=None):
+        self.name = name
+        self.hosts = hosts
+        self.plug_ip = plug_ip
+        self.device = device or name
+        self.depends_on = depends_on
+        self.label = label or f"{name} ({self.device})"
+
+        # Runtime state, filled in by the monitor
+        self.parent = None
+        self.plug = None
+        self.detector = None
+        self.failures = 0
+        self.last_success_at = None
+        self.restart_triggered_at = None
+
+    def ancestors(self):
+        """Groups this one depends on, nearest first"""
+        group = self.parent
+        while group is not None:
+            yield group
+            group = group.parent
+
+
+def default_topology(test_hosts, plug_ip):
+    """Single group probing TEST_HOSTS and restarting the modem on PLUG_IP"""
+    return [ProbeGroup('internet', test_hosts, plug_ip, device='modem', label='Internet')]
+
+
+def load_topology(path):
+    """
+    Load probe groups from a JSON topology file.
+
+    Groups may name the group they sit behind with depends_on, e.g. an ISP
+    hop depends on the LAN gateway. When both fail only the nearest failing
+    layer is blamed, so a wedged router doesn't cause a modem restart.
+    """
+    with open(path) as f:
+        config = json.load(f)
+
+    groups = []
+    for entry in config['groups']:
+        hosts = entry['hosts']
+        if isinstance(hosts, str):
+            hosts = hosts.split(',')
+        groups.append(ProbeGroup(
+            entry['name'],
+            hosts,
+            plug_ip=entry.get('plug'),
+            device=entry.get('device'),
+            depends_on=entry.get('depends_on')
+        ))
+
+    by_name = {}
+    for group in groups:
+        if group.name in by_name:
+            raise ValueError(f"Duplicate probe group in {path}: {group.name}")
+        by_name[group.name] = group
+    for group in groups:
+        if group.depends_on is not None:
+            if group.depends_on not in by_name:
+                raise ValueError(f"Probe group {group.name} depends on unknown group {group.depends_on}")
+            group.parent = by_name[group.depends_on]
+    for group in groups:
+        seen = {group.name}
+        for ancestor in group.ancestors():
+            if ancestor.name in seen:
+                raise ValueError(f"Dependency cycle in {path} through probe group {group.name}")
+            seen.add(ancestor.name)
+    return groups
+
+
+def responsible_groups(outages):
+    """Groups in outage whose upstream layers are still answering"""
+    return [
+        group for group in outages
+        if not any(ancestor.failures > 0 for ancestor in group.ancestors())
+    ]
@@ -1,14 +1,29 @@
+import os
+import sys
 import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from kasa import Discover
+from inventory import KasaInventory, is_address
 
-async def test_control():
+async def test_control(plug):
     print("Testing with new API...")
     
-    # Use new API
-    device = await Discover.discover_single("192.168.0.38")
+    # Aliases and MACs are looked up in the inventory written by utils/discover.py
+    if not is_address(plug):
+        entry = KasaInventory(cache_file=".kasa-inventory.json").lookup(plug)
+        if entry is None:
+            print(f"{plug} is not in the inventory, run utils/discover.py first")
+            return
+        plug = entry["ip"]
+    
+    # Use new API, with the cloud credentials newer plugs require
+    device = await Discover.discover_single(
+        plug, username=os.getenv("KASA_USERNAME") or None, password=os.getenv("KASA_PASSWORD") or None
+    )
     await device.update()
     
-    print(f"Device: {device.alias} ({device.model})")
+    print(f"Device: {device.alias} ({device.model}) at {plug}")
     print(f"Currently: {'ON' if device.is_on else 'OFF'}")
     
     # Test control
@@ -22,5 +37,4 @@ async def test_control():
     print("Control test complete!")
 
 if __name__ == "__main__":
-    asyncio.run(test_control())
-
+    asyncio.run(test_control(sys.argv[1] if len(sys.argv) > 1 else "192.168.0.38"))
@@ -1,17 +1,27 @@
+import os
+import sys
 import asyncio
-from kasa import Discover
+import argparse
 
-HOME_NETWORK_DISCOVERY_IP = "192.168.0.255"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from inventory import KasaInventory
 
 async def main():
-    devices = await Discover.discover(
-        target=HOME_NETWORK_DISCOVERY_IP,
-        username="REDACTED_FOR_SECURITY",
-        password="REDACTED_FOR_SECURITY",
+    parser = argparse.ArgumentParser(description="Find Kasa devices and refresh the monitor's inventory cache")
+    parser.add_argument("subnets", nargs="*", default=["192.168.0.0/24"], help="Subnets (CIDR) or broadcast addresses to scan")
+    parser.add_argument("--cache", default=".kasa-inventory.json", help="Inventory cache file, empty to skip writing it")
+    parser.add_argument("--timeout", type=int, default=5, help="Seconds to wait for answers on each subnet")
+    args = parser.parse_args()
+    
+    inventory = KasaInventory(
+        cache_file=args.cache or None,
+        subnets=args.subnets,
+        timeout_in_seconds=args.timeout,
+        username=os.getenv("KASA_USERNAME") or None,
+        password=os.getenv("KASA_PASSWORD") or None,
     )
-    print([dev.model for dev in devices.values()])
+    for entry in await inventory.scan():
+        print(f"{entry['mac']}  {entry['ip']:<15}  {entry['model'] or '-':<12}  {entry['alias'] or '-'}")
     
 if __name__ == "__main__":
     asyncio.run(main())
-
-